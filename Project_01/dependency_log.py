@@ -0,0 +1,284 @@
+import os
+import struct
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+from debuggingbook.Slicer import DependencyTracker
+
+# a dependency log starts with this, followed by records, each starting with its tag:
+# STRING  the next id for a function or variable name: its length and UTF-8 bytes
+# NODE    a location where a variable was set: kind, variable, function and line
+# EDGE    a dependency of a NODE on an earlier one, both as variable, function and line
+MAGIC = b'DEPLOG1\n'
+STRING, NODE, EDGE = 0, 1, 2
+DATA, CONTROL = 0, 1
+KINDS = ('data', 'control')  # by DATA and CONTROL
+
+HEAD = struct.Struct('<BI')  # tag and string length
+NODE_RECORD = struct.Struct('<BBIII')
+EDGE_RECORD = struct.Struct('<BBIIIIII')
+
+# flush the buffered records whenever they get this large, or this many seconds old
+BUFFER_SIZE = 1 << 16
+FLUSH_INTERVAL = 1.0
+# the number of distinct records remembered to write each only once
+WRITTEN_SIZE = 1 << 16
+
+Node = Tuple[str, Tuple[str, int]]  # (variable, (function, line))
+
+# where an instrumented process logs its dependencies: the file named by DUMP_ENV or, if
+# DUMP_DIR_ENV names a directory, a file of its own there; else DEFAULT_DUMP
+DUMP_ENV = 'DEPENDENCY_DUMP'
+DUMP_DIR_ENV = 'DEPENDENCY_DUMP_DIR'
+DEFAULT_DUMP = 'dump'
+DUMP_PREFIX = 'dump-'
+
+
+def unique_dump_path(directory: Union[str, Path]) -> Path:
+    """A new log file in `directory` for this process."""
+    return Path(directory, f'{DUMP_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}')
+
+
+def dump_path(environ: Mapping[str, str] = os.environ) -> Path:
+    """The log file of this process, as configured in `environ`."""
+    if environ.get(DUMP_DIR_ENV):
+        return unique_dump_path(environ[DUMP_DIR_ENV])
+    return Path(environ.get(DUMP_ENV) or DEFAULT_DUMP)
+
+
+def dump_paths(directory: Union[str, Path]) -> List[Path]:
+    """The log files written to `directory`, one per process, in name order."""
+    return sorted(path for path in Path(directory).glob(DUMP_PREFIX + '*') if path.is_file())
+
+
+class CollectRunsMixin:
+    """Collect the runs logged to a directory, for a `StatisticalDebugger`."""
+
+    def collect_runs(self, directory: Union[str, Path], outcome: str) -> int:
+        """
+        Collect each run logged in `directory`, as by instrumented processes with
+        `DEPENDENCY_DUMP_DIR` set to it, as a run with the given `outcome`.
+        :return: the number of runs collected
+        """
+        paths = dump_paths(directory)
+        for path in paths:
+            with self.collect(outcome, path):
+                pass
+        return len(paths)
+
+    def collect_pass_runs(self, directory: Union[str, Path]) -> int:
+        return self.collect_runs(directory, self.PASS)
+
+    def collect_fail_runs(self, directory: Union[str, Path]) -> int:
+        return self.collect_runs(directory, self.FAIL)
+
+
+class DependencyLogWriter:
+    """
+    Append the dependencies of a run to a binary log at `path`, created with the writer.
+    Names are interned, and records are buffered: they are written once the buffer holds
+    `buffer_size` bytes, and with the first record `flush_interval` seconds after the last
+    write, so a process that dies loses only its most recent records. A record is written once among the last
+    `written_size` distinct ones; repeating one is harmless, as the log is read into sets.
+    Records without a line (e.g. of code not from a file) are skipped. A forked child starts a
+    log of its own next to its parent's, on its first record.
+    """
+
+    def __init__(self, path: Union[str, Path], buffer_size: int = BUFFER_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, written_size: int = WRITTEN_SIZE):
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.written_size = written_size
+        self.reset()
+        self.flush()
+        os.register_at_fork(after_in_child=self.forked)
+
+    def reset(self) -> None:
+        self.fp: Optional[BinaryIO] = None
+        self.started = False  # has the log been created?
+        self.buffer = bytearray(MAGIC)
+        self.flushed = time.monotonic()
+        self.ids: Dict[str, int] = {}
+        self.written: Set[Tuple[int, ...]] = set()
+
+    def forked(self) -> None:
+        if self.fp is not None:
+            self.fp.close()  # the parent's file object, closed in the child only
+        self.path = unique_dump_path(self.path.parent)
+        self.reset()
+
+    def move(self, path: Union[str, Path]) -> None:
+        """Log to `path` from now on, moving what was written so far."""
+        path = Path(path)
+        if self.started:
+            if self.fp is not None:
+                self.fp.close()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.path, path)
+            if self.fp is not None:
+                self.fp = open(path, 'ab')
+        self.path = path
+
+    def intern(self, name: str) -> int:
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.ids)
+            encoded = name.encode('utf-8', 'surrogatepass')
+            self.buffer += HEAD.pack(STRING, len(encoded))
+            self.buffer += encoded
+        return id
+
+    def is_new(self, record: Tuple[int, ...]) -> bool:
+        if record in self.written:
+            return False
+        if len(self.written) >= self.written_size:
+            self.written.clear()
+        self.written.add(record)
+        return True
+
+    def node(self, kind: int, name: str, func: str, line: Optional[int]
+             ) -> Optional[Tuple[int, int, int]]:
+        """Log a node; return its ids for `edge()`, or `None` if skipped for lack of a line."""
+        if line is None:
+            return None
+        ids = (self.intern(name), self.intern(func), line)
+        record = (kind,) + ids
+        if self.is_new(record):
+            self.buffer += NODE_RECORD.pack(NODE, *record)
+            self.flush_due()
+        return ids
+
+    def edge(self, kind: int, node: Optional[Tuple[int, int, int]], name: str, func: str,
+             line: Optional[int]) -> None:
+        if node is None or line is None:
+            return
+        record = (kind,) + node + (self.intern(name), self.intern(func), line)
+        if self.is_new(record):
+            self.buffer += EDGE_RECORD.pack(EDGE, *record)
+            self.flush_due()
+
+    def flush_due(self) -> None:
+        if (len(self.buffer) >= self.buffer_size or self.fp is None
+                or time.monotonic() - self.flushed >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.fp is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.fp = open(self.path, 'ab' if self.started else 'wb')
+            self.started = True
+        self.fp.write(self.buffer)
+        self.fp.flush()
+        self.buffer.clear()
+        self.flushed = time.monotonic()
+
+    def close(self) -> None:
+        """Write the buffered records and close the log; records logged later reopen it."""
+        if self.buffer or not self.started:
+            self.flush()
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+class LoggedEdges:
+    """The dependencies of a node, written to the log as they are added."""
+
+    def __init__(self, writer: DependencyLogWriter, kind: int,
+                 node: Optional[Tuple[int, int, int]]):
+        self.writer = writer
+        self.kind = kind
+        self.node = node
+
+    def add(self, dependency: Tuple[str, Tuple[Any, int]]) -> None:
+        name, (func, line) = dependency
+        self.writer.edge(self.kind, self.node, name, func.__name__, line)
+
+
+class LoggedDependencies(dict):
+    """Stands in for the dependencies of a `DependencyTracker`, which it only ever extends
+    through `setdefault()`: writes them to the log instead of keeping them."""
+
+    def __init__(self, writer: DependencyLogWriter, kind: int):
+        super().__init__()
+        self.writer = writer
+        self.kind = kind
+
+    def setdefault(self, key: Tuple[str, Tuple[Any, int]], default: Any = None) -> LoggedEdges:
+        name, (func, line) = key
+        node = self.writer.node(self.kind, name, func.__name__, line)
+        return LoggedEdges(self.writer, self.kind, node)
+
+
+class StreamingDependencyTracker(DependencyTracker):
+    """A `DependencyTracker` streaming its dependencies to `writer` as they are found."""
+
+    def __init__(self, writer: DependencyLogWriter, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        self.data_dependencies = LoggedDependencies(writer, DATA)
+        self.control_dependencies = LoggedDependencies(writer, CONTROL)
+
+
+def read_dependency_log(path: Union[str, Path], chunk_size: int = BUFFER_SIZE
+                        ) -> Iterator[Tuple[str, Node, Optional[Node]]]:
+    """
+    Yield the records of the log at `path` as (kind, node, dependency), with a dependency of
+    `None` for a node. The log is read in chunks; a truncated last record is ignored.
+    """
+    names = []
+    with open(path, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a dependency log')
+        buffer = b''
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            offset = 0
+            while offset < len(buffer):
+                tag = buffer[offset]
+                if tag == STRING:
+                    if offset + HEAD.size > len(buffer):
+                        break
+                    _, length = HEAD.unpack_from(buffer, offset)
+                    end = offset + HEAD.size + length
+                    if end > len(buffer):
+                        break
+                    names.append(buffer[offset + HEAD.size:end].decode('utf-8', 'surrogatepass'))
+                elif tag == NODE:
+                    end = offset + NODE_RECORD.size
+                    if end > len(buffer):
+                        break
+                    _, kind, name, func, line = NODE_RECORD.unpack_from(buffer, offset)
+                    yield KINDS[kind], (names[name], (names[func], line)), None
+                elif tag == EDGE:
+                    end = offset + EDGE_RECORD.size
+                    if end > len(buffer):
+                        break
+                    _, kind, name, func, line, d_name, d_func, d_line = \
+                        EDGE_RECORD.unpack_from(buffer, offset)
+                    yield (KINDS[kind], (names[name], (names[func], line)),
+                           (names[d_name], (names[d_func], d_line)))
+                else:
+                    raise ValueError(f'{path}: unknown record {tag}')
+                offset = end
+            buffer = buffer[offset:]
+
+
+def load_dependencies(path: Union[str, Path]) -> Dict[str, Set[Tuple[Node, Tuple[Node, ...]]]]:
+    """
+    The dependencies in the log at `path`, for each kind the set of
+    (node, the sorted nodes it depends on).
+    """
+    dependencies: Dict[str, Dict[Node, Set[Node]]] = {kind: {} for kind in KINDS}
+    for kind, node, dependency in read_dependency_log(path):
+        edges = dependencies[kind].setdefault(node, set())
+        if dependency is not None:
+            edges.add(dependency)
+    return {kind: {(node, tuple(sorted(edges))) for node, edges in nodes.items()}
+            for kind, nodes in dependencies.items()}
@@ -0,0 +1,187 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from dependency_log import (CONTROL, DATA, DEFAULT_DUMP, DUMP_DIR_ENV, DUMP_ENV, MAGIC,
+                            DependencyLogWriter, LoggedDependencies, dump_path, dump_paths,
+                            load_dependencies, read_dependency_log, unique_dump_path)
+
+
+def middle():
+    pass
+
+
+def helper():
+    pass
+
+
+class DependencyLogTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name, 'dump')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        writer = DependencyLogWriter(self.path, buffer_size=64)
+        data = LoggedDependencies(writer, DATA)
+        control = LoggedDependencies(writer, CONTROL)
+        edges = data.setdefault(('m', (middle, 5)), set())
+        edges.add(('x', (middle, 1)))
+        edges.add(('y', (helper, 2)))
+        edges.add(('x', (middle, 1)))
+        data.setdefault(('x', (middle, 1)), set())
+        control.setdefault(('<test>', (middle, 4)), set()).add(('<test>', (middle, 3)))
+        control.setdefault(('ünïcode', (helper, 7)), set())
+        writer.close()
+
+        self.assertEqual(load_dependencies(self.path), {
+            'data': {(('m', ('middle', 5)), (('x', ('middle', 1)), ('y', ('helper', 2)))),
+                     (('x', ('middle', 1)), ())},
+            'control': {(('<test>', ('middle', 4)), (('<test>', ('middle', 3)),)),
+                        (('ünïcode', ('helper', 7)), ())},
+        })
+        records = list(read_dependency_log(self.path, chunk_size=7))
+        self.assertEqual(len(records), 7)  # the repeated edge is written once
+        self.assertEqual(records[0], ('data', ('m', ('middle', 5)), None))
+
+    def test_truncated(self):
+        writer = DependencyLogWriter(self.path)
+        data = LoggedDependencies(writer, DATA)
+        data.setdefault(('a', (middle, 1)), set()).add(('b', (middle, 2)))
+        writer.close()
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(list(read_dependency_log(self.path)),
+                         [('data', ('a', ('middle', 1)), None)])
+
+    def test_created_eagerly(self):
+        writer = DependencyLogWriter(self.path)
+        self.assertEqual(self.path.read_bytes(), MAGIC)
+        self.assertEqual(load_dependencies(self.path), {'data': set(), 'control': set()})
+        writer.close()
+
+    def test_flush_interval(self):
+        writer = DependencyLogWriter(self.path, flush_interval=0)
+        data = LoggedDependencies(writer, DATA)
+        data.setdefault(('a', (middle, 1)), set())
+        self.assertEqual(list(read_dependency_log(self.path)),
+                         [('data', ('a', ('middle', 1)), None)])
+        writer.close()
+
+    def test_no_line(self):
+        writer = DependencyLogWriter(self.path)
+        data = LoggedDependencies(writer, DATA)
+        data.setdefault(('a', (middle, None)), set()).add(('b', (middle, 2)))
+        data.setdefault(('c', (middle, 3)), set()).add(('d', (middle, None)))
+        writer.close()
+        self.assertEqual(load_dependencies(self.path)['data'], {(('c', ('middle', 3)), ())})
+
+    def test_written_bounded(self):
+        writer = DependencyLogWriter(self.path, written_size=4)
+        data = LoggedDependencies(writer, DATA)
+        for line in range(10):
+            data.setdefault(('a', (middle, line)), set())
+            self.assertLessEqual(len(writer.written), 4)
+        writer.close()
+        self.assertEqual(len(load_dependencies(self.path)['data']), 10)
+
+    def test_close_idempotent(self):
+        writer = DependencyLogWriter(self.path)
+        LoggedDependencies(writer, DATA).setdefault(('a', (middle, 1)), set())
+        writer.close()
+        writer.close()
+        LoggedDependencies(writer, DATA).setdefault(('b', (middle, 2)), set())
+        writer.close()
+        self.assertEqual({node for node, _ in load_dependencies(self.path)['data']},
+                         {('a', ('middle', 1)), ('b', ('middle', 2))})
+
+    def test_move(self):
+        writer = DependencyLogWriter(self.path)
+        LoggedDependencies(writer, DATA).setdefault(('a', (middle, 1)), set())
+        moved = Path(self.directory.name, 'run', 'dump')
+        writer.move(moved)
+        LoggedDependencies(writer, DATA).setdefault(('b', (middle, 2)), set())
+        writer.close()
+        self.assertFalse(self.path.exists())
+        self.assertEqual(len(load_dependencies(moved)['data']), 2)
+
+
+class DumpPathTests(unittest.TestCase):
+    # a run of an instrumented module: logs a dependency, after the statements in `before`
+    RUN = ('import lib\n'
+           '{before}\n'
+           'def middle():\n'
+           '    pass\n'
+           'lib._data.data_dependencies.setdefault((\'x\', (middle, 1)), set())\n')
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def run_logged(self, environ, before: str = '') -> None:
+        env = {key: value for key, value in os.environ.items()
+               if key not in (DUMP_ENV, DUMP_DIR_ENV)}
+        env.update(environ)
+        env['PYTHONPATH'] = os.pathsep.join([str(Path(__file__).parent.resolve()),
+                                             env.get('PYTHONPATH', '')])
+        subprocess.run([sys.executable, '-c', self.RUN.format(before=before)], cwd=self.root,
+                       env=env, check=True)
+
+    def test_environ(self):
+        self.assertEqual(dump_path({}), Path(DEFAULT_DUMP))
+        self.assertEqual(dump_path({DUMP_ENV: ''}), Path(DEFAULT_DUMP))
+        self.assertEqual(dump_path({DUMP_ENV: 'runs/1'}), Path('runs/1'))
+        path = dump_path({DUMP_ENV: 'runs/1', DUMP_DIR_ENV: 'runs'})
+        self.assertEqual(path.parent, Path('runs'))
+        self.assertTrue(path.name.startswith('dump-'))
+
+    def test_unique(self):
+        paths = {unique_dump_path(self.root) for _ in range(100)}
+        self.assertEqual(len(paths), 100)
+        self.assertTrue(all(str(os.getpid()) in path.name for path in paths))
+
+    def test_dump_paths(self):
+        for path in [unique_dump_path(self.root), unique_dump_path(self.root),
+                     self.root / 'dump', self.root / 'notes.txt']:
+            path.write_bytes(MAGIC)
+        (self.root / 'dump-dir').mkdir()
+        paths = dump_paths(self.root)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(paths, sorted(paths))
+
+    def test_default_dump(self):
+        self.run_logged({})
+        self.assertEqual(len(load_dependencies(self.root / 'dump')['data']), 1)
+
+    def test_dump_env(self):
+        self.run_logged({DUMP_ENV: 'runs/first'})
+        self.assertEqual(len(load_dependencies(self.root / 'runs' / 'first')['data']), 1)
+        self.assertFalse((self.root / 'dump').exists())
+
+    def test_file_per_run(self):
+        for _ in range(2):
+            self.run_logged({DUMP_DIR_ENV: str(self.root / 'runs')})
+        paths = dump_paths(self.root / 'runs')
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertEqual(len(load_dependencies(path)['data']), 1)
+
+    def test_dump_to(self):
+        self.run_logged({}, before='lib.dump_to("moved")')
+        self.assertFalse((self.root / 'dump').exists())
+        self.assertEqual(len(load_dependencies(self.root / 'moved')['data']), 1)
+
+        (self.root / 'runs').mkdir()
+        self.run_logged({}, before='lib.dump_to("runs")')
+        paths = dump_paths(self.root / 'runs')
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(len(load_dependencies(paths[0])['data']), 1)
@@ -1,7 +1,7 @@
 from debuggingbook.StatisticalDebugger import RankingDebugger
 
 from fault_localization import Instrumenter, FaultLocalization
-from slicer_statistical_debugging_tests import DebuggerTests
+from slicer_statistical_debugging_tests import CollectRunsTests, DebuggerTests
 
 
 class FaultLocalizationTests(DebuggerTests):
@@ -27,3 +27,12 @@ class FaultLocalizationTests(DebuggerTests):
         debugger = self.bf_tester()
         self.assertIn(('parse', 14), debugger.rank()[:5])
         self.assertIn(('parse', 15), debugger.rank()[:5])
+
+
+class FaultLocalizationCollectRunsTests(CollectRunsTests):
+
+    def get_debugger(self) -> RankingDebugger:
+        return FaultLocalization(Instrumenter())
+
+    def event(self, line: int):
+        return 'middle', line
@@ -0,0 +1,571 @@
+import ast
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from debuggingbook import Slicer
+
+# the passes of the dependency-tracking instrumentation, in the order they are applied
+TRANSFORMERS = [
+    Slicer.TrackCallTransformer,
+    Slicer.TrackSetTransformer,
+    Slicer.TrackGetTransformer,
+    Slicer.TrackControlTransformer,
+    Slicer.TrackReturnTransformer,
+    Slicer.TrackParamsTransformer,
+]
+
+# files with these prefixes are copied, but not instrumented
+NOT_INSTRUMENTED = ('test_', 'lib', '__')
+
+# records what was written to a destination directory, so that later runs can skip it
+MANIFEST = '.instrumentation.json'
+
+
+# expressions whose source never starts with a name
+NOT_NAMES = (ast.Constant, ast.List, ast.Dict, ast.Set, ast.ListComp, ast.SetComp, ast.DictComp,
+             ast.GeneratorExp, ast.JoinedStr, ast.Lambda, ast.UnaryOp, ast.Await, ast.Yield,
+             ast.YieldFrom)
+
+# fused rewrites remember the node they replaced here, to see their input as the passes would
+ORIGINAL = 'fused_original'
+
+
+class FusedTrackTransformer(ast.NodeTransformer):
+    """
+    The passes of `TRANSFORMERS` in a single traversal, with the same result.
+    Each node is rewritten after its children, applying the rewrites of the passes in order.
+    Later passes see what earlier ones produced, and earlier ones see the tree before later
+    ones ran: so the names loaded by new `_data.set()` calls are wrapped into `_data.get()`,
+    while call and assignment rewrites look through `_data.get()` calls, comprehension
+    iterators and yielded values made by later passes, as recorded in their `ORIGINAL`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Slicer.TrackCallTransformer()
+        self.internal: Dict[str, bool] = {}  # `Slicer.is_internal()` lists modules per call
+        self.function_name: Optional[str] = None
+        self.returned = False  # inside a returned or yielded value, not rewritten by the pass
+
+    @staticmethod
+    def mark(new_node: ast.AST, original: ast.AST) -> ast.AST:
+        setattr(new_node, ORIGINAL, original)
+        return new_node
+
+    @classmethod
+    def before(cls, tree: ast.AST) -> ast.AST:
+        """`tree` without the rewrites of the get, control and return passes; only the nodes
+        above rewritten ones are copied."""
+        original = getattr(tree, ORIGINAL, None)
+        if original is not None:
+            return cls.before(original)
+
+        fields = {}
+        changed = False
+        for name, value in ast.iter_fields(tree):
+            if isinstance(value, ast.AST):
+                fields[name] = cls.before(value)
+                changed = changed or fields[name] is not value
+            elif isinstance(value, list):
+                fields[name] = [cls.before(v) if isinstance(v, ast.AST) else v for v in value]
+                changed = changed or any(n is not v for n, v in zip(fields[name], value))
+            else:
+                fields[name] = value
+        return type(tree)(**fields) if changed else tree
+
+    @staticmethod
+    def leading(node: ast.expr, before: bool = False) -> Optional[str]:
+        """
+        How `ast.unparse(node)` starts, up to its first operand or argument: '' if not with a
+        name, `None` if it takes unparsing to know.
+        :param before: as `node` was before the get, control and return passes
+        """
+        parts = []
+        atom = False  # in an attribute, subscript or call, which parenthesize other operands
+        while True:
+            original = getattr(node, ORIGINAL, None) if before else None
+            if original is not None:
+                node = original
+            elif isinstance(node, ast.Name):
+                parts.append(node.id)
+                return ''.join(reversed(parts))
+            elif isinstance(node, ast.Attribute):
+                parts.append('.' + node.attr)
+                node, atom = node.value, True
+            elif isinstance(node, ast.Subscript):
+                parts.append('[')
+                node, atom = node.value, True
+            elif isinstance(node, ast.Call):
+                parts.append('(')
+                node, atom = node.func, True
+            elif atom or isinstance(node, NOT_NAMES):
+                return ''
+            elif isinstance(node, (ast.BinOp, ast.Compare, ast.BoolOp)):
+                left = node.values[0] if isinstance(node, ast.BoolOp) else node.left
+                if not isinstance(left, (ast.Name, ast.Attribute, ast.Subscript, ast.Call)):
+                    return None  # depends on the precedence of the operators
+                parts.append(' ')
+                node = left
+            else:
+                return None
+
+    def starts_with(self, node: ast.expr, prefix: str, before: bool = False) -> bool:
+        """`ast.unparse(node).startswith(prefix)` for a `prefix` starting with a name, which
+        only unparses `node` if its leading operand does not tell."""
+        known = self.leading(node, before)
+        if known == '':
+            return False
+        if known is not None and (len(known) >= len(prefix) or not prefix.startswith(known)):
+            return known.startswith(prefix)
+        return ast.unparse(self.before(node) if before else node).startswith(prefix)
+
+    # TrackGetTransformer
+    def get(self, node: ast.Name) -> ast.expr:
+        if not isinstance(node.ctx, ast.Load) or node.id == Slicer.DATA_TRACKER:
+            return node
+        internal = self.internal.get(node.id)
+        if internal is None:
+            internal = self.internal[node.id] = Slicer.is_internal(node.id)
+        if internal:
+            return node
+
+        new_node = Slicer.make_get_data(node.id)
+        ast.copy_location(new_node, node)
+        return self.mark(new_node, node)
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        return self.get(node)
+
+    # TrackCallTransformer
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        self.generic_visit(node)
+        if self.starts_with(node, Slicer.DATA_TRACKER + '.', before=True):
+            return node  # Already applied or own function
+
+        node.args = [self.calls.make_call(arg, 'arg', pos=n + 1)
+                     for n, arg in enumerate(node.args)]
+        for kw in node.keywords:
+            kw.value = self.calls.make_call(kw.value, 'arg', kw=kw.arg)
+        node.func = self.calls.make_call(node.func, 'call')
+        return self.calls.make_call(node, 'ret')
+
+    # TrackSetTransformer
+    def set_data(self, value: ast.expr, target: ast.expr) -> ast.expr:
+        target = self.before(target)
+        loads = Slicer.load_names(target)
+        for store_name in Slicer.store_names(target):
+            value = self.track_loads(Slicer.make_set_data(store_name, value, loads=loads))
+            loads = set()
+        return value
+
+    def track_loads(self, set_data: ast.Call) -> ast.Call:
+        """Track the names in the `loads` of a new `_data.set()` call, as the get pass does."""
+        for keyword in set_data.keywords:
+            keyword.value.elts = [self.get(name) for name in keyword.value.elts]
+        return set_data
+
+    def visit_Assign(self, node: ast.Assign) -> ast.Assign:
+        self.generic_visit(node)
+        if self.starts_with(node.value, Slicer.DATA_TRACKER + '.set'):
+            return node  # Do not apply twice
+
+        for target in node.targets:
+            node.value = self.set_data(node.value, target)
+        return node
+
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> ast.AnnAssign:
+        self.generic_visit(node)
+        if node.value is None or \
+                self.starts_with(node.value, Slicer.DATA_TRACKER + '.set'):
+            return node
+
+        node.value = self.set_data(node.value, node.target)
+        return node
+
+    def visit_AugAssign(self, node: ast.AugAssign) -> ast.AugAssign:
+        self.generic_visit(node)
+        if self.starts_with(node.value, Slicer.DATA_TRACKER, before=True):
+            return node  # Do not apply twice
+
+        name = Slicer.leftmost_name(self.before(node.target))
+        node.value = Slicer.make_set_data(name, node.value, method='augment')
+        return node
+
+    def visit_Assert(self, node: ast.Assert) -> ast.Assert:
+        self.generic_visit(node)
+        if self.starts_with(node.test, Slicer.DATA_TRACKER + '.set'):
+            return node  # Do not apply twice
+
+        loads = Slicer.load_names(self.before(node.test))
+        node.test = self.track_loads(Slicer.make_set_data('<assertion>', node.test, loads=loads))
+        return node
+
+    # TrackControlTransformer
+    def make_test(self, test: ast.expr) -> ast.expr:
+        """`_data.test(test)`, as `TrackControlTransformer.make_test()`."""
+        if self.starts_with(test, Slicer.DATA_TRACKER + '.test'):
+            return test  # Do not apply twice
+
+        new_test = ast.Call(func=ast.Attribute(value=ast.Name(id=Slicer.DATA_TRACKER,
+                                                              ctx=ast.Load()),
+                                               attr='test', ctx=ast.Load()),
+                            args=[test], keywords=[])
+        ast.copy_location(new_test, test)
+        return new_test
+
+    def make_with(self, block: List[ast.stmt]) -> List[ast.stmt]:
+        """`with _data: block`, as `TrackControlTransformer.make_with()`, without unparsing
+        all of `block[0]`: whether it starts with 'with _data' depends on its first context."""
+        if not block:
+            return []
+        first = block[0]
+        if isinstance(first, ast.With) and \
+                self.starts_with(first.items[0].context_expr, Slicer.DATA_TRACKER):
+            return block  # Do not apply twice
+
+        new_node = ast.With(items=[ast.withitem(context_expr=ast.Name(id=Slicer.DATA_TRACKER,
+                                                                      ctx=ast.Load()),
+                                                optional_vars=None)],
+                            body=block)
+        ast.copy_location(new_node, first)
+        return [new_node]
+
+    def visit_If(self, node: Union[ast.If, ast.While]) -> ast.stmt:
+        self.generic_visit(node)
+        node.test = self.make_test(node.test)
+        node.body = self.make_with(node.body)
+        node.orelse = self.make_with(node.orelse)
+        return node
+
+    visit_While = visit_If
+
+    def visit_For(self, node: Union[ast.For, ast.AsyncFor, ast.comprehension]) -> ast.AST:
+        self.generic_visit(node)
+        iterator = node.iter
+        node.iter = self.mark(Slicer.make_set_data(ast.unparse(node.target).strip(), iterator),
+                              iterator)
+        return node
+
+    visit_AsyncFor = visit_comprehension = visit_For
+
+    # TrackReturnTransformer and TrackParamsTransformer
+    def visit_FunctionDef(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> ast.stmt:
+        outer_name = self.function_name
+        self.function_name = node.name
+        self.generic_visit(node)
+        self.function_name = outer_name
+
+        if isinstance(node, ast.FunctionDef):
+            named_args = [child for child in ast.iter_child_nodes(node.args)
+                          if isinstance(child, ast.arg)]
+            create_stmts = []
+            for n, child in enumerate(named_args):
+                keywords = [ast.keyword(arg='pos', value=ast.Constant(n + 1))]
+                if child is node.args.vararg:
+                    keywords.append(ast.keyword(arg='vararg', value=ast.Constant('*')))
+                if child is node.args.kwarg:
+                    keywords.append(ast.keyword(arg='vararg', value=ast.Constant('**')))
+                if n == len(named_args) - 1:
+                    keywords.append(ast.keyword(arg='last', value=ast.Constant(True)))
+                create_stmt = ast.Expr(value=ast.Call(
+                    func=ast.Attribute(value=ast.Name(id=Slicer.DATA_TRACKER, ctx=ast.Load()),
+                                       attr='param', ctx=ast.Load()),
+                    args=[ast.Constant(child.arg), ast.Name(id=child.arg, ctx=ast.Load())],
+                    keywords=keywords))
+                ast.copy_location(create_stmt, node)
+                create_stmts.append(create_stmt)
+            node.body = create_stmts + node.body
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Return(self, node: Union[ast.Return, ast.Yield, ast.YieldFrom]) -> ast.AST:
+        # the pass does not descend into the value
+        returned, self.returned = self.returned, True
+        self.generic_visit(node)
+        self.returned = returned
+        if returned or node.value is None or \
+                self.starts_with(node.value, Slicer.DATA_TRACKER + '.set'):
+            return node
+
+        tp = 'return' if isinstance(node, ast.Return) else 'yield'
+        name = f'<{tp} value>' if self.function_name is None \
+            else f'<{self.function_name}() {tp} value>'
+        value = node.value
+        node.value = self.mark(Slicer.make_set_data(name, value), value)
+        return node
+
+    visit_Yield = visit_YieldFrom = visit_Return
+
+
+def instrument_tree(tree: ast.Module, fused: bool = True) -> ast.Module:
+    """Apply the instrumentation to `tree`, in one traversal if `fused`, else pass by pass."""
+    if fused:
+        return FusedTrackTransformer().visit(tree)
+    for transformer in TRANSFORMERS:
+        transformer().visit(tree)
+    return tree
+
+
+def instrument_source(source: str, header: str, filename: str = '<unknown>',
+                      fused: bool = True) -> str:
+    """
+    Apply the instrumentation passes to a module.
+    :param source:   the source code of the module
+    :param header:   the line importing the tracker, prepended to the instrumented code
+    :param filename: the file name shown in syntax errors
+    :param fused:    whether to apply the passes in a single traversal
+    :return:         the instrumented source code
+    """
+    tree = instrument_tree(ast.parse(source, filename), fused)
+    return header + '\n' + ast.unparse(tree)
+
+
+def instrument_job(source_path: str, header: str) -> str:
+    with open(source_path, 'r') as fp:
+        return instrument_source(fp.read(), header, source_path)
+
+
+class FileSelector:
+    """
+    Select the files of a source directory while walking it. Paths are matched relative to
+    the source directory, as POSIX paths; each file that is not instrumented is counted in
+    `skipped` by the reason why:
+    - 'ignored':  matches a glob pattern of `ignore`, or lies in a directory that does.
+                  Such directories are pruned from the walk, so nothing in them is copied,
+                  parsed or instrumented; they are counted as 'ignored directories'.
+    - 'excluded': is one of the `excluded_paths` or below one; copied, since the tests run
+                  from the destination, but neither read nor instrumented.
+    - 'prefix':   has a name starting with one of `prefixes`; copied, but not instrumented.
+    - 'not python', 'instrumented': not a module or already instrumented; copied.
+    """
+
+    def __init__(self, source_directory: Path, excluded_paths: Iterable[Path] = (),
+                 ignore: Iterable[str] = (), prefixes: Tuple[str, ...] = NOT_INSTRUMENTED):
+        """
+        :param source_directory: the directory to walk
+        :param excluded_paths:   files and directories to copy without instrumenting them,
+                                 relative to the working directory or the source directory
+        :param ignore:           glob patterns of files and directories to skip altogether,
+                                 matching their path or, without a '/', their name
+        :param prefixes:         name prefixes of files to copy without instrumenting them
+        """
+        self.source_directory = source_directory
+        self.excluded = {self.relative(path) for path in excluded_paths}
+        self.ignore = list(ignore)
+        self.prefixes = prefixes
+        self.skipped: Counter = Counter()
+
+    def relative(self, path: Path) -> str:
+        source = self.source_directory.resolve()
+        resolved = Path(path).resolve()
+        if resolved == source or source in resolved.parents:
+            return resolved.relative_to(source).as_posix()
+        return Path(path).as_posix()
+
+    def is_ignored(self, relative: str) -> bool:
+        name = relative.rsplit('/', 1)[-1]
+        return any(fnmatch.fnmatchcase(relative if '/' in pattern else name, pattern.strip('/'))
+                   for pattern in self.ignore)
+
+    def is_excluded(self, relative: str) -> bool:
+        parts = relative.split('/')
+        return any('/'.join(parts[:n]) in self.excluded for n in range(1, len(parts) + 1))
+
+    def walk(self, dest_directory: Path) -> Iterable[Tuple[Path, Path, Optional[str]]]:
+        """
+        Yield (path, path relative to the source directory, reason) for each file to write,
+        in name order; the reason why it is not instrumented, `None` if it may be.
+        """
+        dest = dest_directory.resolve()
+        for directory, sub_directories, files in os.walk(self.source_directory):
+            logging.info(f'Current dir: {directory}')
+            kept = []
+            for d in sorted(sub_directories):
+                path = Path(directory, d)
+                if path.resolve() == dest:  # never descend into the output
+                    continue
+                if self.is_ignored(path.relative_to(self.source_directory).as_posix()):
+                    self.skipped['ignored directories'] += 1
+                    continue
+                kept.append(d)
+            sub_directories[:] = kept
+
+            for file in sorted(files):
+                path = Path(directory, file)
+                relative = path.relative_to(self.source_directory)
+                key = relative.as_posix()
+                if self.is_ignored(key):
+                    self.skipped['ignored'] += 1
+                elif relative.suffix != '.py':
+                    yield path, relative, 'not python'
+                elif self.is_excluded(key):
+                    yield path, relative, 'excluded'
+                elif file.startswith(self.prefixes):
+                    yield path, relative, 'prefix'
+                else:
+                    yield path, relative, None
+
+
+class InstrumentationPipeline:
+    """
+    Mirror a source directory into a destination directory, instrumenting its Python modules.
+    The pipeline is incremental: each module to instrument is hashed, each file to copy is
+    compared by modification time and size, and files whose output in the destination is still
+    current are neither copied nor instrumented again. Modules are
+    instrumented in a process pool, and every output file is written once.
+    """
+
+    def __init__(self, lib_path: Path, header: str, workers: Optional[int] = None,
+                 runtime_paths: Iterable[Path] = (Path(__file__).parent / 'dependency_log.py',)):
+        """
+        :param lib_path:      the tracker module, copied into the root of the destination
+        :param header:        the line importing the tracker in instrumented modules
+        :param workers:       the size of the process pool, the number of CPUs if `None`
+        :param runtime_paths: the modules the tracker imports, copied along with it
+        """
+        self.lib_path = lib_path
+        self.runtime_paths = list(runtime_paths)
+        self.header = header
+        self.workers = workers
+        self.stats: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def plan(self, selector: FileSelector, dest_directory: Path
+             ) -> List[Tuple[Path, Path, Optional[str]]]:
+        """The files to write, as (source path, path relative to the destination, the reason
+        why it is not instrumented or `None`)."""
+        jobs = [(path, Path(path.name), 'runtime')
+                for path in [self.lib_path] + self.runtime_paths]
+        jobs.extend(selector.walk(dest_directory))
+        return jobs
+
+    def digest(self, content: bytes) -> str:
+        """The digest of a module to instrument, whose output depends on its content and
+        the instrumentation."""
+        h = hashlib.sha256(content)
+        h.update(b'\0' + self.header.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def stat_digest(source: Path) -> str:
+        """The digest of a file to copy: its modification time and size."""
+        stat = source.stat()
+        return f'stat:{stat.st_mtime_ns}:{stat.st_size}'
+
+    @staticmethod
+    def read_manifest(dest_directory: Path) -> Dict[str, Dict]:
+        try:
+            with open(dest_directory / MANIFEST, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def is_current(entry: Optional[Dict], digest: str, output: Path) -> bool:
+        if entry is None or entry['digest'] != digest:
+            return False
+        try:
+            stat = output.stat()
+        except OSError:
+            return False
+        return [stat.st_mtime_ns, stat.st_size] == entry['output']
+
+    def run(self, source_directory: Path, dest_directory: Path,
+            excluded_paths: Iterable[Path] = (), ignore: Iterable[str] = ()) -> Dict[str, int]:
+        """
+        Bring `dest_directory` up to date with `source_directory`.
+        :param excluded_paths: files and directories copied, but not instrumented
+        :param ignore:         glob patterns of files and directories skipped altogether
+        :return: the number of files instrumented, copied, current and removed;
+                 the files not instrumented are counted by reason in `skipped`
+        """
+        selector = FileSelector(source_directory, excluded_paths, ignore)
+        dest_directory.mkdir(parents=True, exist_ok=True)
+        old_manifest = self.read_manifest(dest_directory)
+        manifest: Dict[str, Dict] = {}
+        stats = {'instrumented': 0, 'copied': 0, 'current': 0, 'removed': 0}
+        to_instrument: List[Tuple[Path, str, Path]] = []
+
+        for source, relative, reason in self.plan(selector, dest_directory):
+            if reason is None:
+                with open(source, 'rb') as fp:
+                    content = fp.read()
+                if content.startswith(self.header.encode()):
+                    reason = 'instrumented'
+            if reason not in (None, 'runtime'):
+                selector.skipped[reason] += 1
+            instrument = reason is None
+            # files only copied, such as excluded subtrees, are neither read nor hashed
+            digest = self.digest(content) if instrument else self.stat_digest(source)
+            key = relative.as_posix()
+            output = dest_directory / relative
+
+            if self.is_current(old_manifest.get(key), digest, output):
+                manifest[key] = old_manifest[key]
+                stats['current'] += 1
+            elif instrument:
+                to_instrument.append((source, key, output))
+                manifest[key] = {'digest': digest}
+            else:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(source, output)
+                manifest[key] = {'digest': digest}
+                stats['copied'] += 1
+
+        for key, output, text in self.instrument(to_instrument):
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with open(output, 'w') as fp:
+                fp.write(text)
+            stats['instrumented'] += 1
+
+        for key, entry in manifest.items():
+            if 'output' not in entry:
+                stat = (dest_directory / key).stat()
+                entry['output'] = [stat.st_mtime_ns, stat.st_size]
+
+        stats['removed'] = self.remove_stale(dest_directory, manifest)
+        with open(dest_directory / MANIFEST, 'w') as fp:
+            json.dump(manifest, fp)
+
+        logging.info(f'Instrumentation: {stats}')
+        logging.info(f'Skipped: {dict(selector.skipped)}')
+        self.stats = stats
+        self.skipped = dict(selector.skipped)
+        return stats
+
+    def instrument(self, jobs: List[Tuple[Path, str, Path]]):
+        """Yield (key, output path, instrumented source) for each job."""
+        if len(jobs) <= 1 or self.workers == 1:  # not worth starting a pool
+            for source, key, output in jobs:
+                yield key, output, instrument_job(str(source), self.header)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            texts = executor.map(instrument_job, [str(source) for source, _, _ in jobs],
+                                 [self.header] * len(jobs))
+            for (_, key, output), text in zip(jobs, texts):
+                yield key, output, text
+
+    @staticmethod
+    def remove_stale(dest_directory: Path, manifest: Dict[str, Dict]) -> int:
+        """Remove the files in `dest_directory` that are not outputs of this run."""
+        removed = 0
+        for directory, sub_directories, files in os.walk(dest_directory, topdown=False):
+            for file in files:
+                path = Path(directory, file)
+                key = path.relative_to(dest_directory).as_posix()
+                if key not in manifest and key != MANIFEST:
+                    path.unlink()
+                    removed += 1
+            if directory != str(dest_directory) and not os.listdir(directory):
+                os.rmdir(directory)
+        return removed
@@ -0,0 +1,150 @@
+"""
+Compare the instrumentation pass by pass (`TRANSFORMERS`) with the fused single traversal
+(`FusedTrackTransformer`): the number of traversals, nodes visited and the time per module,
+on the modules of `subjects/` and on a large synthetic module. Fails if the outputs differ.
+
+    python instrumentation_bench.py [--functions N] [--repeat N] [paths ...]
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from instrumentation import FusedTrackTransformer, NOT_INSTRUMENTED, TRANSFORMERS
+
+SUBJECTS = Path(__file__).parent / 'subjects'
+
+SYNTHETIC_FUNCTION = '''
+def function_{n}(xs, y=1, *args, scale=2, **kwargs):
+    total = 0
+    count: int = len(xs)
+    for i, x in enumerate(xs):
+        if x > y and not kwargs.get('skip'):
+            total += helper_{n}(x, scale=scale) * y
+        elif x < 0:
+            total -= abs(x)
+        else:
+            continue
+    while count > 0:
+        count -= 1
+        values = [v * scale for v in xs if v]
+        pairs = {{k: v for k, v in kwargs.items()}}
+        total, y = total + sum(values), len(pairs)
+    assert total >= 0 or args, 'negative total'
+    return total
+
+
+def helper_{n}(value, scale):
+    if value % 2 == 0:
+        return value // scale
+    return max(value, scale)
+
+
+def generate_{n}(limit):
+    for k in range(limit):
+        yield k * 2
+    yield from range(limit)
+
+
+class Accumulator_{n}:
+    def __init__(self, start):
+        self.total = start
+
+    def add(self, value):
+        self.total += function_{n}([value], 1)
+        return self
+'''
+
+
+def synthetic_module(functions: int) -> str:
+    return ''.join(SYNTHETIC_FUNCTION.format(n=n) for n in range(functions))
+
+
+def counting(transformer: type) -> type:
+    """A subclass of `transformer` counting the nodes it visits."""
+    def visit(self, node):
+        type(self).visits += 1
+        return transformer.visit(self, node)
+
+    return type(transformer.__name__, (transformer,), {'visit': visit, 'visits': 0})
+
+
+def instrument(source: str, transformers: List[type]) -> Tuple[str, int]:
+    """Instrument `source` with each of `transformers` in turn: the output and nodes visited."""
+    tree = ast.parse(source)
+    visits = 0
+    for transformer in transformers:
+        counted = counting(transformer)
+        counted().visit(tree)
+        visits += counted.visits
+    return ast.unparse(tree), visits
+
+
+def measure(source: str, transformers: List[type], repeat: int) -> float:
+    """The best time of `repeat` runs of `transformers` over `source`, without parsing and
+    unparsing, which take the same time either way."""
+    best = float('inf')
+    for _ in range(repeat):
+        tree = ast.parse(source)
+        start = time.perf_counter()
+        for transformer in transformers:
+            transformer().visit(tree)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(name: str, source: str, repeat: int) -> Dict[str, float]:
+    passes_output, passes_visits = instrument(source, TRANSFORMERS)
+    fused_output, fused_visits = instrument(source, [FusedTrackTransformer])
+    if passes_output != fused_output:
+        raise AssertionError(f'{name}: the fused instrumentation differs from the passes')
+
+    result = {'passes': len(TRANSFORMERS), 'passes_visits': passes_visits,
+              'passes_time': measure(source, TRANSFORMERS, repeat),
+              'fused': 1, 'fused_visits': fused_visits,
+              'fused_time': measure(source, [FusedTrackTransformer], repeat)}
+    print(f'{name:<44} {result["passes"]:>6} {result["passes_visits"]:>9} '
+          f'{result["passes_time"] * 1000:>10.2f} {result["fused"]:>6} '
+          f'{result["fused_visits"]:>9} {result["fused_time"] * 1000:>10.2f} '
+          f'{result["passes_time"] / result["fused_time"]:>7.2f}x')
+    return result
+
+
+def modules(paths: List[Path]) -> List[Path]:
+    """The modules below `paths` that the instrumenter rewrites."""
+    return sorted(path for root in paths for path in root.rglob('*.py')
+                  if not path.name.startswith(NOT_INSTRUMENTED))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', type=Path, default=[SUBJECTS],
+                        help='directories of modules to instrument (default: subjects/)')
+    parser.add_argument('--functions', type=int, default=200,
+                        help='the number of function groups in the synthetic module')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore', DeprecationWarning)  # ast.Num and ast.Str in the passes
+
+    print(f'{"module":<44} {"passes":>6} {"visits":>9} {"ms":>10} {"fused":>6} '
+          f'{"visits":>9} {"ms":>10} {"speedup":>8}')
+    results = [compare(os.path.relpath(path), path.read_text(), args.repeat)
+               for path in modules(args.paths)]
+    results.append(compare(f'<synthetic, {args.functions} functions>',
+                           synthetic_module(args.functions), args.repeat))
+
+    passes_time = sum(r['passes_time'] for r in results)
+    fused_time = sum(r['fused_time'] for r in results)
+    print(f'total: {sum(r["passes_visits"] for r in results)} nodes visited in '
+          f'{passes_time * 1000:.2f} ms by the passes, '
+          f'{sum(r["fused_visits"] for r in results)} in {fused_time * 1000:.2f} ms fused '
+          f'({passes_time / fused_time:.2f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import ast
+import json
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+from unittest import mock
+
+from instrumentation import (MANIFEST, FileSelector, InstrumentationPipeline, instrument_source,
+                             instrument_tree)
+
+HEADER = 'from lib import _data'
+LIB_PATH = Path(__file__).parent / 'lib.py'
+SUBJECTS = Path(__file__).parent / 'subjects'
+
+
+class InstrumentationPipelineTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = Path(self.directory.name, 'source')
+        self.dest = Path(self.directory.name, 'dest')
+        self.write('middle.py', 'def middle(x, y):\n    return x if x < y else y\n')
+        self.write('test_middle.py', 'from middle import middle\n')
+        self.write('language/parser.py', 'def parse(s):\n    return s.split()\n')
+        self.write('language/__init__.py', '')
+        self.write('README.md', 'middle\n')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, name: str, content: str) -> None:
+        path = self.source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def run_pipeline(self, header: str = HEADER, workers: int = 1):
+        pipeline = InstrumentationPipeline(LIB_PATH, header, workers=workers)
+        return pipeline.run(self.source, self.dest)
+
+    def outputs(self):
+        return {path.relative_to(self.dest).as_posix(): path.stat().st_mtime_ns
+                for path in self.dest.rglob('*') if path.is_file()}
+
+    def test_first_run(self):
+        stats = self.run_pipeline()
+        self.assertEqual(stats, {'instrumented': 2, 'copied': 5, 'current': 0, 'removed': 0})
+        self.assertEqual((self.dest / 'middle.py').read_text(),
+                         instrument_source((self.source / 'middle.py').read_text(), HEADER))
+        self.assertEqual((self.dest / 'test_middle.py').read_text(), 'from middle import middle\n')
+        self.assertTrue((self.dest / 'lib.py').exists())
+        self.assertTrue((self.dest / 'dependency_log.py').exists())
+        manifest = json.loads((self.dest / MANIFEST).read_text())
+        self.assertEqual(set(manifest), set(self.outputs()) - {MANIFEST})
+
+    def test_reuse(self):
+        self.run_pipeline()
+        before = self.outputs()
+        stats = self.run_pipeline()
+        self.assertEqual(stats, {'instrumented': 0, 'copied': 0, 'current': 7, 'removed': 0})
+        del before[MANIFEST]
+        after = self.outputs()
+        self.assertEqual({key: after[key] for key in before}, before)  # not written again
+
+    def test_rebuild_changed(self):
+        self.run_pipeline()
+        self.write('language/parser.py', 'def parse(s):\n    return s.split(",")\n')
+        self.write('README.md', 'middle and parse\n')
+        stats = self.run_pipeline()
+        self.assertEqual(stats, {'instrumented': 1, 'copied': 1, 'current': 5, 'removed': 0})
+        self.assertIn("_data.arg(',', pos=1)", (self.dest / 'language' / 'parser.py').read_text())
+        self.assertEqual((self.dest / 'README.md').read_text(), 'middle and parse\n')
+
+    def test_rebuild_edited_output(self):
+        self.run_pipeline()
+        (self.dest / 'middle.py').write_text('edited\n')
+        stats = self.run_pipeline()
+        self.assertEqual(stats['instrumented'], 1)
+        self.assertTrue((self.dest / 'middle.py').read_text().startswith(HEADER))
+
+    def test_rebuild_other_header(self):
+        self.run_pipeline()
+        stats = self.run_pipeline(header='from lib_fl import _data')
+        self.assertEqual((stats['instrumented'], stats['current']), (2, 5))
+        self.assertTrue((self.dest / 'middle.py').read_text().startswith('from lib_fl import'))
+
+    def test_remove_stale(self):
+        self.run_pipeline()
+        (self.source / 'language' / 'parser.py').unlink()
+        (self.source / 'language' / '__init__.py').unlink()
+        (self.dest / 'stray.txt').write_text('not an output\n')
+        stats = self.run_pipeline()
+        self.assertEqual(stats['removed'], 3)
+        self.assertFalse((self.dest / 'language').exists())
+        self.assertFalse((self.dest / 'stray.txt').exists())
+        self.assertTrue((self.dest / 'middle.py').exists())
+        self.assertNotIn('language/parser.py', json.loads((self.dest / MANIFEST).read_text()))
+
+    def test_process_pool(self):
+        self.run_pipeline(workers=2)
+        pooled = {key: (self.dest / key).read_text() for key in self.outputs() if key != MANIFEST}
+        self.directory.cleanup()
+        self.setUp()
+        self.run_pipeline(workers=1)
+        self.assertEqual({key: (self.dest / key).read_text() for key in pooled}, pooled)
+
+
+class FileSelectorTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = Path(self.directory.name, 'source')
+        for name in ['middle.py', 'test_middle.py', '__init__.py', 'notes.txt', 'build/out.py',
+                     'language/parser.py', 'language/lexer.py', 'language/data/table.py',
+                     'vendor/six.py', 'vendor/deep/more.py', 'scratch_1.py']:
+            path = self.source / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text('x = 1\n')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def walk(self, selector: FileSelector):
+        return {relative.as_posix(): reason
+                for _, relative, reason in selector.walk(Path(self.directory.name, 'dest'))}
+
+    def test_reasons(self):
+        selector = FileSelector(self.source)
+        files = self.walk(selector)
+        self.assertIsNone(files['middle.py'])
+        self.assertIsNone(files['language/data/table.py'])
+        self.assertEqual(files['test_middle.py'], 'prefix')
+        self.assertEqual(files['__init__.py'], 'prefix')
+        self.assertEqual(files['notes.txt'], 'not python')
+        self.assertEqual(len(files), 11)
+
+    def test_excluded(self):
+        selector = FileSelector(self.source, [self.source / 'language' / 'data',  # below the cwd
+                                              Path('vendor'),  # below the source
+                                              Path('middle.py')])
+        files = self.walk(selector)
+        self.assertEqual(files['language/data/table.py'], 'excluded')
+        self.assertEqual(files['vendor/six.py'], 'excluded')
+        self.assertEqual(files['vendor/deep/more.py'], 'excluded')
+        self.assertEqual(files['middle.py'], 'excluded')
+        self.assertIsNone(files['language/parser.py'])
+        self.assertEqual(files['test_middle.py'], 'prefix')  # prefixes are checked after
+
+    def test_ignore(self):
+        selector = FileSelector(self.source, ignore=['scratch_*', 'build/', 'language/lex*.py',
+                                                      '*.txt'])
+        files = self.walk(selector)
+        self.assertNotIn('scratch_1.py', files)
+        self.assertNotIn('build/out.py', files)
+        self.assertNotIn('language/lexer.py', files)
+        self.assertNotIn('notes.txt', files)
+        self.assertIsNone(files['language/parser.py'])
+        self.assertEqual(selector.skipped, {'ignored': 3, 'ignored directories': 1})
+
+    def test_ignore_by_name_below(self):
+        selector = FileSelector(self.source, ignore=['data', 'deep'])
+        files = self.walk(selector)
+        self.assertNotIn('language/data/table.py', files)
+        self.assertNotIn('vendor/deep/more.py', files)
+        self.assertEqual(selector.skipped, {'ignored directories': 2})
+
+    def test_prefixes(self):
+        files = self.walk(FileSelector(self.source, prefixes=('scratch_',)))
+        self.assertEqual(files['scratch_1.py'], 'prefix')
+        self.assertIsNone(files['test_middle.py'])
+
+    def test_never_enters_dest(self):
+        files = self.walk(FileSelector(self.source))
+        nested = {relative.as_posix() for _, relative, _ in
+                  FileSelector(self.source).walk(self.source / 'build')}
+        self.assertIn('build/out.py', files)
+        self.assertNotIn('build/out.py', nested)
+
+    def test_skip_counts(self):
+        pipeline = InstrumentationPipeline(LIB_PATH, HEADER, workers=1)
+        (self.source / 'language' / 'lexer.py').write_text(HEADER + '\nx = 1\n')
+        with mock.patch.object(pipeline, 'digest', wraps=pipeline.digest) as digest:
+            pipeline.run(self.source, Path(self.directory.name, 'dest'), [Path('vendor')],
+                         ['build'])
+        self.assertEqual(pipeline.skipped, {'excluded': 2, 'prefix': 2, 'not python': 1,
+                                            'instrumented': 1, 'ignored directories': 1})
+        self.assertEqual(pipeline.stats['instrumented'], 4)
+        # only the modules to instrument are hashed
+        self.assertEqual(digest.call_count, 4)
+
+
+# a module using every construct the instrumentation rewrites
+SYNTHETIC = '''
+import contextlib
+
+LIMIT: int = 10
+counter = 0
+
+
+def outer(xs, y=1, *args, scale=2, **kwargs):
+    total: int = 0
+    label: str
+    def inner(v, w=y):
+        nonlocal total
+        total += v * w
+        return total
+    for i, x in enumerate(xs):
+        if x > y and not kwargs.get('skip'):
+            inner(x)
+        elif x < 0:
+            total -= abs(x)
+        else:
+            continue
+    else:
+        total *= scale
+    while total > LIMIT:
+        total //= 2
+        if total == 3:
+            break
+    else:
+        total += 1
+    squares = [v * v for v in xs if v]
+    pairs = {k: v for k, v in kwargs.items()}
+    unique = {v % 3 for v in xs}
+    lazy = sum(v for v in xs)
+    first, (second, *rest) = xs[0], xs[1:]
+    xs[0] += first
+    assert total >= 0 or args, f'negative {total}'
+    with contextlib.suppress(ValueError) as suppressed, open(__file__) as fp:
+        label = fp.readline()
+    return total, squares, pairs, unique, lazy, second, rest, label, suppressed
+
+
+def generate(limit):
+    global counter
+    for k in range(limit):
+        counter += 1
+        received = yield k * 2
+        if received:
+            yield received
+    yield from range(limit)
+    return lambda z: z + limit
+
+
+async def fetch(source):
+    async with source as session:
+        async for item in session:
+            await item
+    return [item async for item in source]
+
+
+class Accumulator:
+    scale: float = 1.0
+
+    def __init__(self, start):
+        self.total = start
+        self.items = []
+
+    def add(self, value):
+        self.total += outer([value], 1)[0]
+        self.items[-1:] = [value]
+        return self
+'''
+
+
+class FusedTransformerTests(unittest.TestCase):
+
+    def assert_fused_same(self, source: str, name: str) -> None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)  # ast.Num and ast.Str in the passes
+            passes = ast.unparse(instrument_tree(ast.parse(source), fused=False))
+        fused = ast.unparse(instrument_tree(ast.parse(source), fused=True))
+        self.assertEqual(fused, passes, f'{name}: the fused instrumentation differs')
+
+    def test_subjects(self):
+        modules = sorted(SUBJECTS.rglob('*.py'))
+        self.assertTrue(modules)
+        for path in modules:
+            with self.subTest(path=path.relative_to(SUBJECTS).as_posix()):
+                self.assert_fused_same(path.read_text(), str(path))
+
+    def test_synthetic(self):
+        self.assert_fused_same(SYNTHETIC, '<synthetic>')
+
+    def test_instrumented(self):
+        self.assertNotEqual(ast.unparse(instrument_tree(ast.parse(SYNTHETIC))),
+                            ast.unparse(ast.parse(SYNTHETIC)))
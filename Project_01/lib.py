@@ -1,26 +1,23 @@
 import atexit
-import pickle
+from pathlib import Path
 
-from debuggingbook.Slicer import DependencyTracker
+from dependency_log import (DependencyLogWriter, StreamingDependencyTracker, dump_path,
+                            unique_dump_path)
 
-_data = DependencyTracker()
+# dependencies are appended to the log as the instrumented code runs,
+# see `dump_path()` for where it is written
+_writer = DependencyLogWriter(dump_path())
+_data = StreamingDependencyTracker(_writer)
+
+
+def dump_to(path: Path) -> None:
+    """Log the dependencies of this run to `path` or, if it is a directory, a new file in it."""
+    _writer.move(unique_dump_path(path) if Path(path).is_dir() else path)
 
 
 def dump_data():
-    data = dict()
-    data['data'] = set()
-    data['control'] = set()
-    for name, (func, line) in _data.dependencies().data:
-        data['data'].add(((name, (func.__name__, line)),
-                          tuple(sorted([(n, (f.__name__, l))
-                                        for n, (f, l) in _data.dependencies().data[(name, (func, line))]]))))
-    for name, (func, line) in _data.dependencies().control:
-        data['control'].add(((name, (func.__name__, line)),
-                             tuple(sorted([(n, (f.__name__, l))
-                                           for n, (f, l) in _data.dependencies().control[(name, (func, line))]]))))
-
-    with open('dump', 'wb') as fp:
-        pickle.dump(data, fp)
+    """Write the dependencies still buffered, completing the log."""
+    _writer.close()
 
 
 atexit.register(dump_data)
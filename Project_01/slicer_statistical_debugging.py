@@ -1,17 +1,14 @@
-import ast
 import logging
-import os
-import pickle
-import shutil
 from ast import NodeTransformer
-from os import walk
 from pathlib import Path
 from types import FrameType
-from typing import List, Any, Set, Dict, Tuple
+from typing import List, Any, Set, Dict, Tuple, Sequence
 
-from debuggingbook import Slicer
 from debuggingbook.StatisticalDebugger import ContinuousSpectrumDebugger, Collector, RankingDebugger
 
+from dependency_log import CollectRunsMixin, load_dependencies
+from instrumentation import InstrumentationPipeline
+
 DependencyDict = Dict[
     str,
     Set[
@@ -25,7 +22,8 @@ DependencyDict = Dict[
 
 class Instrumenter(NodeTransformer):
 
-    def instrument(self, source_directory: Path, dest_directory: Path, excluded_paths: List[Path], log=False) -> None:
+    def instrument(self, source_directory: Path, dest_directory: Path, excluded_paths: List[Path], log=False,
+                   *, ignore: Sequence[str] = ()) -> None:
         """
         TODO: implement this function, such that you get an input directory, instrument all python files that are
         TODO: in the source_directory whose prefix are not in excluded files and write them to the dest_directory.
@@ -34,6 +32,7 @@ class Instrumenter(NodeTransformer):
         :param dest_directory:   the output directory to which to write the instrumented files
         :param excluded_paths:   the excluded path that should be skipped in the instrumentation
         :param log:              whether to log or not
+        :param ignore:           glob patterns of files and directories that are neither copied nor instrumented
         :return:
         """
 
@@ -42,61 +41,9 @@ class Instrumenter(NodeTransformer):
 
         assert source_directory.is_dir()
 
-        if dest_directory.exists():
-            shutil.rmtree(dest_directory)
-        os.makedirs(dest_directory)
-        shutil.copy('lib.py', dest_directory / 'lib.py')
-
-        for directory, sub_directories, files in os.walk(source_directory):
-            # Iterates directory and its subdirectories in the form of (directory, [sub_directories], [files])
-            logging.info(f'Current dir: {directory}')
-            logging.info(f'Current sub_dirs: {sub_directories}')
-            logging.info(f'Current files: {files}')
-
-        for (dirpath, dirnames, filenames) in walk(source_directory):
-            if dirnames == []:
-                if filenames != []:
-                    for f in filenames:
-                        shutil.copy(dirpath + "\\\\" + f, dest_directory / f)
-            else:
-                for d in dirnames:
-                    shutil.copytree(dirpath + "\\" + d, dest_directory / d)
-                    if d not in dirnames:
-                        if filenames != []:
-                            for f in filenames:
-                                shutil.copy(dirpath + "\\\\" + f, dest_directory / d / f)
-                    else:
-                        if filenames != []:
-                            for f in filenames:
-                                shutil.copy(dirpath + "\\\\" + f, dest_directory / f)
-        files = []
-        for (dirpath, dirnames, filenames) in walk(dest_directory):
-            for file in filenames:
-                if file.startswith('test_') or file.startswith('lib') or file.startswith('__'):
-                    continue
-                else:
-                    files.append(dirpath + "\\" + file)
-        for f in files:
-            with open(f, 'r') as contents:
-                save = contents.read()
-            if save.startswith('from lib import _data'):
-                continue
-            else:
-                with open(f, 'w') as contents:
-                    call_tree = ast.parse(save)
-                    Slicer.TrackCallTransformer().visit(call_tree)
-                    Slicer.TrackSetTransformer().visit(call_tree)
-                    Slicer.TrackGetTransformer().visit(call_tree)
-                    Slicer.TrackControlTransformer().visit(call_tree)
-                    Slicer.TrackReturnTransformer().visit(call_tree)
-                    Slicer.TrackParamsTransformer().visit(call_tree)
-                    contents.write(ast.unparse(call_tree))
-                with open(f, 'r') as contents:
-                    updated = contents.read()
-                with open(f, 'w') as contents:
-                    contents.write('from lib import _data' + '\n')
-                with open(f, 'a') as contents:
-                    contents.write(updated)
+        pipeline = InstrumentationPipeline(Path('lib.py'), 'from lib import _data')
+        pipeline.run(source_directory, dest_directory, excluded_paths, ignore)
+
 
 class DependencyCollector(Collector):
 
@@ -113,9 +60,7 @@ class DependencyCollector(Collector):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        with open(self.dump_path, 'rb') as dump:
-            deps = pickle.load(dump)
-        self.collect(deps)
+        self.collect(load_dependencies(self.dump_path))
 
     def collect(self, dependencies: DependencyDict):
         """
@@ -171,7 +116,7 @@ class CoverageDependencyCollector(DependencyCollector):
                 acc.append(item)
         return acc
 
-class DependencyDebugger(ContinuousSpectrumDebugger, RankingDebugger):
+class DependencyDebugger(CollectRunsMixin, ContinuousSpectrumDebugger, RankingDebugger):
 
     def __init__(self, coverage=False, log: bool = False):
-        super().__init__(CoverageDependencyCollector if coverage else DependencyCollector, log)
\ No newline at end of file
+        super().__init__(CoverageDependencyCollector if coverage else DependencyCollector, log)
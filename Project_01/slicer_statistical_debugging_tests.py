@@ -2,11 +2,13 @@ import os.path
 import re
 import shutil
 import subprocess
+import tempfile
 import unittest
 from pathlib import Path
 
 from debuggingbook.StatisticalDebugger import RankingDebugger
 
+from dependency_log import DATA, DependencyLogWriter, LoggedDependencies, unique_dump_path
 from slicer_statistical_debugging import Instrumenter, DependencyDebugger
 
 
@@ -425,3 +427,45 @@ class DebuggerRankingTests(DebuggerTests):
         except AssertionError:
             self.assertIn(('interpret', 14), debugger.rank()[:2])
             self.assertIn(('interpret', 15), debugger.rank()[:2])
+
+
+def middle():
+    pass
+
+
+class CollectRunsTests(unittest.TestCase):
+    # the lines of `middle` with a dependency on the line before, by run
+    RUNS = {'pass': [[2, 3], [2, 4]], 'fail': [[2, 5]]}
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        for outcome, runs in self.RUNS.items():
+            (self.root / outcome).mkdir()
+            for lines in runs:
+                writer = DependencyLogWriter(unique_dump_path(self.root / outcome))
+                data = LoggedDependencies(writer, DATA)
+                for line in lines:
+                    data.setdefault(('x', (middle, line)), set()).add(('x', (middle, line - 1)))
+                writer.close()
+        (self.root / 'empty').mkdir()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def get_debugger(self) -> RankingDebugger:
+        return DependencyDebugger()
+
+    def event(self, line: int):
+        return ('x', ('middle', line)), (('x', ('middle', line - 1)),)
+
+    def test_collect_runs(self):
+        debugger = self.get_debugger()
+        self.assertEqual(debugger.collect_pass_runs(self.root / 'pass'), 2)
+        self.assertEqual(debugger.collect_fail_runs(self.root / 'fail'), 1)
+        self.assertEqual(debugger.collect_runs(self.root / 'empty', debugger.FAIL), 0)
+        self.assertEqual(len(debugger.collectors[debugger.PASS]), 2)
+        self.assertEqual(len(debugger.collectors[debugger.FAIL]), 1)
+        self.assertEqual(debugger.suspiciousness(self.event(5)), 1.0)
+        self.assertEqual(debugger.suspiciousness(self.event(3)), 0.0)
+        self.assertEqual(debugger.suspiciousness(self.event(2)), 0.5)
@@ -0,0 +1,136 @@
+"""Repair benchmark: repair each subject with each mutation operator order and `k`, on the
+hand-written suite and on generated suites of growing size, and emit the measurements as JSON.
+
+    python -m repair.benchmarks.bench [--sizes 10 100 1000] [--ks 5 10] [-o results.json]
+                                      [--events events.jsonl]
+"""
+import argparse
+import ast
+import inspect
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional
+
+from repair.benchmarks import (char_index, char_index_tests, list_sum, list_sum_tests,
+                               scan_integers, scan_integers_tests)
+from repair.benchmarks.generated import SUITES
+from repair.benchmarks.utils import get_negative_tests, get_positive_tests
+from repair.metrics import JsonLinesExporter, Metrics
+from repair.mutator import Break, Guard, Loosen, MutationOperator, Tighten
+from repair.repairer import Repairer
+
+# subject name -> (module, line to fix, hand-written tests)
+SUBJECTS = {
+    'char_index': (char_index, 9, char_index_tests),
+    'list_sum': (list_sum, 4, list_sum_tests),
+    'scan_integers': (scan_integers, 12, scan_integers_tests),
+}
+
+ORDERS: Dict[str, Callable[[], List[MutationOperator]]] = {
+    'default': lambda: [Tighten(), Loosen(), Break(True), Guard(), Break(False)],
+    'reversed': lambda: [Break(False), Guard(), Break(True), Loosen(), Tighten()],
+    'guard-first': lambda: [Guard(), Tighten(), Loosen(), Break(True), Break(False)],
+}
+
+def bench_one(subject: str, pos_tests: List[CodeType], neg_tests: List[CodeType],
+              order: str, k: int, exporter: JsonLinesExporter = None) -> Dict[str, Any]:
+    """Repair `subject` once for the wall time and the metrics, and once more under
+    `tracemalloc` for the peak memory, as tracing allocations slows the repair down."""
+    module, line_no, _ = SUBJECTS[subject]
+    tree = ast.parse(inspect.getsource(module))
+    metrics = Metrics(exporter, subject=subject, suite_size=len(pos_tests) + len(neg_tests),
+                      order=order, k=k)
+
+    start = time.perf_counter()
+    repairer = Repairer(tree, line_no, pos_tests, neg_tests, k=k, ops=ORDERS[order](),
+                        metrics=metrics)
+    repaired = repairer.repair()
+    wall_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        Repairer(ast.parse(inspect.getsource(module)), line_no, pos_tests, neg_tests, k=k,
+                 ops=ORDERS[order]()).repair()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repaired': repaired,
+        'valid': repaired and repairer.validate(),
+        'fix': ast.unparse(repairer.new_tree) if repaired else None,
+        'wall_time': wall_time,
+        'templates': metrics.counters['templates'],
+        'executions': metrics.counters['executions'],
+        'sat_calls': metrics.counters['sat_calls'],
+        'solver_candidates': metrics.counters['solver_candidates'],
+        'timings': metrics.timings,
+        'peak_memory': peak_memory,
+    }
+
+def run(subjects: List[str], sizes: List[Optional[int]], orders: List[str],
+        ks: List[int], exporter: JsonLinesExporter = None) -> List[Dict[str, Any]]:
+    """Run the benchmark. A size of `None` stands for the hand-written suite.
+    Repair events are passed to the `exporter` if given."""
+    results = []
+    for subject in subjects:
+        for size in sizes:
+            if size is None:
+                tests = SUBJECTS[subject][2]
+                pos_tests, neg_tests = get_positive_tests(tests), get_negative_tests(tests)
+            else:
+                pos_tests, neg_tests = SUITES[subject](size)
+
+            for order in orders:
+                for k in ks:
+                    result = {'subject': subject, 'suite_size': len(pos_tests) + len(neg_tests),
+                              'generated': size is not None, 'order': order, 'k': k}
+                    result.update(bench_one(subject, pos_tests, neg_tests, order, k, exporter))
+                    results.append(result)
+                    print(f"{subject:<15}{result['suite_size']:>6} {order:<12}k={k:<4}"
+                          f"{result['wall_time']:>9.3f}s", file=sys.stderr)
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', nargs='+', choices=list(SUBJECTS), default=list(SUBJECTS))
+    parser.add_argument('--sizes', nargs='*', type=int, default=[10, 100, 1000],
+                        help='sizes of generated suites (the hand-written suite always runs)')
+    parser.add_argument('--orders', nargs='+', choices=list(ORDERS), default=list(ORDERS))
+    parser.add_argument('--ks', nargs='+', type=int, default=[10])
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    parser.add_argument('--events', help='append repair events here as JSON lines')
+    args = parser.parse_args(argv)
+
+    exporter = JsonLinesExporter(args.events) if args.events else None
+    try:
+        runs = run(args.subjects, [None] + args.sizes, args.orders, args.ks, exporter)
+    finally:
+        if exporter is not None:
+            exporter.close()
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Generated test suites of any size for the benchmark subjects.
+Each generator returns `(positive, negative)` lists of test code objects, like
+`get_positive_tests` and `get_negative_tests` on the hand-written suites."""
+import random
+from types import CodeType
+from typing import Callable, Dict, List, Tuple
+
+Suite = Tuple[List[CodeType], List[CodeType]]
+
+def compile_tests(asserts: List[str]) -> List[CodeType]:
+    """Compile each assertion into the code object of a test function `test_<i>`."""
+    source = ''.join(f'def test_{i}():\n    {a}\n' for i, a in enumerate(asserts, 1))
+    env = {}
+    exec(compile(source, '<generated>', 'exec'), env)
+    return [env[f'test_{i}'].__code__ for i in range(1, len(asserts) + 1)]
+
+def split(size: int, negative_ratio: float) -> Tuple[int, int]:
+    neg = max(1, round(size * negative_ratio))
+    return size - neg, neg
+
+def char_index_suite(size: int, negative_ratio: float = 0.2, seed: int = 0) -> Suite:
+    rng = random.Random(seed)
+    pos, neg = split(size, negative_ratio)
+    alphabet = 'ABCDEF'
+
+    def expected(s: str, c: str):
+        for i, x in enumerate(s):
+            if x == c or x == '*':
+                return i
+        return None
+
+    pos_asserts = []
+    for _ in range(pos):
+        s = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        c = rng.choice(alphabet)
+        pos_asserts.append(f'assert char_index({s!r}, {c!r}) == {expected(s, c)!r}')
+
+    neg_asserts = []
+    for _ in range(neg):
+        c = rng.choice(alphabet)
+        prefix = ''.join(rng.choice(alphabet.replace(c, '')) for _ in range(rng.randint(0, 6)))
+        s = prefix + '*' + ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 6)))
+        neg_asserts.append(f'assert char_index({s!r}, {c!r}) == {expected(s, c)!r}')
+
+    return compile_tests(pos_asserts), compile_tests(neg_asserts)
+
+def list_sum_suite(size: int, negative_ratio: float = 0.2, seed: int = 0) -> Suite:
+    rng = random.Random(seed)
+    pos, neg = split(size, negative_ratio)
+
+    pos_asserts = []
+    for _ in range(pos):
+        xs = [rng.randint(-100, 100) for _ in range(rng.randint(0, 20))]
+        pos_asserts.append(f'assert list_sum({xs!r}) == {sum(xs)!r}')
+
+    neg_asserts = []
+    for _ in range(neg):
+        xs = [rng.randint(-100, 100) for _ in range(rng.randint(0, 20))]
+        for _ in range(rng.randint(1, 3)):
+            xs.insert(rng.randint(0, len(xs)), None)
+        total = sum(x for x in xs if x is not None)
+        neg_asserts.append(f'assert list_sum({xs!r}) == {total!r}')
+
+    return compile_tests(pos_asserts), compile_tests(neg_asserts)
+
+def scan_integers_suite(size: int, negative_ratio: float = 0.2, seed: int = 0) -> Suite:
+    rng = random.Random(seed)
+    pos, neg = split(size, negative_ratio)
+
+    def token() -> str:
+        return rng.choice([str(rng.randint(0, 999)), 'foo', ''])
+
+    def expected(seq: List[str]) -> List[int]:
+        scanned = []
+        for value in seq:
+            try:
+                int_value = int(value)
+            except ValueError:
+                continue
+            if int_value == -1:
+                break
+            scanned.append(int_value)
+        return scanned
+
+    pos_asserts = []
+    for _ in range(pos):
+        seq = [token() for _ in range(rng.randint(0, 12))]
+        pos_asserts.append(f'assert scan_integers({seq!r}) == {expected(seq)!r}')
+
+    neg_asserts = []
+    for _ in range(neg):
+        seq = [token() for _ in range(rng.randint(0, 12))]
+        seq.insert(rng.randint(0, len(seq)), '-1')
+        neg_asserts.append(f'assert scan_integers({seq!r}) == {expected(seq)!r}')
+
+    return compile_tests(pos_asserts), compile_tests(neg_asserts)
+
+SUITES: Dict[str, Callable[..., Suite]] = {
+    'char_index': char_index_suite,
+    'list_sum': list_sum_suite,
+    'scan_integers': scan_integers_suite,
+}
@@ -1,5 +1,14 @@
-from types import CodeType
-from typing import Callable, List
+import ast
+import hashlib
+import importlib.util
+import marshal
+import os
+import tempfile
+import weakref
+from types import CodeType, ModuleType
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+Test = Tuple[str, CodeType]  # ('+' for a passing test or '-' for a failing one, code)
 
 def all_test_functions(module) -> List[Callable]:
     ts = [getattr(module, m) for m in dir(module) if m.startswith('test_')]
@@ -8,8 +17,187 @@ def all_test_functions(module) -> List[Callable]:
         assert t.__doc__ in ['+', '-']
     return ts
 
+class StreamedTests:
+    """The tests of one sign in a stream of `Test`s, received while the stream is consumed:
+    iterating yields the tests received so far and then pulls more from the stream, so
+    `Repairer` and `Synthesizer` start on the first failing test before a large suite is fully
+    discovered. Tests of the other sign pulled on the way are kept for its `StreamedTests`.
+    `len`, indexing and `+` wait for the end of the stream."""
+    def __init__(self, pull: Callable[[], bool]) -> None:
+        self.received: List[CodeType] = []
+        self.pull = pull  # receive the next test of either sign, `False` at the end
+
+    @staticmethod
+    def split(tests: Iterable[Test]) -> Tuple['StreamedTests', 'StreamedTests']:
+        """The passing and the failing tests of `tests`."""
+        iterator = iter(tests)
+
+        def pull() -> bool:
+            test = next(iterator, None)
+            if test is None:
+                return False
+            sign, test_code = test
+            (passing if sign == '+' else failing).received.append(test_code)
+            return True
+
+        passing, failing = StreamedTests(pull), StreamedTests(pull)
+        return passing, failing
+
+    def __iter__(self) -> Iterator[CodeType]:
+        i = 0
+        while i < len(self.received) or self.pull():
+            if i < len(self.received):
+                yield self.received[i]
+                i += 1
+
+    def complete(self) -> List[CodeType]:
+        """All tests, once the stream has ended."""
+        while self.pull():
+            pass
+        return self.received
+
+    def __len__(self) -> int:
+        return len(self.complete())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[CodeType, List[CodeType]]:
+        return self.complete()[index]
+
+    def __add__(self, other: Iterable[CodeType]) -> List[CodeType]:
+        return self.complete() + list(other)
+
+    def __radd__(self, other: Iterable[CodeType]) -> List[CodeType]:
+        return list(other) + self.complete()
+
+class SuiteLoader:
+    """Discover the test functions `test_*`, marked passing or failing by a docstring `+` or `-`,
+    in a module, a source file or a directory of source files.
+    Tests of a file are cached by its modification time, in memory and, with a `cache_dir`,
+    on disk as marshalled code objects; source files are compiled but never imported."""
+    def __init__(self, cache_dir: str = None) -> None:
+        self.cache_dir = cache_dir
+        self.files: Dict[str, Tuple[int, int, List[Test]]] = {}
+        self.modules: 'weakref.WeakKeyDictionary[ModuleType, Tuple[int, List[Test]]]' = \
+            weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def stream(self, source: Union[ModuleType, str, os.PathLike]) -> Iterator[Test]:
+        """Yield the tests of `source` as they are discovered: the tests of a module in name
+        order, those of a directory file by file in name order, each in definition order."""
+        if isinstance(source, ModuleType):
+            yield from self.module_tests(source)
+            return
+
+        path = os.fspath(source)
+        if not os.path.isdir(path):
+            yield from self.file_tests(path)
+            return
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.py'):
+                yield from self.file_tests(os.path.join(path, name))
+
+    def split(self, source: Union[ModuleType, str, os.PathLike]
+              ) -> Tuple[StreamedTests, StreamedTests]:
+        """The passing and the failing tests of `source`, discovered as they are consumed."""
+        return StreamedTests.split(self.stream(source))
+
+    def load(self, source: Union[ModuleType, str, os.PathLike]
+             ) -> Tuple[List[CodeType], List[CodeType]]:
+        """The passing and the failing tests of `source`."""
+        pos_tests, neg_tests = [], []
+        for sign, test_code in self.stream(source):
+            (pos_tests if sign == '+' else neg_tests).append(test_code)
+        return pos_tests, neg_tests
+
+    def module_tests(self, module: ModuleType) -> List[Test]:
+        path = getattr(module, '__file__', None)
+        mtime = os.stat(path).st_mtime_ns if path else 0
+        entry = self.modules.get(module)
+        if entry is not None and entry[0] == mtime:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        tests = [(t.__doc__, t.__code__) for t in all_test_functions(module)]
+        self.modules[module] = (mtime, tests)
+        return tests
+
+    def file_tests(self, path: str) -> List[Test]:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry is None and self.cache_dir is not None:
+            entry = self.read_cache(path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        tests = self.compile_tests(path)
+        entry = (stat.st_mtime_ns, stat.st_size, tests)
+        self.files[path] = entry
+        if self.cache_dir is not None:
+            self.write_cache(path, entry)
+        return tests
+
+    @staticmethod
+    def compile_tests(path: str) -> List[Test]:
+        """Compile the source file at `path` and collect the code objects of its module-level
+        test functions, in definition order."""
+        with open(path, 'rb') as fp:
+            tree = ast.parse(fp.read(), filename=path)
+        signs = {}
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef) and node.name.startswith('test_'):
+                sign = ast.get_docstring(node)
+                assert sign in ['+', '-'], f'{path}: {node.name} is not marked + or -'
+                signs[node.name] = sign
+        if not signs:
+            return []
+
+        codes = {c.co_name: c for c in compile(tree, path, 'exec').co_consts
+                 if isinstance(c, CodeType)}
+        return [(sign, codes[name]) for name, sign in signs.items()]
+
+    def cache_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(path.encode()).hexdigest() + '.tests')
+
+    def read_cache(self, path: str) -> Optional[Tuple[int, int, List[Test]]]:
+        try:
+            with open(self.cache_path(path), 'rb') as fp:
+                magic, mtime, size, tests = marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if magic != importlib.util.MAGIC_NUMBER:  # bytecode of another Python version
+            return None
+        return mtime, size, list(map(tuple, tests))
+
+    def write_cache(self, path: str, entry: Tuple[int, int, List[Test]]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                marshal.dump((importlib.util.MAGIC_NUMBER,) + entry, fp)
+            os.replace(tmp, self.cache_path(path))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+LOADER = SuiteLoader()
+
+def stream_tests(source: Union[ModuleType, str, os.PathLike]) -> Iterator[Test]:
+    """Yield the tests of a module, a source file or a directory lazily, see `SuiteLoader`."""
+    return LOADER.stream(source)
+
+def streamed_tests(source: Union[ModuleType, str, os.PathLike]
+                   ) -> Tuple[StreamedTests, StreamedTests]:
+    """The passing and the failing tests of `source` for a `Repairer`, discovered while the
+    repair runs, see `StreamedTests`."""
+    return LOADER.split(source)
+
 def get_positive_tests(module) -> List[CodeType]:
-    return [t.__code__ for t in all_test_functions(module) if t.__doc__ == '+']
+    return [t for sign, t in LOADER.stream(module) if sign == '+']
 
 def get_negative_tests(module) -> List[CodeType]:
-    return [t.__code__ for t in all_test_functions(module) if t.__doc__ == '-']
+    return [t for sign, t in LOADER.stream(module) if sign == '-']
@@ -0,0 +1,65 @@
+import ast
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+from types import CodeType
+from typing import Any, List, Optional, Tuple
+
+class RepairCache:
+    """On-disk cache of repairs, addressed by a hash of everything a repair depends on:
+    the program tree, the tests' code objects and the repair parameters.
+    Each entry holds the repaired tree, the synthesized condition and the line of the fix."""
+    def __init__(self, directory: str = None) -> None:
+        if directory is None:
+            directory = os.environ.get('REPAIR_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'repair'))
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tree: ast.Module, passing_tests: List[CodeType], failing_tests: List[CodeType],
+            params: Any) -> str:
+        """Hash of `tree`, the tests and `params`, which must have a deterministic `repr`."""
+        h = hashlib.sha256()
+        h.update(repr(sys.version_info[:2]).encode())  # trees and bytecode differ by version
+        h.update(ast.dump(tree).encode())
+        for tests in [passing_tests, failing_tests]:
+            h.update(b'\0')
+            for test_code in tests:
+                h.update(hashlib.sha256(marshal.dumps(test_code)).digest())
+        h.update(repr(params).encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.pickle')
+
+    def get(self, key: str) -> Optional[Tuple[ast.Module, ast.expr, int]]:
+        """The cached `(repaired tree, condition, line)` for `key`, if any; an entry that
+        cannot be read, e.g. one written by another version, counts as a miss."""
+        try:
+            with open(self.path(key), 'rb') as fp:
+                entry = pickle.load(fp)
+            tree, condition, line_no = entry
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, tree: ast.Module, condition: ast.expr, line_no: int) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump((tree, condition, line_no), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,107 @@
+"""Structured progress metrics of repairs: counters, test executions, phase timings and events.
+`Repairer` and `Synthesizer` report to a `Metrics` object; the default `NO_METRICS` is disabled,
+and callers check `enabled` before computing anything to report, so it costs nothing."""
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from types import CodeType
+from typing import Any, ContextManager, Dict, IO, Iterator, Optional
+
+class JsonLinesExporter:
+    """Write each event as a JSON object on a line of `file`, a path or an open text file."""
+    def __init__(self, file: Any) -> None:
+        if isinstance(file, (str, os.PathLike)):
+            self.fp: IO[str] = open(file, 'a')
+            self.owned = True
+        else:
+            self.fp = file
+            self.owned = False
+
+    def export(self, event: Dict[str, Any]) -> None:
+        self.fp.write(json.dumps(event, default=repr) + '\n')
+
+    def close(self) -> None:
+        if self.owned:
+            self.fp.close()
+        else:
+            self.fp.flush()
+
+class Metrics:
+    """Metrics of one or more repairs:
+    `counters` by name (e.g. `templates`, `executions`, `solver_candidates`),
+    `executions` per test name and accumulated `timings` per phase in seconds.
+    Events are passed to the `exporter` if given, tagged with the `tags`."""
+    enabled = True
+
+    def __init__(self, exporter: Optional[JsonLinesExporter] = None, **tags: Any) -> None:
+        self.exporter = exporter
+        self.tags = tags
+        self.counters: Counter = Counter()
+        self.executions: Counter = Counter()
+        self.timings: Dict[str, float] = {}
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def execution(self, test_code: CodeType) -> None:
+        self.counters['executions'] += 1
+        self.executions[test_code.co_name] += 1
+
+    def event(self, name: str, **fields: Any) -> None:
+        if self.exporter is not None:
+            self.exporter.export({'event': name, 'time': time.time(), **self.tags, **fields})
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the code inside as phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.event('phase', phase=name, elapsed=elapsed)
+
+    def merge(self, summary: Dict[str, Any]) -> None:
+        """Add the `summary` of other metrics, e.g. those of a worker process."""
+        self.counters.update(summary['counters'])
+        self.executions.update(summary['executions'])
+        for name, elapsed in summary['timings'].items():
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def summary(self) -> Dict[str, Any]:
+        return {'counters': dict(self.counters), 'executions': dict(self.executions),
+                'timings': dict(self.timings)}
+
+    def close(self) -> None:
+        """Export the summary and close the exporter."""
+        if self.exporter is not None:
+            self.event('summary', **self.summary())
+            self.exporter.close()
+
+class NullMetrics(Metrics):
+    """Disabled metrics, where reporting does nothing."""
+    enabled = False
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.no_phase = nullcontext()
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def execution(self, test_code: CodeType) -> None:
+        pass
+
+    def event(self, name: str, **fields: Any) -> None:
+        pass
+
+    def phase(self, name: str) -> ContextManager[None]:
+        return self.no_phase
+
+    def merge(self, summary: Dict[str, Any]) -> None:
+        pass
+
+NO_METRICS = NullMetrics()
@@ -1,6 +1,8 @@
 import ast
 import copy
-from typing import Iterable, List, Optional, Union
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+from repair.metrics import NO_METRICS, Metrics
 
 class Marker(ast.NodeTransformer):
     """Mark the target statement."""
@@ -12,7 +14,14 @@ class Marker(ast.NodeTransformer):
         self.loop_level = 0         # depth of loop (0 indicates outside loop body)
         self.is_first_stmt = False  # is the first stmt in block?
 
+    @staticmethod
+    def index(tree: ast.Module) -> 'LineIndex':
+        """The statements of `tree` indexed by line, built once per module (see `line_index`)."""
+        return line_index(tree)
+
     def generic_visit(self, node: ast.AST) -> ast.AST:
+        if isinstance(node, ast.expr):  # no statements below
+            return node
         if isinstance(node, ast.stmt) and node.lineno == self.line_no:
             setattr(node, '__target__', (self.loop_level > 0, self.is_first_stmt))
             self.found = True
@@ -23,11 +32,8 @@ class Marker(ast.NodeTransformer):
         for field, old_value in ast.iter_fields(node):
             if isinstance(old_value, list):
                 new_values = []
-                for value in old_value:
-                    if value == old_value[0]:
-                        self.is_first_stmt = True
-                    else:
-                        self.is_first_stmt = False
+                for i, value in enumerate(old_value):
+                    self.is_first_stmt = i == 0
                     if isinstance(value, ast.AST):
                         value = self.visit(value)
                         if value is None:
@@ -47,18 +53,163 @@ class Marker(ast.NodeTransformer):
             self.loop_level -= 1
         return node
 
+class LineIndex:
+    """Index of the statements of a module by line number: for each statement `Marker` marks on a
+    line (all statements starting there, except those nested in another one), its node, parent,
+    field and position in the parent, and loop depth.
+    Lookup and marking take time in the depth of the statements, not in the size of the module.
+    The module itself is only referenced weakly, so the index can be cached per module.
+    The module must not be mutated after it has been indexed, see `invalidate_index`."""
+    def __init__(self, tree: ast.Module) -> None:
+        self.module = weakref.ref(tree)
+        # line -> [(node, loop depth)], in order
+        self.locations: Dict[int, List[Tuple[ast.stmt, int]]] = {}
+        # id of a node holding statements -> (parent, `None` for the module, field, index)
+        self.parents: Dict[int, Tuple[Optional[ast.AST], str, int]] = {}
+
+        # statements only occur in lists of statements, handlers and match cases,
+        # so expressions are never entered; `line` is that of the innermost enclosing statement
+        stack: List[Tuple[ast.AST, int, int]] = [(tree, 0, 0)]
+        while stack:
+            node, loop_depth, line = stack.pop()
+            if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+                loop_depth += 1
+            if isinstance(node, ast.stmt):
+                line = node.lineno
+            parent = None if node is tree else node
+            children = []
+            for field, value in ast.iter_fields(node):
+                if not isinstance(value, list):
+                    continue
+                for index, child in enumerate(value):
+                    if not isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                        continue
+                    self.parents[id(child)] = (parent, field, index)
+                    if isinstance(child, ast.stmt) and child.lineno != line:
+                        self.locations.setdefault(child.lineno, []).append((child, loop_depth))
+                    children.append((child, loop_depth, line))
+            stack.extend(reversed(children))
+
+    def __contains__(self, line_no: int) -> bool:
+        return line_no in self.locations
+
+    def steps(self, node: ast.AST) -> List[Tuple[str, int]]:
+        """The (field, index) steps from the module down to `node`."""
+        steps = []
+        while node is not None:
+            node, field, i = self.parents[id(node)]
+            steps.append((field, i))
+        steps.reverse()
+        return steps
+
+    def is_current(self, line_no: int) -> bool:
+        """Are the statements indexed on `line_no` still where they were indexed?
+        Checks the paths to them only, in time in their depth."""
+        for node, _ in self.locations.get(line_no, []):
+            if node.lineno != line_no:
+                return False
+            while node is not None:
+                parent, field, i = self.parents[id(node)]
+                children = getattr(parent if parent is not None else self.module(), field, None)
+                if not isinstance(children, list) or i >= len(children) or children[i] is not node:
+                    return False
+                node = parent
+        return True
+
+    def lookup(self, line_no: int) -> Tuple[ast.stmt, ast.AST, str, int, int]:
+        """The node, parent, field, position in the parent and loop depth of the first
+        statement on `line_no`."""
+        node, loop_depth = self.locations[line_no][0]
+        parent, field, index = self.parents[id(node)]
+        return node, parent if parent is not None else self.module(), field, index, loop_depth
+
+    def mark(self, line_no: int) -> Tuple[ast.Module, List['Path']]:
+        """Mark the statements on `line_no` like `Marker` does, on a copy of the module where only
+        the nodes on the paths to the targets are copied.
+        Return the marked module and the path to each target."""
+        tree = self.module()
+        root = copy.copy(tree)
+        copies = {id(tree): root}  # id of an original node -> its copy
+        paths = []
+        for target, loop_depth in self.locations[line_no]:
+            node, original = root, tree
+            path = []
+            for field, i in self.steps(target):
+                children = getattr(node, field)
+                if children is getattr(original, field):  # not copied for an earlier target
+                    children = list(children)
+                    setattr(node, field, children)
+                original = getattr(original, field)[i]
+                child = copies.get(id(original))
+                if child is None:
+                    child = copies[id(original)] = children[i] = copy.copy(original)
+                path.append((node, field, i))
+                node = child
+
+            setattr(node, '__target__', (loop_depth > 0, path[-1][2] == 0))
+            paths.append(path)
+        return root, paths
+
+_indices: 'weakref.WeakKeyDictionary[ast.Module, LineIndex]' = weakref.WeakKeyDictionary()
+
+def line_index(tree: ast.Module) -> LineIndex:
+    """The `LineIndex` of `tree`, cached per tree object for as long as the tree lives.
+    Call `invalidate_index` after mutating an indexed tree."""
+    index = _indices.get(tree)
+    if index is None:
+        index = _indices[tree] = LineIndex(tree)
+    return index
+
+def invalidate_index(tree: ast.Module) -> None:
+    """Forget the `LineIndex` of `tree`, which is built again when next needed."""
+    _indices.pop(tree, None)
+
 def mk_abstract() -> ast.expr:
     """Create an AST for the abstract condition."""
     return ast.Name('__abstract__')
 
+# path from the module to the target: (node, field, index) steps, where `index` is the position
+# in the list `field` of `node` (`None` for a single child) of the next node on the path
+Path = List[Tuple[ast.AST, str, Optional[int]]]
+
+def path_child(step: Tuple[ast.AST, str, Optional[int]]) -> ast.AST:
+    node, field, index = step
+    value = getattr(node, field)
+    return value if index is None else value[index]
+
+def set_path_child(step: Tuple[ast.AST, str, Optional[int]], child: ast.AST) -> None:
+    node, field, index = step
+    if index is None:
+        setattr(node, field, child)
+    else:
+        getattr(node, field)[index] = child
+
 class MutationOperator(ast.NodeTransformer):
+    # does the operator implement `mutate`? Else it is applied by visiting a copy of the whole tree
+    mutates_path = False
+
     def __init__(self) -> None:
         super().__init__()
         self.mutated = False
 
+    def mutate(self, path: Path) -> None:
+        """Mutate in place the nodes of `path`, which are private copies, while anything off the
+        path is shared and must not be touched. Set `self.mutated` if applied.
+        Only called on operators that set `mutates_path`."""
+        raise NotImplementedError(f'{type(self).__name__} does not mutate paths')
+
+    def cache_key(self) -> Tuple:
+        """What the templates of this operator depend on, for `RepairCache`: its class and its
+        attributes other than `mutated`, which must have a deterministic `repr`."""
+        params = sorted((name, repr(value)) for name, value in vars(self).items()
+                        if name != 'mutated')
+        return (type(self).__module__, type(self).__qualname__, tuple(params))
+
 class Tighten(MutationOperator):
     """If the target statement is an if-statement, transform its condition by
     conjoining an abstract condition: if c => if c and not __abstract__."""
+    mutates_path = True
+
     def visit_If(self, node):
         if hasattr(node, '__target__'):
             node.test  = ast.BoolOp(ast.And(), [node.test, ast.UnaryOp(ast.Not(), mk_abstract())])
@@ -66,9 +217,17 @@ class Tighten(MutationOperator):
         self.generic_visit(node)
         return node
 
+    def mutate(self, path: Path) -> None:
+        target = path_child(path[-1])
+        if isinstance(target, ast.If):
+            target.test = ast.BoolOp(ast.And(), [target.test, ast.UnaryOp(ast.Not(), mk_abstract())])
+            self.mutated = True
+
 class Loosen(MutationOperator):
     """If the target statement is an if-statement, transform its condition by
     disjoining an abstract condition: if c => if c or __abstract__."""
+    mutates_path = True
+
     def visit_If(self, node):
         if hasattr(node, '__target__'):
             node.test = ast.BoolOp(ast.Or(), [node.test, mk_abstract()])
@@ -76,9 +235,17 @@ class Loosen(MutationOperator):
         self.generic_visit(node)
         return node
 
+    def mutate(self, path: Path) -> None:
+        target = path_child(path[-1])
+        if isinstance(target, ast.If):
+            target.test = ast.BoolOp(ast.Or(), [target.test, mk_abstract()])
+            self.mutated = True
+
 class Guard(MutationOperator):
     """Transform the target statement so that it executes only if an abstract condition is false:
     s => if not __abstract__: s."""
+    mutates_path = True
+
     def visit(self, node):
         node = super().visit(node)
         if hasattr(node, "__target__"):
@@ -90,9 +257,20 @@ class Guard(MutationOperator):
             self.mutated = True
         return node
 
+    def mutate(self, path: Path) -> None:
+        target = path_child(path[-1])
+        set_path_child(path[-1], ast.If(
+            test=ast.UnaryOp(op=ast.Not(), operand=mk_abstract()),
+            body=[target],
+            orelse=[]
+        ))
+        self.mutated = True
+
 class Break(MutationOperator):
     """If the target statement is in loop body, right before it insert a `break` statement that
     executes only if an abstract condition is true, i.e., if __abstract__: break."""
+    mutates_path = True
+
     def __init__(self, required_position: bool) -> None:
         """If `required_position` is `True`, this operation is performed only when the
         target is the first statement.
@@ -123,6 +301,14 @@ class Break(MutationOperator):
         self.generic_visit(node)
         return node
 
+    def mutate(self, path: Path) -> None:
+        loop, field, index = path[-1]
+        if not isinstance(loop, (ast.For, ast.While)) or field != 'body':
+            return
+        if self.required_position == (index == 0):
+            loop.body.insert(index, ast.If(test=mk_abstract(), body=[ast.Break()], orelse=[]))
+            self.mutated = True
+
     def visit_While(self, node):
         if self.mutated:
             return node
@@ -145,28 +331,70 @@ class Break(MutationOperator):
         return node
 
 class Mutator:
-    """Perform program mutation."""
-    def __init__(self, tree: ast.Module, line_no: int, log: bool = False) -> None:
+    """Perform program mutation.
+    With `log`, each operator tried and each template are printed. Each operator tried is also
+    reported to `metrics` as a `mutation` event, which holds the template too with `log`."""
+    def __init__(self, tree: ast.Module, line_no: int, log: bool = False,
+                 *, metrics: Metrics = NO_METRICS) -> None:
         assert isinstance(tree, ast.Module)
         self.old_tree = tree
+        self.line_no = line_no
         self.log = log
+        self.metrics = metrics
+
+        index = Marker.index(tree)
+        if line_no not in index or not index.is_current(line_no):  # mutated since indexed?
+            invalidate_index(tree)
+            index = Marker.index(tree)
+        assert line_no in index
+        # shares all but the paths to the targets with `tree`
+        self.marked_tree, self.paths = index.mark(line_no)
 
-        marker = Marker(line_no)
-        self.marked_tree = marker.visit(copy.deepcopy(tree))
-        assert marker.found
+    def clone_path(self) -> Tuple[ast.Module, Path]:
+        """Copy the nodes (and lists) on the path from the module to the (single) target,
+        sharing every other subtree with `self.marked_tree`."""
+        root = copy.copy(self.marked_tree)
+        node = root
+        path = []
+        for _, field, index in self.paths[0]:
+            children = list(getattr(node, field))
+            setattr(node, field, children)
+            child = children[index] = copy.copy(children[index])
+            path.append((node, field, index))
+            node = child
+        return root, path
+
+    def mutate(self, visitor: MutationOperator) -> ast.Module:
+        """Apply `visitor` to a copy of `self.marked_tree`, copying only the path to the target
+        if the operator supports it and the line holds a single statement: the statements of
+        a line are mutated together, by visiting the whole tree."""
+        if visitor.mutates_path and len(self.paths) == 1:
+            new_tree, path = self.clone_path()
+            visitor.mutate(path)
+            return new_tree
+        return visitor.visit(copy.deepcopy(self.marked_tree))
 
     def apply(self, ops: List[MutationOperator] = None) -> Iterable[ast.Module]:
+        """Yield a template for each operator in `ops` that applies.
+        Templates share untouched subtrees with each other and with the original tree;
+        do not mutate them in place."""
         if ops is None:
             # in default priority order
             ops = [Tighten(), Loosen(), Break(True), Guard(), Break(False)]
 
         for visitor in ops:
-            new_tree = visitor.visit(copy.deepcopy(self.marked_tree))
+            new_tree = self.mutate(visitor)
+            template = None
             if self.log:
                 print(f'-> {visitor.__class__.__name__}', '✓' if visitor.mutated else '✗')
+                if visitor.mutated:
+                    template = ast.unparse(new_tree)
+                    print(template)
+            if self.metrics.enabled:
+                fields = {} if template is None else {'template': template}
+                self.metrics.event('mutation', line=self.line_no,
+                                   operator=type(visitor).__name__, applied=visitor.mutated,
+                                   **fields)
 
             if visitor.mutated:
-                if self.log:
-                    print(ast.unparse(new_tree))
-
                 yield new_tree
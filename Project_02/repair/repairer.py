@@ -1,44 +1,319 @@
 import ast
+import copy
+import itertools
+import marshal
+import multiprocessing
+from contextlib import closing
 from types import CodeType
-from typing import List
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-from repair.mutator import Mutator
-from repair.synthesizer import Synthesizer, Template
-from repair.tester import run_tests
+from repair.cache import RepairCache
+from repair.metrics import NO_METRICS, Metrics
+from repair.mutator import Marker, MutationOperator, Mutator
+from repair.synthesizer import FlipSearch, SearchStrategy, Synthesizer, Template
+from repair.tester import (Coverage, Limits, ParallelRunner, Snapshot, ValidationScheduler,
+                           run_tests, run_tests_parallel)
 
 class Repairer:
-    def __init__(self, tree: ast.Module, line_no: int,
+    def __init__(self, tree: ast.Module, line_no: Union[int, List[int]],
                  passing_tests: List[CodeType], failing_tests: List[CodeType],
-                 k: int = 10, extra_templates: List[Template] = None, log: bool = False) -> None:
+                 k: int = 10, extra_templates: List[Template] = None, log: bool = False,
+                 *, workers: Optional[int] = None, parallel: bool = False,
+                 synthesis_workers: Optional[int] = None, budget: Optional[int] = None,
+                 snapshot: Snapshot = None, strategy: SearchStrategy = None,
+                 ops: List[MutationOperator] = None, cache: RepairCache = None,
+                 validate_cached: bool = False, limits: Limits = None,
+                 schedule: bool = False, coverage_sample: Optional[int] = None,
+                 metrics: Metrics = NO_METRICS, vectorize: bool = False,
+                 check_candidates: Optional[bool] = None) -> None:
+        """`line_no` is either the target line or a list of candidate lines ranked by
+        suspiciousness, which are tried in order until a validated fix is found.
+        `budget` bounds the number of templates synthesized over all candidate lines.
+        The tests may be streamed while the repair runs, see `StreamedTests`; synthesis and
+        checks consume them as they arrive, while a `cache`, `schedule`, `coverage_sample` and
+        `parallel` wait for all of them.
+        With a `cache`, a repair found before for the same program, tests and parameters is
+        reused (and checked against the tests if `validate_cached`).
+        Test runs exceeding the `limits` fail, in synthesis and validation alike.
+        With `schedule`, candidates are checked by a `ValidationScheduler` instead, which runs
+        the tests most likely to fail first and skips those not executing the mutated line.
+        With a `coverage_sample`, the line coverage of each test is recorded on the original
+        tree, and synthesis and validation run only the tests executing the mutated line plus
+        a sample of that many others.
+        Progress is reported to `metrics`: templates tried, test executions, solver candidates
+        checked and time per phase, see `Metrics`.
+        With `vectorize`, numeric templates are checked with NumPy if installed.
+        If `check_candidates`, each synthesized candidate is checked against the tests before it
+        is accepted. By default it is when trying several lines, and with `workers`, `schedule`
+        or a `coverage_sample`, which are about checking; otherwise the first synthesized
+        candidate is accepted, since synthesis already ran all tests on its template."""
         self.old_tree = tree
         self.passing_tests = passing_tests
         self.failing_tests = failing_tests
         self.k = k
         self.extra_templates = extra_templates
         self.log = log
+        self.workers = workers  # validate on a process pool if set
+        self.parallel = parallel  # synthesize on all mutated templates concurrently?
+        self.synthesis_workers = synthesis_workers
+        self.budget = budget
+        self.snapshot = snapshot  # how envs are recorded, see `Snapshot`
+        self.strategy = strategy  # how condition values are searched, see `SearchStrategy`
+        self.ops = ops  # mutation operators in priority order, `Mutator` default if `None`
+        self.cache = cache
+        self.validate_cached = validate_cached
+        self.limits = limits
+        self.schedule = schedule
+        self.coverage_sample = coverage_sample
+        self.coverage: Optional[Coverage] = None  # set up by `search`
+        self.scheduler: Optional[ValidationScheduler] = None  # set up by `search`
+        self.metrics = metrics
+        self.vectorize = vectorize
+        self.runner: Optional[ParallelRunner] = None  # validation pool, set up by `repair`
+        if check_candidates is None:
+            check_candidates = (not isinstance(line_no, int) or workers is not None or schedule
+                                or coverage_sample is not None)
+        self.check_candidates = check_candidates
 
-        self.mutator = Mutator(self.old_tree, line_no, log)
+        if isinstance(line_no, int):
+            self.line_nos = [line_no]
+            self.mutator = Mutator(self.old_tree, line_no, log, metrics=metrics)
+        else:
+            # lines where no statement starts cannot be mutated, skip them
+            index = Marker.index(self.old_tree)
+            self.line_nos = [n for n in line_no if n in index]
+            self.mutator = None
+
+        self.attempts = 0  # number of templates synthesized
+        self.line_no: int  # line of the fix
+        self.condition: ast.expr  # synthesized condition
 
     def repair(self) -> bool:
-        """Entry point."""
+        """Entry point.
+        With `workers`, candidates are validated on one process pool, shut down when done."""
         if self.log:
             print('Program to repair:')
             print(ast.unparse(self.old_tree))
 
-        for template in self.mutator.apply():
-            synthesizer = Synthesizer(template, self.passing_tests, self.failing_tests,
-                                      k=self.k, extra_templates=self.extra_templates, log=self.log)
-            if synthesizer.apply():
-                self.new_tree = synthesizer.concrete_tree
+        if self.workers is not None:
+            self.runner = ParallelRunner(self.workers)
+        try:
+            return self.find_repair()
+        finally:
+            if self.runner is not None:
+                self.runner.shutdown()
+                self.runner = None
+
+    def find_repair(self) -> bool:
+        """Look the repair up in the cache, or search for it."""
+        if self.cache is not None:
+            key = self.cache.key(self.old_tree, self.passing_tests, self.failing_tests,
+                                 self.cache_params())
+            entry = self.cache.get(key)
+            if entry is not None and (not self.validate_cached or self.check(entry[0])):
+                self.new_tree, self.condition, self.line_no = entry
                 if self.log:
-                    print('Program fixed:')
+                    print('Program fixed (cached):')
                     print(ast.unparse(self.new_tree))
 
+                self.metrics.event('repair', fixed=True, cached=True, line=self.line_no)
                 return True
 
+        if not self.search():
+            self.metrics.event('repair', fixed=False, cached=False, attempts=self.attempts)
+            return False
+
+        if self.metrics.enabled:
+            self.metrics.event('repair', fixed=True, cached=False, attempts=self.attempts,
+                               line=self.line_no, condition=ast.unparse(self.condition))
+
+        if self.cache is not None:
+            self.cache.put(key, self.new_tree, self.condition, self.line_no)
+        return True
+
+    def search(self) -> bool:
+        """Search the candidate lines for a fix."""
+        if (self.schedule or self.coverage_sample is not None) and self.coverage is None:
+            tests = self.passing_tests + self.failing_tests
+            with self.metrics.phase('coverage'):
+                self.coverage = Coverage(self.old_tree, tests, limits=self.limits,
+                                         sample=self.coverage_sample or 0)
+        if self.schedule and self.scheduler is None:
+            self.scheduler = ValidationScheduler(self.passing_tests + self.failing_tests,
+                                                 self.coverage, limits=self.limits)
+
+        for line_no in self.line_nos:
+            if self.mutator is not None:
+                mutator = self.mutator
+            else:
+                if self.log:
+                    print(f'Try line {line_no}:')
+                mutator = Mutator(self.old_tree, line_no, self.log, metrics=self.metrics)
+
+            if self.parallel:
+                candidates = self.synthesize_parallel(mutator, line_no)
+            else:
+                candidates = self.synthesize(mutator, line_no)
+
+            with closing(candidates):
+                for result in candidates:
+                    self.attempts += 1
+                    self.metrics.count('templates')
+                    valid = result is not None
+                    if valid and self.check_candidates:
+                        with self.metrics.phase('validation'):
+                            valid = self.check(result[0], line_no=line_no)
+                    self.metrics.event('candidate', line=line_no, attempt=self.attempts,
+                                       synthesized=result is not None, valid=valid)
+                    if valid:
+                        self.new_tree, self.condition = result
+                        self.line_no = line_no
+                        if self.log:
+                            print('Program fixed:')
+                            print(ast.unparse(self.new_tree))
+
+                        return True
+
+                    if self.budget is not None and self.attempts >= self.budget:
+                        return False
+
         return False
 
+    def synthesize(self, mutator: Mutator,
+                   line_no: Optional[int] = None) -> Iterator[Optional[Tuple[ast.Module, ast.expr]]]:
+        """Synthesize on the mutated templates of `line_no` one after another, in priority order.
+        Yield the instantiated tree and the condition of each template, or `None` if
+        synthesis fails."""
+        coverage = self.coverage if self.coverage_sample is not None else None
+        for template in mutator.apply(self.fresh_ops()):
+            synthesizer = Synthesizer(template, self.passing_tests, self.failing_tests,
+                                      k=self.k, extra_templates=self.extra_templates, log=self.log,
+                                      workers=self.workers, snapshot=self.snapshot,
+                                      strategy=self.strategy, limits=self.limits,
+                                      vectorize=self.vectorize, coverage=coverage,
+                                      line_no=line_no, metrics=self.metrics, runner=self.runner)
+            with self.metrics.phase('synthesis'):
+                synthesized = synthesizer.apply()
+            if synthesized:
+                yield synthesizer.concrete_tree, synthesizer.condition
+            else:
+                yield None
+
+    def synthesize_parallel(self, mutator: Mutator, line_no: Optional[int] = None
+                            ) -> Iterator[Optional[Tuple[ast.Module, ast.expr]]]:
+        """Synthesize on the mutated templates of `line_no` concurrently on a process pool.
+        The results are yielded in priority order, so the outcome is the same as with
+        `synthesize`. Once the caller is done, the pool is terminated: lower-priority templates
+        still being synthesized are neither waited for nor left running.
+        Only the templates left in the `budget` are generated and submitted."""
+        remaining = None if self.budget is None else max(self.budget - self.attempts, 0)
+        templates = list(itertools.islice(mutator.apply(self.fresh_ops()), remaining))
+        tests = self.shipped_tests(line_no)
+        if tests is None:  # synthesis fails on every template, without running anything
+            yield from [None] * len(templates)
+            return
+
+        pool = multiprocessing.Pool(self.synthesis_workers)
+        try:
+            results = [pool.apply_async(synthesize_isolated,
+                                        (template, *tests, self.k, self.extra_templates,
+                                         self.snapshot, self.strategy, self.limits,
+                                         self.vectorize, self.metrics.enabled))
+                       for template in templates]
+
+            for result in results:  # in priority order
+                with self.metrics.phase('synthesis'):  # waiting for the worker
+                    synthesized, executions, summary = result.get()
+                if self.strategy is not None:  # the worker searched on a copy
+                    self.strategy.executions += executions
+                if summary is not None:
+                    self.metrics.merge(summary)
+                yield synthesized
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def shipped_tests(self, line_no: Optional[int] = None
+                      ) -> Optional[Tuple[List[bytes], List[bytes]]]:
+        """The passing and failing tests to synthesize on in a worker, as marshalled code.
+        With a coverage, these are the tests executing `line_no`, like `Synthesizer` runs;
+        `None` if a failing test does not execute it, so no condition there can fix it."""
+        if not hasattr(self, 'marshalled_tests'):
+            self.marshalled_tests = {t: marshal.dumps(t)
+                                     for t in self.passing_tests + self.failing_tests}
+
+        coverage = self.coverage if self.coverage_sample is not None else None
+        if coverage is None or line_no is None:
+            covered = self.passing_tests, self.failing_tests
+        else:
+            if not all(coverage.covers(t, line_no) for t in self.failing_tests):
+                return None
+            covered = ([t for t in self.passing_tests if coverage.covers(t, line_no)],
+                       self.failing_tests)
+        return tuple([self.marshalled_tests[t] for t in tests] for tests in covered)
+
+    def cache_params(self) -> Tuple:
+        """The parameters a repair depends on besides program and tests, for `RepairCache`."""
+        templates = [(t.args, t.types, ast.dump(t.body)) for t in self.extra_templates or []]
+        ops = None if self.ops is None else [op.cache_key() for op in self.ops]
+        snapshot = (type(self.snapshot).__name__, sorted(getattr(self.snapshot, 'allowlist', [])),
+                    getattr(self.snapshot, 'max_tuple', None))
+        strategy = (self.strategy or FlipSearch()).cache_key()
+        return (self.line_nos, self.k, templates, ops, self.budget, strategy, snapshot,
+                self.limits, self.coverage_sample, self.schedule, self.check_candidates)
+
+    def fresh_ops(self) -> Optional[List[MutationOperator]]:
+        """Unused copies of `self.ops`; operators are stateful."""
+        return copy.deepcopy(self.ops)
+
+    def check(self, tree: ast.Module, failures: List[str] = None,
+              line_no: Optional[int] = None) -> bool:
+        """Check correctness of `tree` w.r.t. all tests.
+        `line_no` is the line where `tree` differs from the original tree, if known; with a
+        coverage, only the tests that can tell the difference are run then."""
+        if self.scheduler is not None and failures is None:
+            return self.scheduler.run(tree, line_no)
+        # run as the tests arrive if streamed, see `StreamedTests`; all are needed otherwise
+        tests = itertools.chain(self.passing_tests, self.failing_tests)
+        if self.coverage_sample is not None and line_no is not None:
+            tests = self.coverage.select(list(tests), line_no)
+        elif self.runner is not None or self.workers is not None:
+            tests = list(tests)
+        if self.runner is not None:
+            return self.runner.run(tree, tests, failures=failures, stop_early=failures is None,
+                                   limits=self.limits)
+        if self.workers is not None:  # outside `repair`, on a temporary pool
+            return run_tests_parallel(tree, tests, failures=failures, workers=self.workers,
+                                      stop_early=failures is None, limits=self.limits)
+        return run_tests(tree, tests, failures=failures, limits=self.limits)
+
     def validate(self, failures: List[str] = None) -> bool:
         """Check correctness of repaired program.
         Collect failure test case names in `failures` if provided."""
-        return run_tests(self.new_tree, self.passing_tests + self.failing_tests, failures=failures)
+        return self.check(self.new_tree, failures=failures)
+
+def synthesize_isolated(template: ast.Module, pos_tests: List[bytes], neg_tests: List[bytes],
+                        k: int, extra_templates: Optional[List[Template]],
+                        snapshot: Optional[Snapshot] = None,
+                        strategy: Optional[SearchStrategy] = None,
+                        limits: Optional[Limits] = None, vectorize: bool = False,
+                        metrics: bool = False
+                        ) -> Tuple[Optional[Tuple[ast.Module, ast.expr]], int,
+                                   Optional[Dict[str, Any]]]:
+    """Synthesize on a `template` in a worker process, with the tests given as marshalled code
+    objects. Return the instantiated tree and the condition if synthesis succeeds, together with
+    the test executions the search spent and, if `metrics`, the summary of the `Metrics` of the
+    synthesis, to be merged into the caller's."""
+    worker_metrics = Metrics() if metrics else NO_METRICS
+    synthesizer = Synthesizer(template, [marshal.loads(t) for t in pos_tests],
+                              [marshal.loads(t) for t in neg_tests],
+                              k=k, extra_templates=extra_templates, snapshot=snapshot,
+                              strategy=strategy, limits=limits, vectorize=vectorize,
+                              metrics=worker_metrics)
+    executions = synthesizer.strategy.executions
+    result = None
+    if synthesizer.apply():
+        result = synthesizer.concrete_tree, synthesizer.condition
+
+    summary = worker_metrics.summary() if metrics else None
+    return result, synthesizer.strategy.executions - executions, summary
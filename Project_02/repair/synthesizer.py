@@ -1,9 +1,15 @@
 import ast
+import builtins
 import copy
+import functools
 import itertools
+import math
+import weakref
 from types import CodeType
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 from repair.tester import *
+from repair import vectorize as vectorized
+from repair.metrics import NO_METRICS, Metrics
 
 
 class Template:
@@ -39,6 +45,25 @@ class Template:
         assert len(vars) == len(self.args)
         return self.NameTransformer(dict(zip(self.args, vars))).visit(copy.deepcopy(self.body))
 
+    def compile(self) -> Optional[Callable[..., Any]]:
+        """Compile the body to a function of the meta variables, once per template.
+        `None` if the body refers to names other than meta variables and builtins,
+        as those can only be resolved in each env."""
+        if not hasattr(self, 'function'):
+            names = {node.id for node in ast.walk(self.body) if isinstance(node, ast.Name)}
+            if all(name in self.args or hasattr(builtins, name) for name in names):
+                source = f'lambda {", ".join(self.args)}: {ast.unparse(self.body)}'
+                self.function = eval(compile(source, '<template>', 'eval'), {})
+            else:
+                self.function = None
+        return self.function
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the compiled function cannot be pickled, it is compiled again on demand
+        state = dict(self.__dict__)
+        state.pop('function', None)
+        return state
+
     class NameTransformer(ast.NodeTransformer):
         def __init__(self, mapping: Dict[str, str]) -> None:
             super().__init__()
@@ -52,17 +77,205 @@ class Template:
             return node
 
 
+def is_plain(value: Any) -> bool:
+    """Is `value` of a type whose `repr` is a literal and whose hash agrees with `==`?"""
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, tuple):
+        return all(is_plain(v) for v in value)
+    return type(value) in (bool, int, str, bytes, type(None))
+
+
+class ConstraintTable:
+    """Columnar view of constraints: the values of each variable over all envs, indexed by value,
+    so that candidates `x == v` and `x != v` are checked with set lookups instead of `eval`."""
+
+    def __init__(self, constraints: Record) -> None:
+        self.size = len(constraints)
+        self.trues = frozenset(i for i, value in enumerate(constraints.values) if value)
+        self.falses = frozenset(range(self.size)) - self.trues
+
+        self.columns = constraints.columns
+        # number of envs defining each variable
+        self.counts = {x: sum(v is not MISSING for v in column)
+                       for x, column in self.columns.items()}
+
+        self.indices: Dict[str, Optional[Dict[Any, FrozenSet[int]]]] = {}
+
+    def index(self, x: str) -> Optional[Dict[Any, FrozenSet[int]]]:
+        """Map each value of `x` to the envs where `x` equals it.
+        `None` if `x` is not a plain variable defined in every env."""
+        if x not in self.indices:
+            if self.counts.get(x) == self.size and all(is_plain(v) for v in self.columns[x]):
+                groups: Dict[Any, Set[int]] = {}
+                for i, v in enumerate(self.columns[x]):
+                    groups.setdefault(v, set()).add(i)
+                self.indices[x] = {v: frozenset(envs) for v, envs in groups.items()}
+            else:
+                self.indices[x] = None
+
+        return self.indices[x]
+
+    def sat_compare(self, x: str, op: str, v: Any) -> Optional[bool]:
+        """Check if `x <op> v` satisfies the constraints, for `op` one of `==` and `!=`.
+        `None` if this cannot be decided on the table."""
+        if not is_plain(v):
+            return None
+
+        if self.counts.get(x) != self.size:
+            if hasattr(builtins, x):  # the name falls back to the builtin
+                return None
+            return False  # NameError on some env
+
+        index = self.index(x)
+        if index is None:
+            return None
+
+        envs = index.get(v, frozenset())
+        return envs == (self.trues if op == '==' else self.falses)
+
+
+class TemplateLibrary:
+    """Instantiate templates over the variables of the constraints and check them.
+    Meta variables are bound to distinct variables defined in every env whose values match the
+    declared type (unknown types match anything), each instantiation is checked once, and
+    constraints that rejected earlier candidates are checked first.
+    At most `limit` instantiations are checked, if given.
+    With `vectorize` (and NumPy installed), comparison and arithmetic templates over numeric
+    columns are first evaluated as array expressions over all constraints at once."""
+
+    TYPES: Dict[str, Any] = {'int': int, 'float': (int, float), 'bool': bool, 'str': str,
+                             'list': list, 'tuple': tuple, 'dict': dict, 'set': set}
+
+    def __init__(self, templates: List[Template], limit: Optional[int] = None,
+                 vectorize: bool = False) -> None:
+        self.templates = templates
+        self.limit = limit
+        self.vectorize = vectorize and vectorized.available()
+        self.checked = 0  # instantiations checked
+        self.array_checked = 0  # instantiations rejected on arrays
+
+        self.table: Optional[ConstraintTable] = None
+        self.typed: Dict[str, List[str]] = {}  # type -> variables of the type in `self.table`
+
+    def has_type(self, values: List[Any], typ: str) -> bool:
+        expected = self.TYPES.get(typ, getattr(builtins, typ, None))
+        if not isinstance(expected, (type, tuple)):
+            return True
+        names = {t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,))}
+        return all(isinstance(v, expected) or isinstance(v, Summary) and v.type in names
+                   for v in values)
+
+    def bindings(self, template: Template, table: ConstraintTable) -> Iterator[Tuple[str, ...]]:
+        """Distinct variables for the meta variables of `template`, by declared type."""
+        if table is not self.table:
+            self.table = table
+            self.typed = {}
+        for typ in template.types:
+            if typ not in self.typed:
+                self.typed[typ] = [x for x, count in table.counts.items()
+                                   if count == table.size and self.has_type(table.columns[x], typ)]
+
+        choices = [self.typed[typ] for typ in template.types]
+        for binding in itertools.product(*choices):
+            if len(set(binding)) == len(binding):
+                yield binding
+
+    def solve(self, constraints: Record, table: ConstraintTable,
+              sat: Callable[[ast.expr, Record], bool]) -> Optional[ast.expr]:
+        """The first instantiation satisfying the `constraints`, if any.
+        Templates that cannot be compiled to a function are checked with `sat`."""
+        values = constraints.values
+        killers: List[int] = []  # constraints that rejected candidates, most recent first
+        seen = set()
+        numeric = vectorized.NumericColumns(table.columns, values) if self.vectorize else None
+
+        for template in self.templates:
+            function = template.compile()
+            array_function = None
+            if numeric is not None and function is not None:
+                array_function = vectorized.compile_array_function(template.args, template.body)
+            # the body with positional meta variables, equal for templates differing in names
+            placeholders = [f'_{i}' for i in range(len(template.args))]
+            canonical = ast.unparse(template.instantiate(placeholders))
+            for binding in self.bindings(template, table):
+                if (canonical, binding) in seen:
+                    continue
+                seen.add((canonical, binding))
+
+                if self.limit is not None and self.checked >= self.limit:
+                    return None
+                self.checked += 1
+
+                if function is None:  # free names, evaluate in each env
+                    expression = template.instantiate(list(binding))
+                    if sat(expression, constraints):
+                        return expression
+                    continue
+
+                columns = [table.columns[x] for x in binding]
+                killer = self.check(function, columns, values, killers)
+                if killer is None and array_function is not None:
+                    violation = numeric.first_violation(array_function, list(binding))
+                    if violation is not None and violation >= 0:
+                        self.array_checked += 1
+                        killer = violation
+                if killer is None:  # not vectorized, or confirm with exact scalar semantics
+                    killer = self.check(function, columns, values, range(len(values)))
+                if killer is None:
+                    return template.instantiate(list(binding))
+                if killer in killers:
+                    killers.remove(killer)
+                killers.insert(0, killer)
+                del killers[8:]
+
+        return None
+
+    def check(self, function: Callable[..., Any], columns: List[List[Any]], values: List[bool],
+              indices: Iterable[int]) -> Optional[int]:
+        """The first of the constraints at `indices` contradicted by `function` over `columns`.
+        `None` if all are satisfied."""
+        for i in indices:
+            try:
+                actual = function(*[column[i] for column in columns])
+            except Exception:
+                return i
+
+            if actual != values[i]:
+                return i
+
+        return None
+
+
 class Synthesizer:
     """Condition synthesis."""
 
     def __init__(self, tree: ast.Module, pos_tests: List[CodeType], neg_tests: List[CodeType],
-                 k: int = 10, extra_templates: List[Template] = None, log: bool = False) -> None:
+                 k: int = 10, extra_templates: List[Template] = None, log: bool = False,
+                 *, workers: Optional[int] = None, snapshot: Snapshot = None,
+                 strategy: 'SearchStrategy' = None, vectorize: bool = False,
+                 limits: Limits = None, coverage: Coverage = None,
+                 line_no: Optional[int] = None, metrics: Metrics = NO_METRICS,
+                 runner: ParallelRunner = None) -> None:
         self.abstract_tree = tree
         self.pos_tests = pos_tests
         self.neg_tests = neg_tests
         self.k = k
         self.extra_templates = extra_templates
+        self.logging = log
         self.log = print if log else no_log
+        self.workers = workers  # validate on a process pool if set
+        self.runner = runner  # the pool, if shared with the caller; else one per `validate`
+        self.snapshot = snapshot  # how envs are recorded, see `Snapshot`
+        # how condition values are searched for failing tests
+        self.strategy = strategy if strategy is not None else FlipSearch()
+        self.vectorize = vectorize  # check numeric templates with NumPy, if installed
+        self.limits = limits  # per-test execution limits, see `Limits`
+        # with the coverage of the original program and the line of the abstract condition,
+        # only the tests executing that line are run
+        self.coverage = coverage if line_no is not None else None
+        self.line_no = line_no
+        self.metrics = metrics  # progress reports, see `Metrics`
 
         self.condition: ast.expr  # synthesized condition
         self.concrete_tree: ast.Module  # instantiated tree
@@ -70,39 +283,41 @@ class Synthesizer:
     def apply(self) -> bool:
         """Entry point."""
         overall_record = Record([], [])
-
-        for test_code in self.neg_tests:
-            self.log(f'--> Execute {test_code.co_name}')
-
-            success, record = exec_abstract(self.abstract_tree, test_code, iter([]))
-            self.log(f'--(0/{self.k})->', '✓' if success else '✗', record.values)
-
-            i = 1
-            while not success and i <= self.k:
-                if i == self.k:  # the last attempt
-                    future_values = all_true()
+        program = prepare(self.abstract_tree)
+
+        with self.metrics.phase('search'):
+            for test_code in self.neg_tests:
+                if self.logging:
+                    self.log(f'--> Execute {test_code.co_name}')
+                if not self.covers(test_code):
+                    return False  # the condition cannot change the outcome
+
+                success, record = self.strategy.search(self, program, test_code)
+                if success:
+                    overall_record += record
                 else:
-                    future_values = iter(self.flip(record.values))
-
-                success, record = exec_abstract(self.abstract_tree, test_code, future_values)
-                self.log(f'--({i}/{self.k})->', '✓' if success else '✗', record.values)
-                i += 1
-
-            if success:
+                    return False  # synthesis failed
+
+        with self.metrics.phase('positive'):
+            for test_code in self.pos_tests:
+                if not self.covers(test_code):
+                    continue  # the condition is never evaluated
+                if self.logging:
+                    self.log(f'--> Execute {test_code.co_name} (+)')
+
+                self.metrics.execution(test_code)
+                success, record = program.run(test_code, iter([]), self.snapshot, self.limits)
+                if self.logging:
+                    self.log('   ', '✓' if success else '✗', record.values)
+
+                if not success:
+                    assert self.limits is not None
+                    return False  # the test ran out of limits
                 overall_record += record
-            else:
-                return False  # synthesis failed
-
-        for test_code in self.pos_tests:
-            self.log(f'--> Execute {test_code.co_name} (+)')
-
-            success, record = exec_abstract(self.abstract_tree, test_code, iter([]))
-            self.log('   ', '✓' if success else '✗', record.values)
 
-            assert success
-            overall_record += record
-
-        if self.solve(overall_record):
+        with self.metrics.phase('solve'):
+            solved = self.solve(overall_record)
+        if solved:
             self.concrete_tree = Instantiate(self.condition).visit(
                 copy.deepcopy(self.abstract_tree))
             return True
@@ -122,36 +337,51 @@ class Synthesizer:
     def solve(self, constraints: Record) -> bool:
         """Solve constraints. Returns if a solution is found. Set `self.condition` when found."""
         # TODO: YOUR CODE HERE
-        # Enumerate candidate conditions
-        candidates = []
+        table = ConstraintTable(constraints)
+
+        # Phase 1: Check candidate conditions `x == v` and `x != v`, in order of appearance
+        seen = set()
         for env in constraints.envs:
             for x, v in env.items():
-                candidates.append(ast.parse(f'{x} == {repr(v)}').body[0].value)
-                candidates.append(ast.parse(f'{x} != {repr(v)}').body[0].value)
-
-        # Phase 1: Check candidate conditions
-        for cond in candidates:
-            if self.sat(cond, constraints):
-                self.condition = cond
-                return True
+                key = (x, v) if is_plain(v) else (x, repr(v))
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                for op in ['==', '!=']:
+                    self.metrics.count('solver_candidates')
+                    is_sat = table.sat_compare(x, op, v)
+                    if is_sat is None:  # not decidable on the table
+                        try:
+                            cond = ast.parse(f'{x} {op} {repr(v)}').body[0].value
+                        except SyntaxError:  # value has no literal form
+                            continue
+                        is_sat = self.sat(cond, constraints)
+                    if is_sat:
+                        self.condition = ast.parse(f'{x} {op} {repr(v)}').body[0].value
+                        return True
 
         # # Phase 2: Check templates
         if self.extra_templates is not None:
-            for template in self.extra_templates:
-                for env in constraints.envs:
-                    if len(template.args) == len(env):
-                        variables = [str(v) for v in env.keys()]
-                        expression = template.instantiate(variables)
-                        if self.sat(expression, constraints):
-                            self.condition = expression
-                            return True
+            library = TemplateLibrary(self.extra_templates, vectorize=self.vectorize)
+            expression = library.solve(constraints, table, self.sat)
+            self.metrics.count('solver_candidates', library.checked)
+            if expression is not None:
+                self.condition = expression
+                return True
         return False
 
     def sat(self, cond: ast.expr, constraints: Record) -> bool:
         """Check if `cond` satisfies the `constraints`."""
+        self.metrics.count('sat_calls')
+        try:
+            predicate = compile_condition(ast.unparse(cond))
+        except SyntaxError:  # not a valid expression, so it cannot be satisfied
+            return False
+
         for env, value in zip(constraints.envs, constraints.values):
             try:
-                actual = eval(ast.unparse(cond), {}, env)
+                actual = eval(predicate, {}, env)
             except Exception:
                 return False
 
@@ -160,9 +390,163 @@ class Synthesizer:
 
         return True
 
+    def covers(self, test_code: CodeType) -> bool:
+        """Does `test_code` execute the abstract condition? `True` without a coverage."""
+        return self.coverage is None or self.coverage.covers(test_code, self.line_no)
+
     def validate(self) -> bool:
         """Check correctness of the repaired program `self.concrete_tree`."""
-        return run_tests(self.concrete_tree, self.neg_tests + self.pos_tests)
+        # run as the tests arrive if streamed, see `StreamedTests`; all are needed otherwise
+        tests = itertools.chain(self.neg_tests, self.pos_tests)
+        if self.coverage is not None:
+            tests = self.coverage.select(list(tests), self.line_no)
+        elif self.runner is not None or self.workers is not None:
+            tests = list(tests)
+        if self.runner is not None:
+            return self.runner.run(self.concrete_tree, tests, stop_early=True, limits=self.limits)
+        if self.workers is not None:
+            return run_tests_parallel(self.concrete_tree, tests,
+                                      workers=self.workers, stop_early=True, limits=self.limits)
+        return run_tests(self.concrete_tree, tests, limits=self.limits)
+
+
+class SearchStrategy:
+    """Search for a sequence of abstract condition values that makes a failing test pass.
+    `executions` counts the test executions spent so far."""
+
+    def __init__(self) -> None:
+        self.executions = 0
+
+    def search(self, synthesizer: Synthesizer, program: AbstractProgram,
+               test_code: CodeType) -> Tuple[bool, Record]:
+        """Return if a passing sequence is found together with the execution record."""
+        raise NotImplementedError
+
+    def cache_key(self) -> Tuple:
+        """What the results of this strategy depend on, for `RepairCache`: its class and
+        parameters. Strategies with parameters extend this."""
+        return (type(self).__module__, type(self).__qualname__)
+
+    def execute(self, synthesizer: Synthesizer, program: AbstractProgram, test_code: CodeType,
+                future_values: Iterator[bool]) -> Tuple[bool, Record]:
+        self.executions += 1
+        synthesizer.metrics.execution(test_code)
+        return program.run(test_code, future_values, synthesizer.snapshot, synthesizer.limits)
+
+
+class FlipSearch(SearchStrategy):
+    """Follow a single path: `Synthesizer.flip` the last record at most `k` times,
+    the last attempt being all `True`s."""
+
+    def search(self, synthesizer: Synthesizer, program: AbstractProgram,
+               test_code: CodeType) -> Tuple[bool, Record]:
+        k = synthesizer.k
+        success, record = self.execute(synthesizer, program, test_code, iter([]))
+        if synthesizer.logging:
+            synthesizer.log(f'--(0/{k})->', '✓' if success else '✗', record.values)
+
+        i = 1
+        while not success and i <= k:
+            if i == k:  # the last attempt
+                future_values = all_true()
+            else:
+                future_values = iter(synthesizer.flip(list(record.values)))
+
+            success, record = self.execute(synthesizer, program, test_code, future_values)
+            if synthesizer.logging:
+                synthesizer.log(f'--({i}/{k})->', '✓' if success else '✗', record.values)
+            i += 1
+
+        return success, record
+
+
+# prefix of condition values -> (values consumed by the run, success)
+PrefixMemo = Dict[Tuple[bool, ...], Tuple[Tuple[bool, ...], bool]]
+
+
+class PrefixSearch(SearchStrategy):
+    """Breadth-first search over prefixes of condition values, keeping at most `width` prefixes
+    per level (prefixes with more `True`s come in later levels), within `k` executions and a last
+    attempt of all `True`s.
+    The values consumed by each executed prefix are memoized per test and program: a prefix known
+    to fail is expanded without being run again, also in later searches with the same strategy.
+    Programs are told apart by their compiled code, so the memo carries over to equal templates
+    prepared again, e.g. by another `Repairer`; it keeps the `memo_programs` most recent programs
+    per test, and forgets a test once its code object is gone."""
+
+    def __init__(self, width: int = 4, memo_programs: int = 64) -> None:
+        super().__init__()
+        self.width = width
+        self.memo_programs = memo_programs
+        # test -> program code -> memo of the search on them
+        self.memo: 'weakref.WeakKeyDictionary[CodeType, Dict[CodeType, PrefixMemo]]' = \
+            weakref.WeakKeyDictionary()
+
+    def cache_key(self) -> Tuple:
+        # the memo saves executions only, it does not change what is found
+        return super().cache_key() + (self.width,)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # a weak dictionary cannot be pickled; a worker starts with an empty memo
+        return {**self.__dict__, 'memo': None}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.memo = weakref.WeakKeyDictionary()
+
+    def memo_of(self, program: AbstractProgram, test_code: CodeType) -> PrefixMemo:
+        programs = self.memo.setdefault(test_code, {})
+        memo = programs.pop(program.program_code, None)
+        if memo is None:
+            memo = {}
+            if len(programs) >= self.memo_programs:
+                del programs[next(iter(programs))]  # the least recently searched
+        programs[program.program_code] = memo
+        return memo
+
+    def search(self, synthesizer: Synthesizer, program: AbstractProgram,
+               test_code: CodeType) -> Tuple[bool, Record]:
+        memo = self.memo_of(program, test_code)
+        budget = synthesizer.k
+
+        level: List[Tuple[bool, ...]] = [()]
+        while level and budget > 0:
+            next_level: Dict[Tuple[bool, ...], None] = {}  # ordered set
+            for prefix in level:
+                if budget == 0:
+                    break
+
+                if prefix in memo and not memo[prefix][1]:
+                    values = memo[prefix][0]
+                else:
+                    success, record = self.execute(synthesizer, program, test_code, iter(prefix))
+                    budget -= 1
+                    if synthesizer.logging:
+                        synthesizer.log(f'--({synthesizer.k - budget}/{synthesizer.k})->',
+                                        '✓' if success else '✗', record.values)
+                    values = record.values
+                    memo[prefix] = memo[values] = (values, success)
+                    if success:
+                        return True, record
+
+                # flip each default `False` after the prefix, latest first
+                for j in reversed(range(len(prefix), len(values))):
+                    if not values[j]:
+                        next_level[values[:j] + (True,)] = None
+
+            level = list(next_level)[:self.width]
+
+        success, record = self.execute(synthesizer, program, test_code, all_true())
+        if synthesizer.logging:
+            synthesizer.log('--(all true)->', '✓' if success else '✗', record.values)
+        return success, record
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_condition(text: str) -> CodeType:
+    """Compile a condition to a code object for `eval`.
+    Cached by the condition text, so it is shared by all synthesizers."""
+    return compile(text, '<condition>', 'eval')
 
 
 def no_log(self, *values: object) -> None:
@@ -1,19 +1,157 @@
+import array
 import ast
 import copy
-from types import CodeType
-from typing import Any, Iterator, List, Tuple
+import hashlib
+import itertools
+import marshal
+import pickle
+import random
+import reprlib
+import signal
+import sys
+import threading
+import time
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from types import CodeType, FrameType
+from typing import (Any, BinaryIO, Callable, ContextManager, Dict, FrozenSet, Iterable, Iterator,
+                    List, Optional, Set, Tuple)
 
 Env: type = dict[str, Any]
 
+MISSING = object()  # absent variable in an env
+
 class Record:
     """Execution record.
-    The actual values and local envs for each evaluation of the abstract condition."""
+    The actual values and local envs for each evaluation of the abstract condition.
+    Stored column-wise: the values in a bit array, and the envs as one column per variable
+    (with `MISSING` where an env lacks the variable) plus the variable names of each env.
+    `values` and `envs` are read-only row views, built once until the record changes;
+    add to the record with `append` and `extend`, and do not mutate the envs."""
     def __init__(self, values: List[bool], envs: List[Env]):
-        self.values = values
-        self.envs = envs
+        self.length = 0
+        self.bits = bytearray()
+        self.columns: Dict[str, List[Any]] = {}
+        self.shapes: List[Tuple[str, ...]] = []     # distinct variable names of envs, in order
+        self.shape_ids: Dict[Tuple[str, ...], int] = {}
+        self.rows = array.array('I')                # shape of each env
+        self.cached_values: Optional[Tuple[bool, ...]] = None
+        self.cached_envs: Optional[Tuple[Env, ...]] = None
+
+        for value, env in zip(values, envs):
+            self.append(value, env)
+
+    def append(self, value: bool, env: Env) -> None:
+        """Add an evaluation of the abstract condition, in place."""
+        self.push_bit(self.length, value)
+        self.push_row(tuple(env), env)
+        self.length += 1
+        self.cached_values = self.cached_envs = None
+
+    def push_bit(self, i: int, value: bool) -> None:
+        if i & 7 == 0:
+            self.bits.append(0)
+        if value:
+            self.bits[i >> 3] |= 1 << (i & 7)
+
+    def push_row(self, shape: Tuple[str, ...], env: Env) -> None:
+        shape_id = self.shape_ids.get(shape)
+        if shape_id is None:
+            shape_id = self.shape_ids[shape] = len(self.shapes)
+            self.shapes.append(shape)
+        self.rows.append(shape_id)
+
+        for x, column in self.columns.items():
+            column.append(env.get(x, MISSING))
+        for x in shape:
+            if x not in self.columns:
+                self.columns[x] = [MISSING] * self.length + [env[x]]
+
+    def extend(self, other: 'Record') -> None:
+        """Merge `other` into this record, in place."""
+        if other is self:
+            other = Record(self.values, self.envs)
+
+        for i in range(other.length):
+            self.push_bit(self.length + i, other.value(i))
+
+        for x, column in self.columns.items():
+            column.extend(other.columns.get(x, [MISSING] * other.length))
+        for x, column in other.columns.items():
+            if x not in self.columns:
+                self.columns[x] = [MISSING] * self.length + column
+
+        for shape_id in other.rows:
+            shape = other.shapes[shape_id]
+            if shape not in self.shape_ids:
+                self.shape_ids[shape] = len(self.shapes)
+                self.shapes.append(shape)
+            self.rows.append(self.shape_ids[shape])
+
+        self.length += other.length
+        self.cached_values = self.cached_envs = None
+
+    def value(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] >> (i & 7) & 1)
+
+    def env(self, i: int) -> Env:
+        return {x: self.columns[x][i] for x in self.shapes[self.rows[i]]}
+
+    @property
+    def values(self) -> Tuple[bool, ...]:
+        if self.cached_values is None:
+            self.cached_values = tuple(self.value(i) for i in range(self.length))
+        return self.cached_values
+
+    @property
+    def envs(self) -> Tuple[Env, ...]:
+        if self.cached_envs is None:
+            self.cached_envs = tuple(self.env(i) for i in range(self.length))
+        return self.cached_envs
+
+    def __len__(self) -> int:
+        return self.length
 
     def __add__(self, other):
-        return Record(self.values + other.values, self.envs + other.envs)
+        record = Record([], [])
+        record.extend(self)
+        record.extend(other)
+        return record
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def dump(self, fp: BinaryIO) -> None:
+        """Write the record to the binary file `fp`, compressed."""
+        state = (self.length, bytes(self.bits), self.shapes, self.rows.tobytes(),
+                 {x: [None if v is MISSING else v for v in column]
+                  for x, column in self.columns.items()})
+        fp.write(RECORD_MAGIC)
+        fp.write(zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    @classmethod
+    def load(cls, fp: BinaryIO) -> 'Record':
+        """Read a record written by `dump` from the binary file `fp`.
+        The values are unpickled, which can run arbitrary code: only load trusted files."""
+        if fp.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError('not a record file')
+        length, bits, shapes, rows, columns = pickle.loads(zlib.decompress(fp.read()))
+
+        record = cls([], [])
+        record.length = length
+        record.bits = bytearray(bits)
+        record.shapes = shapes
+        record.shape_ids = {shape: i for i, shape in enumerate(shapes)}
+        record.rows.frombytes(rows)
+        # `None` is ambiguous in columns: an env defines a variable iff its shape lists it
+        record.columns = {x: [MISSING] * length for x in columns}
+        for i in range(length):
+            for x in shapes[record.rows[i]]:
+                record.columns[x][i] = columns[x][i]
+        return record
 
     def __repr__(self) -> str:
         s = ''
@@ -23,17 +161,236 @@ class Record:
             s += f' under env {env}\n'
         return s
 
+RECORD_MAGIC = b'REC1'
+
+class BoundedRepr(reprlib.Repr):
+    """A `repr` looking at a bounded number of items at a bounded depth, so it takes the same
+    time however large the value. Unlike `reprlib.repr`, dicts and sets are not sorted."""
+    def __init__(self) -> None:
+        super().__init__()
+        self.maxlevel = 3
+        self.maxtuple = self.maxlist = self.maxarray = self.maxdict = 16
+        self.maxset = self.maxfrozenset = self.maxdeque = 16
+        self.maxstring = self.maxlong = self.maxother = 256
+
+    def repr_items(self, items: Iterable[str], size: int, maxitems: int,
+                   left: str, right: str) -> str:
+        shown = list(itertools.islice(items, maxitems))
+        return left + ', '.join(shown) + (', ...' if size > maxitems else '') + right
+
+    def repr_dict(self, x: dict, level: int) -> str:
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{...}'
+        items = (f'{self.repr1(k, level - 1)}: {self.repr1(v, level - 1)}' for k, v in x.items())
+        return self.repr_items(items, len(x), self.maxdict, '{', '}')
+
+    def repr_set(self, x: set, level: int) -> str:
+        if not x:
+            return 'set()'
+        if level <= 0:
+            return '{...}'
+        items = (self.repr1(v, level - 1) for v in x)
+        return self.repr_items(items, len(x), self.maxset, '{', '}')
+
+    def repr_frozenset(self, x: frozenset, level: int) -> str:
+        if not x:
+            return 'frozenset()'
+        if level <= 0:
+            return 'frozenset({...})'
+        items = (self.repr1(v, level - 1) for v in x)
+        return self.repr_items(items, len(x), self.maxfrozenset, 'frozenset({', '})')
+
+bounded_repr = BoundedRepr().repr
+
+class Summary:
+    """Hashed summary of a large value: its type, its length (if any) and a digest of a bounded
+    `repr` of its contents, so summarizing takes the same time however large the value.
+    Summaries of equal contents compare equal, and `len` works on them; values differing only
+    past the first items of the same length share a summary."""
+    __slots__ = ('type', 'length', 'digest')
+
+    def __init__(self, value: Any) -> None:
+        self.type = type(value).__name__
+        try:
+            self.length = len(value)
+        except TypeError:
+            self.length = None
+        try:
+            text = bounded_repr(value)
+        except Exception:
+            text = object.__repr__(value)
+        self.digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def __len__(self) -> int:
+        if self.length is None:
+            raise TypeError(f"object of type '{self.type}' has no len()")
+        return self.length
+
+    def __eq__(self, other: object) -> bool:
+        return (isinstance(other, Summary) and self.type == other.type
+                and self.length == other.length and self.digest == other.digest)
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f'<{self.type} {self.digest[:8]}>'
+
+class Snapshot:
+    """Snapshot policy: how local envs are captured into the record.
+    The default takes a full deep copy."""
+    def capture(self, env: Env) -> Env:
+        return copy.deepcopy(env)
+
+class CompactSnapshot(Snapshot):
+    """Capture only values the solver and templates can reference: scalars and small tuples of
+    scalars are kept as they are (they are immutable), variables in `allowlist` are deep-copied,
+    and anything else is replaced by its `Summary`."""
+    def __init__(self, allowlist: Iterable[str] = (), max_tuple: int = 8) -> None:
+        self.allowlist = frozenset(allowlist)
+        self.max_tuple = max_tuple
+
+    def is_small(self, value: Any) -> bool:
+        if isinstance(value, tuple):
+            return len(value) <= self.max_tuple and all(self.is_small(v) for v in value)
+        return type(value) in (bool, int, float, str, type(None))
+
+    def capture(self, env: Env) -> Env:
+        snapshot = {}
+        for x, v in env.items():
+            if x in self.allowlist:
+                snapshot[x] = copy.deepcopy(v)
+            elif self.is_small(v):
+                snapshot[x] = v
+            else:
+                snapshot[x] = Summary(v)
+        return snapshot
+
+# once a run is past its timeout, the alarm is raised again this often, in seconds
+ALARM_INTERVAL = 0.05
+
+class LimitExceeded(BaseException):
+    """Raised in a run that exceeds its `Limits`.
+    Not an `Exception`, so `except Exception` in the program under test does not catch it."""
+
+class Limits:
+    """Execution limits of a single test run: wall-clock `timeout` in seconds, maximum number of
+    abstract condition evaluations `max_values`, and maximum number of executed lines `max_lines`.
+    `None` means unlimited. A run that hits a limit counts as failed."""
+    def __init__(self, timeout: Optional[float] = None, max_values: Optional[int] = None,
+                 max_lines: Optional[int] = None) -> None:
+        self.timeout = timeout
+        self.max_values = max_values
+        self.max_lines = max_lines
+
+    def __repr__(self) -> str:
+        return f'Limits({self.timeout!r}, {self.max_values!r}, {self.max_lines!r})'
+
+    @contextmanager
+    def enforce(self, on_line: Callable[[FrameType], None] = None) -> Iterator[None]:
+        """Enforce `timeout` and `max_lines` on the code run inside, by tracing line events,
+        which are also passed to `on_line` if given.
+        In the main thread, the `timeout` is enforced by an alarm signal, which interrupts long
+        calls into C too and is raised again every `ALARM_INTERVAL` seconds until the run ends,
+        so a program catching `LimitExceeded` with a bare `except` cannot escape it. Elsewhere,
+        the clock is checked on every call and line instead."""
+        alarm = (self.timeout is not None and hasattr(signal, 'setitimer')
+                 and threading.current_thread() is threading.main_thread())
+        if alarm:
+            with self.alarm(), self.trace(None, on_line):
+                yield
+        else:
+            with self.trace(self.timeout, on_line):
+                yield
+
+    @contextmanager
+    def alarm(self) -> Iterator[None]:
+        def interrupt(signum, frame):
+            raise LimitExceeded(f'timeout after {self.timeout}s')
+
+        start = time.monotonic()
+        old_handler = signal.signal(signal.SIGALRM, interrupt)
+        old_delay, old_interval = signal.setitimer(signal.ITIMER_REAL, self.timeout,
+                                                   ALARM_INTERVAL)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+            if old_delay:  # an enclosing alarm, resumed with the time it has left
+                left = old_delay - (time.monotonic() - start)
+                signal.setitimer(signal.ITIMER_REAL, max(left, ALARM_INTERVAL), old_interval)
+
+    @contextmanager
+    def trace(self, timeout: Optional[float],
+              on_line: Callable[[FrameType], None] = None) -> Iterator[None]:
+        if timeout is None and self.max_lines is None and on_line is None:
+            yield
+            return
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        max_lines = self.max_lines
+        lines = 0
+
+        def trace_lines(frame, event, arg):
+            nonlocal lines
+            if event == 'line':
+                lines += 1
+                if on_line is not None:
+                    on_line(frame)
+                if max_lines is not None and lines > max_lines:
+                    raise LimitExceeded(f'more than {max_lines} lines')
+                if deadline is not None and time.monotonic() > deadline:
+                    raise LimitExceeded(f'timeout after {timeout}s')
+            return trace_lines
+
+        def trace_calls(frame, event, arg):
+            if deadline is not None and time.monotonic() > deadline:
+                raise LimitExceeded(f'timeout after {timeout}s')
+            return trace_lines
+
+        old_trace = sys.gettrace()
+        sys.settrace(trace_calls)
+        try:
+            yield
+        finally:
+            sys.settrace(old_trace)
+
+def enforce(limits: Optional[Limits]) -> ContextManager[None]:
+    return limits.enforce() if limits is not None else nullcontext()
+
+def exec_module(program_code: Any, env: Dict[str, Any], limits: Limits = None,
+                on_line: Callable[[FrameType], None] = None) -> bool:
+    """Run the module level of a program into `env`, within the `limits`, passing line events
+    to `on_line` if given. Return if it succeeds; if not, every test of the program fails."""
+    if on_line is not None:
+        context = (limits if limits is not None else Limits()).enforce(on_line)
+    else:
+        context = enforce(limits)
+    try:
+        with context:
+            exec(program_code, env)
+    except (Exception, LimitExceeded):
+        return False
+    return True
+
 class Context:
     """Execution context.
     Obtain values for the abstract condition and maintain records."""
-    def __init__(self, future_values: Iterator[bool]):
+    def __init__(self, future_values: Iterator[bool], *, snapshot: Snapshot = None,
+                 max_values: Optional[int] = None):
         self.future_values = future_values
+        self.snapshot = snapshot if snapshot is not None else Snapshot()
+        self.max_values = max_values
         self.record = Record([], [])
 
     def next_value(self, env: Env) -> bool:
+        if self.max_values is not None and len(self.record) >= self.max_values:
+            raise LimitExceeded(f'more than {self.max_values} condition values')
         value = next(self.future_values, False)
-        self.record.values.append(value)
-        self.record.envs.append(copy.deepcopy(env))
+        self.record.append(value, self.snapshot.capture(env))
         return value
 
 def mk_expr(code: str) -> ast.expr:
@@ -57,50 +414,285 @@ class Instantiate(ast.NodeTransformer):
 
         return node
     
+class AbstractProgram:
+    """Abstract program prepared for repeated execution.
+    The abstract condition is instrumented and the tree compiled to a code object only once;
+    each `run` executes it with a fresh `Context`."""
+    def __init__(self, tree: ast.Module) -> None:
+        assert isinstance(tree, ast.Module)
+
+        tree = copy.deepcopy(tree)
+        the_expr = mk_expr(f'{THE_CONTEXT_OBJECT}.next_value(locals())')
+        tree = Instantiate(the_expr).visit(tree)
+        self.program_code = compile(ast.fix_missing_locations(tree), '<abstract>', 'exec')
+
+    def run(self, test_code: CodeType, future_values: Iterator[bool],
+            snapshot: Snapshot = None, limits: Limits = None) -> Tuple[bool, Record]:
+        """Run the `test` on this program, consuming condition values from `future_values`.
+        Envs are recorded according to the `snapshot` policy, and the run fails if it exceeds
+        its `limits`.
+        Return if the test succeeds together with the execution record."""
+        assert test_code.co_argcount == 0
+
+        max_values = limits.max_values if limits is not None else None
+        ctx = Context(future_values, snapshot=snapshot, max_values=max_values)
+        env = { THE_CONTEXT_OBJECT : ctx }
+        try:
+            with enforce(limits):
+                exec(self.program_code, env)
+                exec(test_code, env)
+        except (Exception, LimitExceeded):
+            success = False
+        else:
+            success = True
+
+        return success, ctx.record
+
+_prepared: 'weakref.WeakKeyDictionary[ast.Module, AbstractProgram]' = weakref.WeakKeyDictionary()
+
+def prepare(tree: ast.Module) -> AbstractProgram:
+    """Get the prepared abstract program of `tree`, cached per tree object.
+    The tree must not be mutated after it has been prepared."""
+    program = _prepared.get(tree)
+    if program is None:
+        program = AbstractProgram(tree)
+        _prepared[tree] = program
+    return program
+
 def exec_abstract(tree: ast.Module, test_code: CodeType,
-                  future_values: Iterator[bool]) -> Tuple[bool, Record]:
+                  future_values: Iterator[bool], *, limits: Limits = None) -> Tuple[bool, Record]:
     """Run the `test` on a `tree` that involves an abstract condition,
     consuming condition values from `future_values`.
     Return if the test succeeds together with the execution record."""
-    assert test_code.co_argcount == 0
-    
-    tree = copy.deepcopy(tree)
-    the_expr = mk_expr(f'{THE_CONTEXT_OBJECT}.next_value(locals())')
-    tree = Instantiate(the_expr).visit(tree)
-    program_code = ast.unparse(tree)
-
-    ctx = Context(future_values)
-    env = { THE_CONTEXT_OBJECT : ctx }
-    try:
-        exec(program_code, env)
-        exec(test_code, env)
-    except Exception:
-        success = False
-    else:
-        success = True
-
-    return success, ctx.record
+    return prepare(tree).run(test_code, future_values, limits=limits)
 
 def all_true() -> Iterator[bool]:
     """Infinite stream of `True`s."""
     while True:
         yield True
 
-def run_tests(tree: ast.Module, tests: List[CodeType], failures: List[str] = None) -> bool:
-    """Check if `tree` is correct w.r.t. the tests.
-    Collect failure test case names in `failures` if provided."""
+def run_tests(tree: ast.Module, tests: Iterable[CodeType], failures: List[str] = None,
+              *, limits: Limits = None) -> bool:
+    """Check if `tree` is correct w.r.t. the tests, run in the order `tests` yields them.
+    Collect failure test case names in `failures` if provided.
+    A test exceeding the `limits` fails, and so does every test if the module does."""
     program_code = ast.unparse(tree)
 
     env = {}
-    exec(program_code, env)
+    if not exec_module(program_code, env, limits):
+        if failures is not None and isinstance(failures, list):
+            failures.extend(test_code.co_name for test_code in tests)
+        return False
     passed = True
 
     for test_code in tests:
         try:
-            exec(test_code, env)
-        except Exception:
+            with enforce(limits):
+                exec(test_code, env)
+        except (Exception, LimitExceeded):
             passed = False
             if failures is not None and isinstance(failures, list):
                 failures.append(test_code.co_name)
 
     return passed
+
+COVERED = '<covered>'  # file name of the program whose coverage is recorded
+
+class Coverage:
+    """The lines of a program executed by each test, and whether the test passes, recorded once
+    on the original `tree`. A candidate changing only a statement that a test does not execute
+    behaves on that test like the original.
+    `sample` is the number of such tests passing on the original that `select` adds anyway,
+    as a check on that assumption."""
+    def __init__(self, tree: ast.Module, tests: List[CodeType], *, limits: Limits = None,
+                 sample: int = 0, seed: int = 0) -> None:
+        self.tree = tree
+        self.sample = sample
+        self.seed = seed
+        self.lines: Dict[CodeType, FrozenSet[int]] = {}
+        self.passed: Dict[CodeType, bool] = {}
+        self.spans: Optional[Dict[int, range]] = None
+
+        limits = limits if limits is not None else Limits()
+        covered: Set[int] = set()
+
+        def on_line(frame: FrameType) -> None:
+            if frame.f_code.co_filename == COVERED:
+                covered.add(frame.f_lineno)
+
+        env = {}
+        if not exec_module(compile(tree, COVERED, 'exec'), env, limits, on_line):
+            for test_code in tests:  # none runs, so none covers anything
+                self.lines[test_code] = frozenset()
+                self.passed[test_code] = False
+            return
+        module_lines = frozenset(covered)  # executed on behalf of all tests
+
+        for test_code in tests:
+            covered = set(module_lines)
+            try:
+                with limits.enforce(on_line):
+                    exec(test_code, env)
+            except (Exception, LimitExceeded):
+                passed = False
+            else:
+                passed = True
+            self.lines[test_code] = frozenset(covered)
+            self.passed[test_code] = passed
+
+    def span(self, line_no: int) -> range:
+        """The lines of the statement starting on `line_no`."""
+        if self.spans is None:
+            self.spans = {}
+            for node in ast.walk(self.tree):
+                if isinstance(node, ast.stmt) and node.lineno not in self.spans:
+                    self.spans[node.lineno] = range(node.lineno, node.end_lineno + 1)
+        return self.spans.get(line_no, range(line_no, line_no + 1))
+
+    def covers(self, test_code: CodeType, line_no: int) -> bool:
+        """Does `test_code` execute the statement on `line_no`? Unknown tests are assumed to."""
+        if test_code not in self.lines:
+            return True
+        lines = self.lines[test_code]
+        return any(n in lines for n in self.span(line_no))
+
+    def select(self, tests: List[CodeType], line_no: int) -> List[CodeType]:
+        """The `tests` a candidate changing the statement on `line_no` must be run on:
+        those executing it, those failing on the original (they fail again), and a sample
+        of `self.sample` others. The order of `tests` is kept."""
+        selected, others = [], []
+        for i, test_code in enumerate(tests):
+            if self.covers(test_code, line_no) or not self.passed[test_code]:
+                selected.append(i)
+            else:
+                others.append(i)
+
+        if self.sample and others:
+            rng = random.Random(self.seed * 1000003 + line_no)
+            selected += rng.sample(others, min(self.sample, len(others)))
+        return [tests[i] for i in sorted(selected)]
+
+class ValidationScheduler:
+    """Validate candidates against `tests`, running the tests that failed most often on earlier
+    candidates first and stopping at the first failure.
+    With the `coverage` of the original program, a candidate that changes only the statement on
+    `line_no` is not run on the tests that do not execute it: their outcome is known."""
+    def __init__(self, tests: List[CodeType], coverage: Coverage = None,
+                 *, limits: Limits = None) -> None:
+        self.tests = tests
+        self.coverage = coverage
+        self.limits = limits
+        self.runs = [0] * len(tests)
+        self.failures = [0] * len(tests)
+        self.executions = 0  # tests run
+        self.reused = 0  # passes taken from the coverage instead of running
+
+    def failure_rate(self, i: int) -> float:
+        # Laplace estimate, so tests never run are tried before tests known to pass
+        return (self.failures[i] + 1) / (self.runs[i] + 2)
+
+    def order(self) -> List[int]:
+        """Test indices, most likely to fail first; ties keep the order of `tests`."""
+        return sorted(range(len(self.tests)), key=lambda i: -self.failure_rate(i))
+
+    def run(self, tree: ast.Module, line_no: Optional[int] = None) -> bool:
+        """Check if `tree` is correct w.r.t. the tests. If `line_no` is given, `tree` must
+        differ from the original program of the `coverage` only in the statement on that line."""
+        order = self.order()
+        if self.coverage is not None and line_no is not None:
+            selected = []
+            for i in order:
+                test_code = self.tests[i]
+                if self.coverage.covers(test_code, line_no):
+                    selected.append(i)
+                elif not self.coverage.passed[test_code]:
+                    return False  # fails like on the original program
+                else:
+                    self.reused += 1
+            order = selected
+
+        env = {}
+        if not exec_module(ast.unparse(tree), env, self.limits):
+            return False
+        for i in order:
+            self.runs[i] += 1
+            self.executions += 1
+            try:
+                with enforce(self.limits):
+                    exec(self.tests[i], env)
+            except (Exception, LimitExceeded):
+                self.failures[i] += 1
+                return False
+
+        return True
+
+def run_test_isolated(program_code: bytes, test_code: bytes,
+                      limits: Limits = None) -> Tuple[bool, float]:
+    """Run a marshalled test against a marshalled program in a fresh namespace.
+    Return if the test succeeds within the `limits` together with its wall time in seconds."""
+    env = {}
+    start = time.perf_counter()
+    try:
+        with enforce(limits):
+            exec(marshal.loads(program_code), env)
+            exec(marshal.loads(test_code), env)
+    except (Exception, LimitExceeded):
+        passed = False
+    else:
+        passed = True
+
+    return passed, time.perf_counter() - start
+
+class ParallelRunner:
+    """Run tests on a pool of worker processes, each test in an isolated namespace.
+    The program and the tests are shipped to the workers as marshalled code objects."""
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self) -> 'ParallelRunner':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, tree: ast.Module, tests: List[CodeType], failures: List[str] = None,
+            timings: Dict[str, float] = None, stop_early: bool = False,
+            limits: Limits = None) -> bool:
+        """Check if `tree` is correct w.r.t. the tests.
+        Collect failure test case names in `failures` and the wall time of each test
+        in `timings` if provided.
+        If `stop_early`, stop at the first failure; `failures` then holds only that test.
+        A test exceeding the `limits` fails."""
+        program_code = marshal.dumps(compile(ast.unparse(tree), '<program>', 'exec'))
+        futures = {self.executor.submit(run_test_isolated, program_code, marshal.dumps(test_code),
+                                        limits): i
+                   for i, test_code in enumerate(tests)}
+
+        failed = []
+        for future in as_completed(futures):
+            i = futures[future]
+            passed, elapsed = future.result()
+            if timings is not None:
+                timings[tests[i].co_name] = elapsed
+            if not passed:
+                failed.append(i)
+                if stop_early:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+        if failures is not None and isinstance(failures, list):
+            failures.extend(tests[i].co_name for i in sorted(failed))
+
+        return not failed
+
+def run_tests_parallel(tree: ast.Module, tests: List[CodeType], failures: List[str] = None,
+                       timings: Dict[str, float] = None, workers: Optional[int] = None,
+                       stop_early: bool = False, limits: Limits = None) -> bool:
+    """Like `run_tests`, but run the tests in isolation on a temporary `ParallelRunner`."""
+    with ParallelRunner(workers) as runner:
+        return runner.run(tree, tests, failures=failures, timings=timings, stop_early=stop_early,
+                          limits=limits)
@@ -0,0 +1,41 @@
+import ast
+import inspect
+import io
+import json
+import unittest
+from repair.benchmarks.bench import SUBJECTS, run
+from repair.benchmarks.generated import SUITES
+from repair.metrics import JsonLinesExporter
+from repair.tester import run_tests
+
+class TestGeneratedSuites(unittest.TestCase):
+    def test_suite_sizes(self):
+        for subject, suite in SUITES.items():
+            with self.subTest(subject):
+                pos_tests, neg_tests = suite(10)
+                self.assertEqual(len(pos_tests) + len(neg_tests), 10)
+                self.assertEqual(len(neg_tests), 2)
+
+                tree = ast.parse(inspect.getsource(SUBJECTS[subject][0]))
+                self.assertTrue(run_tests(tree, pos_tests))
+                failures = []
+                run_tests(tree, neg_tests, failures)
+                self.assertEqual(len(failures), len(neg_tests))
+
+class TestBench(unittest.TestCase):
+    def test_run(self):
+        results = run(['list_sum'], [None, 10], ['default'], [5])
+        self.assertEqual([r['suite_size'] for r in results], [6, 10])
+        for r in results:
+            self.assertTrue(r['repaired'])
+            self.assertTrue(r['valid'])
+            self.assertGreater(r['executions'], 0)
+            self.assertGreater(r['templates'], 0)
+            self.assertIn('synthesis', r['timings'])
+            self.assertGreater(r['peak_memory'], 0)
+
+    def test_memory_run_not_reported(self):
+        fp = io.StringIO()
+        run(['list_sum'], [None], ['default'], [5], JsonLinesExporter(fp))
+        events = [json.loads(line)['event'] for line in fp.getvalue().splitlines()]
+        self.assertEqual(events.count('repair'), 1)
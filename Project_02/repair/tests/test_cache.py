@@ -0,0 +1,103 @@
+import ast
+import inspect
+import os
+import pickle
+import tempfile
+import unittest
+from repair.benchmarks import list_sum, list_sum_tests
+from repair.benchmarks.utils import get_positive_tests, get_negative_tests
+from repair.cache import RepairCache
+from repair.mutator import Break, Tighten
+from repair.repairer import Repairer
+from repair.synthesizer import FlipSearch, PrefixSearch
+
+class TestRepairCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = RepairCache(self.directory.name)
+        self.tree = ast.parse(inspect.getsource(list_sum))
+        self.pos_tests = get_positive_tests(list_sum_tests)
+        self.neg_tests = get_negative_tests(list_sum_tests)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def repairer(self, **kwargs) -> Repairer:
+        return Repairer(self.tree, 4, self.pos_tests, self.neg_tests, cache=self.cache, **kwargs)
+
+    def test_hit(self):
+        first = self.repairer()
+        self.assertTrue(first.repair())
+        self.assertEqual(self.cache.misses, 1)
+
+        second = self.repairer()
+        self.assertTrue(second.repair())
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(second.attempts, 0)
+        self.assertEqual(ast.unparse(second.new_tree), ast.unparse(first.new_tree))
+        self.assertEqual(ast.unparse(second.condition), ast.unparse(first.condition))
+        self.assertEqual(second.line_no, 4)
+        self.assertTrue(second.validate())
+
+    def test_validate_cached(self):
+        self.assertTrue(self.repairer().repair())
+        r = self.repairer(validate_cached=True)
+        self.assertTrue(r.repair())
+        self.assertEqual(r.attempts, 0)
+
+        # a stale entry, here the unrepaired program, is rejected and repaired again
+        key = RepairCache.key(self.tree, self.pos_tests, self.neg_tests, r.cache_params())
+        self.cache.put(key, self.tree, r.condition, r.line_no)
+        stale = self.repairer(validate_cached=True)
+        self.assertTrue(stale.repair())
+        self.assertGreater(stale.attempts, 0)
+        self.assertNotEqual(ast.unparse(stale.new_tree), ast.unparse(self.tree))
+        self.assertTrue(stale.validate())
+
+    def test_unreadable_entry(self):
+        r = self.repairer()
+        key = RepairCache.key(self.tree, self.pos_tests, self.neg_tests, r.cache_params())
+        os.makedirs(os.path.dirname(self.cache.path(key)))
+        with open(self.cache.path(key), 'wb') as fp:
+            pickle.dump('not an entry', fp)
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_key(self):
+        params = (4, 10)
+        key = RepairCache.key(self.tree, self.pos_tests, self.neg_tests, params)
+        self.assertEqual(key, RepairCache.key(ast.parse(inspect.getsource(list_sum)),
+                                              self.pos_tests, self.neg_tests, params))
+        self.assertNotEqual(key, RepairCache.key(self.tree, self.pos_tests, self.neg_tests, (4, 5)))
+        self.assertNotEqual(key, RepairCache.key(self.tree, self.pos_tests[1:], self.neg_tests,
+                                                 params))
+        self.assertNotEqual(key, RepairCache.key(self.tree, self.neg_tests, self.pos_tests, params))
+
+    def test_miss_on_other_params(self):
+        self.assertTrue(self.repairer().repair())
+        r = self.repairer(k=5)
+        self.assertTrue(r.repair())
+        self.assertEqual(self.cache.hits, 0)
+        self.assertGreater(r.attempts, 0)
+
+    def test_params(self):
+        params = self.repairer().cache_params()
+        self.assertEqual(params, self.repairer(strategy=FlipSearch()).cache_params())
+        self.assertEqual(self.repairer(strategy=PrefixSearch(width=2)).cache_params(),
+                         self.repairer(strategy=PrefixSearch(width=2,
+                                                             memo_programs=8)).cache_params())
+        others = [self.repairer(strategy=PrefixSearch(width=2)).cache_params(),
+                  self.repairer(strategy=PrefixSearch(width=3)).cache_params(),
+                  self.repairer(schedule=True).cache_params(),
+                  self.repairer(ops=[Break(True)]).cache_params(),
+                  self.repairer(ops=[Break(False)]).cache_params(),
+                  self.repairer(ops=[Scaled(2)]).cache_params(),
+                  self.repairer(ops=[Scaled(3)]).cache_params()]
+        self.assertEqual(len(set(map(repr, [params] + others))), len(others) + 1)
+
+
+class Scaled(Tighten):
+    """A custom operator with a parameter."""
+    def __init__(self, factor: int) -> None:
+        super().__init__()
+        self.factor = factor
@@ -0,0 +1,76 @@
+import ast
+import contextlib
+import inspect
+import io
+import json
+import unittest
+from repair.benchmarks import char_index, char_index_tests
+from repair.benchmarks.utils import get_positive_tests, get_negative_tests
+from repair.metrics import *
+from repair.repairer import Repairer
+
+class TestMetrics(unittest.TestCase):
+    def repair(self, metrics: Metrics, **kwargs) -> Repairer:
+        tree = ast.parse(inspect.getsource(char_index))
+        r = Repairer(tree, 9, get_positive_tests(char_index_tests),
+                     get_negative_tests(char_index_tests), metrics=metrics, check_candidates=True,
+                     **kwargs)
+        self.assertTrue(r.repair())
+        return r
+
+    def test_counters(self):
+        metrics = Metrics()
+        r = self.repair(metrics)
+        self.assertEqual(metrics.counters['templates'], r.attempts)
+        self.assertGreater(metrics.counters['solver_candidates'], 0)
+        self.assertEqual(metrics.counters['executions'], sum(metrics.executions.values()))
+        self.assertIn('test_3', metrics.executions)
+        self.assertEqual({'search', 'positive', 'solve', 'synthesis', 'validation'},
+                         set(metrics.timings))
+
+    def test_parallel(self):
+        """The metrics of syntheses in worker processes are merged."""
+        metrics = Metrics()
+        self.repair(metrics)
+        parallel = Metrics()
+        self.repair(parallel, parallel=True)
+        for name in ['templates', 'executions', 'solver_candidates', 'sat_calls']:
+            self.assertEqual(parallel.counters[name], metrics.counters[name], name)
+        self.assertEqual(parallel.executions, metrics.executions)
+        self.assertEqual(set(parallel.timings), set(metrics.timings))
+
+    def test_mutation_events(self):
+        fp = io.StringIO()
+        metrics = Metrics(JsonLinesExporter(fp))
+        tree = ast.parse(inspect.getsource(char_index))
+        r = Repairer(tree, 9, get_positive_tests(char_index_tests),
+                     get_negative_tests(char_index_tests), log=True, metrics=metrics)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(r.repair())
+
+        events = [json.loads(line) for line in fp.getvalue().splitlines()]
+        mutations = [e for e in events if e['event'] == 'mutation']
+        self.assertTrue(mutations)
+        self.assertTrue(all(e['line'] == 9 for e in mutations))
+        applied = [e for e in mutations if e['applied']]
+        self.assertEqual(len(applied), metrics.counters['templates'])
+        self.assertTrue(all('__abstract__' in e['template'] for e in applied))
+
+    def test_json_lines(self):
+        fp = io.StringIO()
+        metrics = Metrics(JsonLinesExporter(fp), run=1)
+        self.repair(metrics)
+        metrics.close()
+
+        events = [json.loads(line) for line in fp.getvalue().splitlines()]
+        self.assertTrue(all(e['run'] == 1 for e in events))
+        kinds = [e['event'] for e in events]
+        self.assertIn('candidate', kinds)
+        self.assertEqual(kinds[-2:], ['repair', 'summary'])
+        self.assertTrue(events[-2]['fixed'])
+        self.assertEqual(events[-1]['counters'], dict(metrics.counters))
+
+    def test_disabled(self):
+        self.repair(NO_METRICS)
+        self.assertFalse(NO_METRICS.enabled)
+        self.assertEqual(NO_METRICS.summary(), {'counters': {}, 'executions': {}, 'timings': {}})
@@ -1,7 +1,10 @@
 from abc import abstractmethod
 import ast
+import contextlib
 import inspect
+import io
 import unittest
+import weakref
 from typing import List, Optional
 from textwrap import dedent
 from repair.mutator import *
@@ -474,3 +477,136 @@ class TestMutatorCharIndex(TestMutator):
 
     def test_mutate_char_index_break(self):
         self.assert_contains_line('break', 10)
+
+class TestMutatorSemicolon(TestMutator):
+    source = """\
+        def foo(xs):
+            for x in xs:
+                a = 1; b = 2
+    """
+    line_no = 3
+
+    def test_mutate_semicolon_mutants_count(self):
+        self.assertEqual(len(self.results), 3)
+
+    def test_mutate_semicolon_guard(self):
+        self.assert_contains_line('if not __abstract__:', 3)
+        self.assert_contains_line('if not __abstract__:', 5)
+
+    def test_mutate_semicolon_break(self):
+        self.assert_contains_line('break', 4)
+
+class TestMutatorSharing(unittest.TestCase):
+    source = """\
+        def foo(xs):
+            for x in xs:
+                if x:
+                    x += 1
+            return xs
+
+        def bar():
+            pass
+    """
+
+    def test_templates_share_untouched_subtrees(self):
+        mutator = Mutator(ast.parse(dedent(self.source)), 3)
+        marked_source = ast.unparse(mutator.marked_tree)
+        templates = list(mutator.apply())
+        self.assertEqual(len(templates), 4)
+        self.assertEqual(ast.unparse(mutator.marked_tree), marked_source)
+        for template in templates:
+            self.assertIs(template.body[1], mutator.marked_tree.body[1])  # bar
+            self.assertIs(template.body[0].body[1], mutator.marked_tree.body[0].body[1])  # return
+
+    def test_custom_operator_fallback(self):
+        class Negate(MutationOperator):
+            def visit_If(self, node):
+                if hasattr(node, '__target__'):
+                    node.test = ast.UnaryOp(ast.Not(), node.test)
+                    self.mutated = True
+                return node
+
+        mutator = Mutator(ast.parse(dedent(self.source)), 3)
+        templates = [ast.unparse(tree) for tree in mutator.apply([Negate()])]
+        self.assertEqual(len(templates), 1)
+        self.assertIn('if not x:', templates[0])
+
+    def test_log(self):
+        out = io.StringIO()
+        mutator = Mutator(ast.parse(dedent(self.source)), 3, log=True)
+        with contextlib.redirect_stdout(out):
+            templates = [ast.unparse(tree) for tree in mutator.apply([Tighten(), Break(False)])]
+        self.assertEqual(len(templates), 1)
+        self.assertEqual(out.getvalue(), f'-> Tighten ✓\n{templates[0]}\n-> Break ✗\n')
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            list(Mutator(ast.parse(dedent(self.source)), 3).apply())
+        self.assertEqual(out.getvalue(), '')
+
+class TestLineIndex(unittest.TestCase):
+    source = """\
+        def foo(xs):
+            for x in xs:
+                try:
+                    a = 1
+                except ValueError:
+                    b = 2
+            while True:
+                if a: c = 3
+                elif b:
+                    d = 4
+                e = 5; f = 6
+    """
+
+    def test_mark_as_marker(self):
+        tree = ast.parse(dedent(self.source))
+        index = Marker.index(tree)
+        for line_no in range(1, 13):
+            marker = Marker(line_no)
+            marked = marker.visit(copy.deepcopy(tree))
+            self.assertEqual(line_no in index, marker.found)
+            if not marker.found:
+                continue
+
+            root, paths = index.mark(line_no)
+            expected = [(node.lineno, node.__target__) for node in ast.walk(marked)
+                        if hasattr(node, '__target__')]
+            actual = [(node.lineno, node.__target__) for node in ast.walk(root)
+                      if hasattr(node, '__target__')]
+            self.assertEqual(actual, expected, f'line {line_no}')
+
+        locator = TargetLocator()
+        locator.visit(tree)
+        self.assertFalse(locator.found)
+
+    def test_lookup(self):
+        tree = ast.parse(dedent(self.source))
+        node, parent, field, i, loop_depth = Marker.index(tree).lookup(6)
+        self.assertIsInstance(node, ast.Assign)
+        self.assertIsInstance(parent, ast.ExceptHandler)
+        self.assertEqual((field, i, loop_depth), ('body', 0, 1))
+
+    def test_index_cached(self):
+        tree = ast.parse(dedent(self.source))
+        self.assertIs(Marker.index(tree), Marker.index(tree))
+
+    def test_index_released(self):
+        tree = ast.parse(dedent(self.source))
+        index = weakref.ref(Marker.index(tree))
+        del tree
+        self.assertIsNone(index())
+
+    def test_index_invalidated(self):
+        tree = ast.parse(dedent(self.source))
+        index = Marker.index(tree)
+        self.assertTrue(index.is_current(4))
+        try_stmt = tree.body[0].body[0].body[0]
+        try_stmt.body = [ast.Pass(lineno=4, col_offset=12, end_lineno=4, end_col_offset=16)]
+        self.assertFalse(index.is_current(4))
+
+        mutator = Mutator(tree, 4)
+        self.assertIsNot(Marker.index(tree), index)
+        self.assertIsInstance(path_child(mutator.paths[0][-1]), ast.Pass)
+        invalidate_index(tree)
+        self.assertIsNot(Marker.index(tree), index)
@@ -1,8 +1,14 @@
 import ast
 import inspect
+import multiprocessing
+import multiprocessing.pool
 import unittest
+from textwrap import dedent
+from unittest import mock
 from repair.benchmarks.utils import get_positive_tests, get_negative_tests
 from repair.repairer import Repairer
+from repair.synthesizer import PrefixSearch, Template
+from repair.tester import Limits, ParallelRunner
 
 class TestRepairer(unittest.TestCase):
     def repair(self, input_module, line_no: int, test_module):
@@ -35,4 +41,194 @@ class TestRepairer(unittest.TestCase):
 
     def test_repair_scan_integers_alter(self):
         from repair.benchmarks import scan_integers, scan_integers_tests
-        self.repair(scan_integers, 7, scan_integers_tests)
\ No newline at end of file
+        self.repair(scan_integers, 7, scan_integers_tests)
+
+    def test_repair_list_sum_parallel_validation(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        r = Repairer(tree, [2, 4], get_positive_tests(list_sum_tests),
+                     get_negative_tests(list_sum_tests), workers=2)
+        runners = []
+        class CountingRunner(ParallelRunner):
+            def __init__(self, workers):
+                super().__init__(workers)
+                runners.append(self)
+
+        with mock.patch('repair.repairer.ParallelRunner', CountingRunner):
+            self.assertTrue(r.repair())
+        self.assertGreater(r.attempts, 1)
+        self.assertEqual(len(runners), 1)  # one pool for all candidates
+        self.assertIsNone(r.runner)
+
+        failures = []
+        self.assertTrue(r.validate(failures=failures), f'test cases {failures} failed')
+        self.assertTrue(r.validate())
+
+    def test_repair_scan_integers_limits(self):
+        from repair.benchmarks import scan_integers, scan_integers_tests
+        tree = ast.parse(inspect.getsource(scan_integers))
+        r = Repairer(tree, 12, get_positive_tests(scan_integers_tests),
+                     get_negative_tests(scan_integers_tests),
+                     limits=Limits(timeout=10, max_values=1000, max_lines=100000))
+        self.assertTrue(r.repair())
+        self.assertTrue(r.validate())
+
+    def test_repair_char_index_scheduled(self):
+        from repair.benchmarks import char_index, char_index_tests
+        tree = ast.parse(inspect.getsource(char_index))
+        r = Repairer(tree, 9, get_positive_tests(char_index_tests),
+                     get_negative_tests(char_index_tests), schedule=True)
+        self.assertTrue(r.repair())
+        self.assertTrue(r.validate())
+        self.assertGreater(r.scheduler.executions, 0)
+
+    def test_repair_list_sum_coverage(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        r = Repairer(tree, 4, get_positive_tests(list_sum_tests),
+                     get_negative_tests(list_sum_tests), coverage_sample=2)
+        self.assertTrue(r.repair())
+        self.assertTrue(r.validate())
+
+    def test_repair_module_fails(self):
+        """A module that fails to run fails every test, also with a coverage."""
+        from repair.benchmarks import list_sum, list_sum_tests
+        pos_tests = get_positive_tests(list_sum_tests)
+        neg_tests = get_negative_tests(list_sum_tests)
+        for module, limits in [('import no_such_module', None),
+                               ('while True:\n    pass', Limits(timeout=0.1))]:
+            tree = ast.parse(module + '\n' + inspect.getsource(list_sum))
+            line_no = 4 + module.count('\n') + 1
+            for options in [{'schedule': True}, {'coverage_sample': 2}]:
+                with self.subTest(module=module, **options):
+                    r = Repairer(tree, line_no, pos_tests, neg_tests, limits=limits, **options)
+                    self.assertFalse(r.repair())
+
+class TestRepairerParallel(unittest.TestCase):
+    def assert_same_repair(self, input_module, line_no: int, test_module):
+        tree = ast.parse(inspect.getsource(input_module))
+        pos_tests = get_positive_tests(test_module)
+        neg_tests = get_negative_tests(test_module)
+
+        sequential = Repairer(tree, line_no, pos_tests, neg_tests)
+        parallel = Repairer(tree, line_no, pos_tests, neg_tests, parallel=True)
+        self.assertTrue(sequential.repair())
+        self.assertTrue(parallel.repair())
+        self.assertEqual(ast.unparse(parallel.new_tree), ast.unparse(sequential.new_tree))
+        self.assertTrue(parallel.validate())
+
+    def test_repair_char_index(self):
+        from repair.benchmarks import char_index, char_index_tests
+        self.assert_same_repair(char_index, 9, char_index_tests)
+
+    def test_repair_scan_integers(self):
+        from repair.benchmarks import scan_integers, scan_integers_tests
+        self.assert_same_repair(scan_integers, 12, scan_integers_tests)
+
+    def test_terminate_running_syntheses(self):
+        tree = ast.parse(dedent("""\
+            def foo(x):
+                i = 0
+                while i < x:
+                    i += 1
+                return i
+        """))
+        def pos():
+            assert foo(2) == 2
+        def neg():
+            assert foo(5) == 3
+
+        # the first template is fixed by `i == 3`, while the search on the second, guarding
+        # `i += 1`, never terminates when it tries all `True`s without limits
+        r = Repairer(tree, 4, [pos.__code__], [neg.__code__], parallel=True)
+        self.assertTrue(r.repair())
+        self.assertEqual(ast.unparse(r.condition), 'i == 3')
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_repair_coverage(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        pos_tests = get_positive_tests(list_sum_tests)
+        neg_tests = get_negative_tests(list_sum_tests)
+        sequential = Repairer(tree, [2, 4], pos_tests, neg_tests, coverage_sample=0)
+        parallel = Repairer(tree, [2, 4], pos_tests, neg_tests, coverage_sample=0, parallel=True)
+        self.assertTrue(sequential.repair())
+        self.assertTrue(parallel.repair())
+        self.assertEqual(parallel.attempts, sequential.attempts)
+        self.assertEqual(ast.unparse(parallel.new_tree), ast.unparse(sequential.new_tree))
+
+    def test_repair_strategy_executions(self):
+        from repair.benchmarks import scan_integers, scan_integers_tests
+        tree = ast.parse(inspect.getsource(scan_integers))
+        strategy = PrefixSearch()
+        r = Repairer(tree, 12, get_positive_tests(scan_integers_tests),
+                     get_negative_tests(scan_integers_tests), strategy=strategy, parallel=True)
+        self.assertTrue(r.repair())
+        # counted in the workers
+        self.assertGreaterEqual(strategy.executions, len(get_negative_tests(scan_integers_tests)))
+
+    def test_repair_compiled_templates(self):
+        from repair.benchmarks import scan_integers, scan_integers_tests
+        tree = ast.parse(inspect.getsource(scan_integers))
+        pos_tests = get_positive_tests(scan_integers_tests)
+        neg_tests = get_negative_tests(scan_integers_tests)
+        templates = [Template.from_lambda('a: int, b: int => a > b')]
+
+        self.assertTrue(Repairer(tree, 12, pos_tests, neg_tests,
+                                 extra_templates=templates).repair())
+        self.assertIsNotNone(templates[0].compile())
+        # the same templates are shipped to the workers
+        parallel = Repairer(tree, 12, pos_tests, neg_tests, extra_templates=templates,
+                            parallel=True)
+        self.assertTrue(parallel.repair())
+        self.assertTrue(parallel.validate())
+
+class TestRepairerRanked(unittest.TestCase):
+    def test_repair_first_fixable_line(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        # line 5 holds no statement and line 2 cannot be fixed
+        r = Repairer(tree, [5, 2, 4, 6], get_positive_tests(list_sum_tests),
+                     get_negative_tests(list_sum_tests))
+        self.assertTrue(r.repair())
+        self.assertEqual(r.line_no, 4)
+        self.assertTrue(r.validate())
+
+    def test_repair_budget(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        r = Repairer(tree, [2, 4], get_positive_tests(list_sum_tests),
+                     get_negative_tests(list_sum_tests), budget=1)
+        self.assertFalse(r.repair())
+        self.assertEqual(r.attempts, 1)
+
+    def test_check_candidates(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        pos_tests = get_positive_tests(list_sum_tests)
+        neg_tests = get_negative_tests(list_sum_tests)
+        for line_no, checks in [(4, 0), ([4], 1)]:
+            with self.subTest(line_no=line_no):
+                r = Repairer(tree, line_no, pos_tests, neg_tests)
+                with mock.patch.object(Repairer, 'check', autospec=True,
+                                       side_effect=Repairer.check) as check:
+                    self.assertTrue(r.repair())
+                self.assertEqual(check.call_count, checks)
+                self.assertTrue(r.validate())
+
+    def test_repair_budget_parallel(self):
+        from repair.benchmarks import list_sum, list_sum_tests
+        tree = ast.parse(inspect.getsource(list_sum))
+        submitted = []
+        class CountingPool(multiprocessing.pool.Pool):
+            def apply_async(self, func, args=(), *rest, **kwargs):
+                submitted.append(args[0])
+                return super().apply_async(func, args, *rest, **kwargs)
+
+        # line 2 has one template and line 4 two, of which the budget leaves one
+        r = Repairer(tree, [2, 4], get_positive_tests(list_sum_tests),
+                     get_negative_tests(list_sum_tests), budget=2, parallel=True)
+        with mock.patch('multiprocessing.Pool', CountingPool):
+            r.repair()
+        self.assertEqual((r.attempts, len(submitted)), (2, 2))
+
@@ -1,4 +1,5 @@
 import ast
+import pickle
 from textwrap import dedent
 from typing import List
 import unittest
@@ -78,6 +79,33 @@ class TestSolveBasic(unittest.TestCase):
     def test_solve_unsat_4(self):
         self.unsat(Record([False, False, True],
                           [{'x': 1, 'y': 'A'}, {'x': 1, 'y': 'B'}, {'x': 1, 'y': 'A'}]))
+
+    def test_solve_condition_order(self):
+        synthesizer = Synthesizer(None, [], [])
+        self.assertTrue(synthesizer.solve(Record([False, True], [{'x': 1, 'y': 'A'},
+                                                                 {'x': 2, 'y': 'B'}])))
+        self.assertEqual(ast.unparse(synthesizer.condition), "x != 1")
+
+    def test_solve_unsat_missing_var(self):
+        self.unsat(Record([True, False], [{'x': 1}, {'y': 1}]))
+
+    def test_solve_non_plain_values(self):
+        self.sat(Record([True, False], [{'xs': [1]}, {'xs': [2]}])) # xs == [1]
+
+    def test_solve_many_constraints(self):
+        envs = [{'i': i, 'c': str(i % 7)} for i in range(5000)]
+        self.sat(Record([env['c'] != '3' for env in envs], envs)) # c != '3'
+
+class TestConstraintTable(unittest.TestCase):
+    def test_sat_compare(self):
+        table = ConstraintTable(Record([True, False, True],
+                                       [{'x': 1, 'y': [1]}, {'x': 2, 'y': [2]}, {'x': 1}]))
+        self.assertTrue(table.sat_compare('x', '==', 1))
+        self.assertFalse(table.sat_compare('x', '!=', 1))
+        self.assertTrue(table.sat_compare('x', '!=', 2))
+        self.assertFalse(table.sat_compare('y', '==', 1))  # undefined in the last env
+        self.assertIsNone(table.sat_compare('x', '==', [1]))
+
 class TestSolveTemplates(unittest.TestCase):
     def sat(self, constraints: Record, templates: Template | List[Template]):
         if isinstance(templates, Template):
@@ -129,6 +157,59 @@ class TestSolveTemplates(unittest.TestCase):
                            {'xs': [1, 2, 3], 'y': 2}]),
                    Template.from_lambda('(lst: list, k: int) => len(lst) == k'))
         
+    def test_solve_sat_permuted_vars(self):
+        self.sat(Record([False, True, False, True],
+                        [{'x': 1, 'y': 2}, {'x': 4, 'y': 3}, {'x': 3, 'y': 4}, {'x': 5, 'y': 4}]),
+                 Template.from_lambda('a: int, b: int => a < b')) # y < x
+
+    def test_solve_sat_subset_of_vars(self):
+        self.sat(Record([True, False], [{'s': 'A', 'x': 1, 'y': 2}, {'s': 'B', 'x': 3, 'y': 2}]),
+                 Template.from_lambda('a: int, b: int => a < b')) # x < y
+
+    def test_solve_unsat_wrong_type(self):
+        self.unsat(Record([True, False, True, False],
+                          [{'s': 'A', 't': 'B'}, {'s': 'C', 't': 'B'}, {'s': 'B', 't': 'C'},
+                           {'s': 'D', 't': 'C'}]),
+                   Template.from_lambda('a: int, b: int => a < b'))
+
+    def test_solve_sat_free_name(self):
+        self.sat(Record([True, False], [{'x': 1, 'y': 0}, {'x': 0, 'y': 1}]),
+                 Template.from_lambda('a: int => a > y'))
+
+class TestTemplateLibrary(unittest.TestCase):
+    def test_bindings(self):
+        constraints = Record([True, False], [{'xs': [1], 'k': 1, 'z': 2}, {'xs': [], 'k': 0}])
+        library = TemplateLibrary([])
+        bindings = library.bindings(Template.from_lambda('(lst: list, k: int) => len(lst) == k'),
+                                    ConstraintTable(constraints))
+        self.assertEqual(list(bindings), [('xs', 'k')])
+
+    def test_limit(self):
+        constraints = Record([True, False], [{'x': 1, 'y': 2}, {'x': 3, 'y': 2}])
+        library = TemplateLibrary([Template.from_lambda('a: int, b: int => a > b'),
+                                   Template.from_lambda('a: int, b: int => a < b')], limit=1)
+        self.assertIsNone(library.solve(constraints, ConstraintTable(constraints),
+                                        Synthesizer(None, [], []).sat))  # y > x not reached
+        self.assertEqual(library.checked, 1)
+
+    def test_dedup(self):
+        constraints = Record([True, False], [{'x': 1, 'y': 2}, {'x': 3, 'y': 2}])
+        library = TemplateLibrary([Template.from_lambda('a: int, b: int => a == b'),
+                                   Template.from_lambda('c: int, d: int => c == d')])
+        self.assertIsNone(library.solve(constraints, ConstraintTable(constraints),
+                                        Synthesizer(None, [], []).sat))
+        self.assertEqual(library.checked, 2)
+
+    def test_many_templates_and_constraints(self):
+        envs = [{'i': i, 'n': 1000, 'j': i % 10} for i in range(2000)]
+        constraints = Record([env['i'] * 2 >= env['n'] for env in envs], envs)
+        templates = [Template.from_lambda(f'a: int, b: int => a + {c} < b') for c in range(200)]
+        templates.append(Template.from_lambda('a: int, b: int => a * 2 >= b'))
+        library = TemplateLibrary(templates)
+        expression = library.solve(constraints, ConstraintTable(constraints),
+                                   Synthesizer(None, [], []).sat)
+        self.assertEqual(ast.unparse(expression), 'i * 2 >= n')
+
 class TestSynthesizer(object): # mixin class
     abstract_code: str
     pos_tests: List[CodeType]
@@ -199,3 +280,145 @@ class TestSynthesizerScanIntegers(TestSynthesizer, unittest.TestCase):
     from repair.benchmarks import scan_integers_tests
     pos_tests = get_positive_tests(scan_integers_tests)
     neg_tests = get_negative_tests(scan_integers_tests)
+
+class TestSynthesizerCoverage(unittest.TestCase):
+    abstract_code = """\
+        def foo(x):
+            if x < 0:
+                if __abstract__:
+                    return -x
+            return x
+    """
+
+    code = """\
+        def foo(x):
+            if x < 0:
+                return x
+            return x
+    """
+
+    def test_skip_uncovered(self):
+        def neg():
+            assert foo(-1) == 1
+        def pos():
+            assert foo(1) == 1
+        def pos_zero():
+            assert foo(0) == 0
+
+        tests = [neg.__code__, pos.__code__, pos_zero.__code__]
+        coverage = Coverage(ast.parse(dedent(self.code)), tests)
+        synthesizer = Synthesizer(ast.parse(dedent(self.abstract_code)),
+                                  [pos.__code__, pos_zero.__code__], [neg.__code__],
+                                  coverage=coverage, line_no=3)
+        self.assertTrue(synthesizer.covers(neg.__code__))
+        self.assertFalse(synthesizer.covers(pos.__code__))
+        self.assertTrue(synthesizer.apply())
+        self.assertTrue(synthesizer.validate())
+
+    def test_fail_uncovered_negative(self):
+        def neg():
+            assert foo(1) == 2
+        coverage = Coverage(ast.parse(dedent(self.code)), [neg.__code__])
+        synthesizer = Synthesizer(ast.parse(dedent(self.abstract_code)), [], [neg.__code__],
+                                  coverage=coverage, line_no=3, strategy=FlipSearch())
+        self.assertFalse(synthesizer.apply())
+        self.assertEqual(synthesizer.strategy.executions, 0)
+
+class TestSynthesizerRunner(unittest.TestCase):
+    def test_validate_on_shared_runner(self):
+        tree = ast.parse(dedent(TestSynthesizerListSum.abstract_code))
+        with ParallelRunner(1) as runner:
+            for _ in range(2):
+                synthesizer = Synthesizer(tree, TestSynthesizerListSum.pos_tests,
+                                          TestSynthesizerListSum.neg_tests, workers=1,
+                                          runner=runner)
+                self.assertTrue(synthesizer.apply())
+                self.assertTrue(synthesizer.validate())
+
+class TestCompileCondition(unittest.TestCase):
+    def test_compile_cached(self):
+        self.assertIs(compile_condition('x > 0'), compile_condition('x > 0'))
+        self.assertEqual(eval(compile_condition('x > 0'), {}, {'x': 1}), True)
+
+    def test_sat_reuses_compiled(self):
+        synthesizer = Synthesizer(None, [], [])
+        cond = Template.from_lambda('n: int => n >= 0').instantiate(['y'])
+        constraints = Record([True, False], [{'y': 0}, {'y': -1}])
+        self.assertTrue(synthesizer.sat(cond, constraints))
+        hits = compile_condition.cache_info().hits
+        self.assertTrue(Synthesizer(None, [], []).sat(cond, constraints))
+        self.assertEqual(compile_condition.cache_info().hits, hits + 1)
+
+    def test_sat_syntax_error(self):
+        # a condition built from a name that is not an identifier
+        cond = ast.Compare(ast.Name('not a name'), [ast.Eq()], [ast.Constant(1)])
+        self.assertFalse(Synthesizer(None, [], []).sat(cond, Record([True], [{'x': 1}])))
+
+class TestSynthesizerCompactSnapshot(TestSynthesizer, unittest.TestCase):
+    abstract_code = TestSynthesizerListSum.abstract_code
+    pos_tests = TestSynthesizerListSum.pos_tests
+    neg_tests = TestSynthesizerListSum.neg_tests
+
+    @classmethod
+    def setUpClass(cls):
+        tree = ast.parse(dedent(cls.abstract_code))
+        cls.synthesizer = Synthesizer(tree, cls.pos_tests, cls.neg_tests,
+                                      snapshot=CompactSnapshot())
+        cls.synthesizer.apply()
+
+class TestSearchStrategies(unittest.TestCase):
+    def synthesize(self, synthesizer_test, strategy: SearchStrategy) -> Synthesizer:
+        tree = ast.parse(dedent(synthesizer_test.abstract_code))
+        synthesizer = Synthesizer(tree, synthesizer_test.pos_tests, synthesizer_test.neg_tests,
+                                  strategy=strategy)
+        self.assertTrue(synthesizer.apply())
+        self.assertTrue(synthesizer.validate())
+        return synthesizer
+
+    def test_flip_search_executions(self):
+        strategy = FlipSearch()
+        self.synthesize(TestSynthesizerListSum, strategy)
+        self.assertGreaterEqual(strategy.executions, len(TestSynthesizerListSum.neg_tests))
+
+    def test_prefix_search(self):
+        for synthesizer_test in [TestSynthesizerCharIndex, TestSynthesizerListSum,
+                                 TestSynthesizerScanIntegers]:
+            with self.subTest(synthesizer_test.__name__):
+                self.synthesize(synthesizer_test, PrefixSearch())
+
+    def test_prefix_search_memo(self):
+        code = dedent(TestSynthesizerScanIntegers.abstract_code)
+        strategy = PrefixSearch(width=2)
+        pos_tests = TestSynthesizerScanIntegers.pos_tests
+        neg_tests = TestSynthesizerScanIntegers.neg_tests
+        synthesizer = Synthesizer(ast.parse(code), pos_tests, neg_tests, strategy=strategy)
+        self.assertTrue(synthesizer.apply())
+        executions = strategy.executions
+        # an equal template prepared again: sequences known to fail are not run again
+        synthesizer = Synthesizer(ast.parse(code), pos_tests, neg_tests, strategy=strategy)
+        self.assertTrue(synthesizer.apply())
+        self.assertLess(strategy.executions - executions, executions)
+        self.assertEqual(len(strategy.memo), len(neg_tests))
+
+    def test_prefix_search_memo_bounded(self):
+        strategy = PrefixSearch(width=2, memo_programs=1)
+        neg_tests = TestSynthesizerScanIntegers.neg_tests
+        for code in [TestSynthesizerScanIntegers.abstract_code,
+                     TestSynthesizerScanIntegers.abstract_code.replace('break', 'continue')]:
+            Synthesizer(ast.parse(dedent(code)), [], neg_tests, strategy=strategy).apply()
+        self.assertEqual({len(programs) for programs in strategy.memo.values()}, {1})
+
+        test_code = compile('assert scan_integers(["1"]) == []', '<test>', 'exec')
+        Synthesizer(ast.parse(dedent(TestSynthesizerScanIntegers.abstract_code)), [],
+                    [test_code], strategy=strategy).apply()
+        self.assertIn(test_code, strategy.memo)
+        del test_code
+        self.assertEqual(len(strategy.memo), len(neg_tests))
+
+    def test_prefix_search_pickle(self):
+        strategy = PrefixSearch(width=2)
+        self.synthesize(TestSynthesizerScanIntegers, strategy)
+        copied = pickle.loads(pickle.dumps(strategy))
+        self.assertEqual(copied.executions, strategy.executions)
+        self.assertEqual(len(copied.memo), 0)
+        self.synthesize(TestSynthesizerScanIntegers, copied)
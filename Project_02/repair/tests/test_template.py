@@ -1,4 +1,5 @@
 import ast
+import pickle
 import unittest
 from repair.synthesizer import Template
 
@@ -18,4 +19,12 @@ class TestTemplate(unittest.TestCase):
         t = Template.from_lambda('(xs: list, k: int) => len(xs) > k and xs[k - 1] is not None')
         e = t.instantiate(['elements', 'alpha'])
         self.assertEqual(ast.unparse(e),
-                         'len(elements) > alpha and elements[alpha - 1] is not None')
\ No newline at end of file
+                         'len(elements) > alpha and elements[alpha - 1] is not None')
+
+    def test_template_pickle_compiled(self):
+        t = Template.from_lambda('(xs: list, k: int) => len(xs) > k')
+        self.assertIsNotNone(t.compile())
+        copied = pickle.loads(pickle.dumps(t))
+        self.assertEqual(ast.unparse(copied.body), ast.unparse(t.body))
+        self.assertTrue(copied.compile()([1, 2], 1))
+        self.assertIsNotNone(t.function)
@@ -0,0 +1,399 @@
+import ast
+import io
+import time
+import unittest
+from textwrap import dedent
+from repair.tester import *
+
+def abs_case():
+    assert foo(-1) == 1
+
+def pos_case():
+    assert foo(2) == 2
+
+class TestAbstractProgram(unittest.TestCase):
+    abstract_code = """\
+        def foo(x):
+            if __abstract__:
+                return -x
+            return x
+    """
+
+    def setUp(self):
+        self.tree = ast.parse(dedent(self.abstract_code))
+
+    def test_run_default_values(self):
+        program = AbstractProgram(self.tree)
+        success, record = program.run(abs_case.__code__, iter([]))
+        self.assertFalse(success)
+        self.assertEqual(record.values, (False,))
+        self.assertEqual(record.envs, ({'x': -1},))
+
+    def test_run_reuse(self):
+        program = AbstractProgram(self.tree)
+        self.assertTrue(program.run(abs_case.__code__, all_true())[0])
+        self.assertFalse(program.run(pos_case.__code__, all_true())[0])
+        self.assertTrue(program.run(pos_case.__code__, iter([]))[0])
+
+    def test_tree_untouched(self):
+        source = ast.unparse(self.tree)
+        AbstractProgram(self.tree)
+        self.assertEqual(ast.unparse(self.tree), source)
+
+    def test_prepare_cached(self):
+        self.assertIs(prepare(self.tree), prepare(self.tree))
+        self.assertIsNot(prepare(self.tree), prepare(ast.parse(dedent(self.abstract_code))))
+
+    def test_exec_abstract(self):
+        success, record = exec_abstract(self.tree, abs_case.__code__, iter([True]))
+        self.assertTrue(success)
+        self.assertEqual(record.values, (True,))
+
+class TestParallelRunner(unittest.TestCase):
+    code = """\
+        def foo(x):
+            return abs(x) if x < 0 else x
+    """
+
+    wrong_code = """\
+        def foo(x):
+            return x
+    """
+
+    tests = [abs_case.__code__, pos_case.__code__]
+
+    def test_run_pass(self):
+        timings = {}
+        with ParallelRunner(2) as runner:
+            self.assertTrue(runner.run(ast.parse(dedent(self.code)), self.tests, timings=timings))
+        self.assertEqual(set(timings), {'abs_case', 'pos_case'})
+
+    def test_run_fail(self):
+        failures = []
+        self.assertFalse(run_tests_parallel(ast.parse(dedent(self.wrong_code)), self.tests,
+                                            failures=failures, workers=2))
+        self.assertEqual(failures, ['abs_case'])
+
+    def test_run_same_as_sequential(self):
+        tree = ast.parse(dedent(self.wrong_code))
+        failures, parallel_failures = [], []
+        self.assertEqual(run_tests(tree, self.tests, failures),
+                         run_tests_parallel(tree, self.tests, parallel_failures, workers=2))
+        self.assertEqual(failures, parallel_failures)
+
+    def test_run_stop_early(self):
+        failures = []
+        self.assertFalse(run_tests_parallel(ast.parse(dedent(self.wrong_code)), self.tests * 4,
+                                            failures=failures, workers=1, stop_early=True))
+        self.assertEqual(failures, ['abs_case'])
+
+class TestSnapshot(unittest.TestCase):
+    def test_default_deep_copy(self):
+        xs = [1, 2]
+        env = Snapshot().capture({'xs': xs})
+        xs.append(3)
+        self.assertEqual(env, {'xs': [1, 2]})
+
+    def test_compact(self):
+        big = list(range(10000))
+        env = CompactSnapshot(allowlist=['ys']).capture(
+            {'i': 1, 's': 'a', 't': (1, None), 'xs': big, 'ys': [1]})
+        self.assertEqual(env['i'], 1)
+        self.assertEqual(env['t'], (1, None))
+        self.assertEqual(env['ys'], [1])
+        self.assertIsInstance(env['xs'], Summary)
+        self.assertEqual(len(env['xs']), 10000)
+        self.assertEqual(env['xs'], Summary(list(range(10000))))
+        self.assertNotEqual(env['xs'], Summary(list(range(10001))))
+
+    def test_summary_bounded(self):
+        class Item:
+            reprs = 0
+            def __repr__(self):
+                Item.reprs += 1
+                return 'Item()'
+
+        summary = Summary({'items': [Item() for _ in range(10000)], 'ids': set(range(10000))})
+        self.assertLessEqual(Item.reprs, 16)
+        self.assertEqual(summary, Summary({'items': [Item()] * 10000, 'ids': set(range(10000))}))
+        self.assertNotEqual(Summary('a' * 10000), Summary('b' * 10000))
+
+    def test_compact_record(self):
+        tree = ast.parse(dedent("""\
+            def foo(x):
+                xs = list(range(1000))
+                if __abstract__:
+                    return -x
+                return x
+        """))
+        success, record = AbstractProgram(tree).run(abs_case.__code__, iter([True]),
+                                                    CompactSnapshot())
+        self.assertTrue(success)
+        self.assertEqual(record.envs[0]['x'], -1)
+        self.assertIsInstance(record.envs[0]['xs'], Summary)
+
+class TestRecord(unittest.TestCase):
+    values = [True, False, False, True, True, False, True, False, True]
+    envs = [{'x': i, 'y': str(i)} if i % 3 else {'y': None, 'x': i} for i in range(9)]
+
+    def test_views(self):
+        record = Record(self.values, self.envs)
+        self.assertEqual(len(record), 9)
+        self.assertEqual(record.values, tuple(self.values))
+        self.assertEqual(record.envs, tuple(self.envs))
+        self.assertEqual([list(env) for env in record.envs], [list(env) for env in self.envs])
+
+    def test_views_read_only(self):
+        record = Record(self.values, self.envs)
+        self.assertIs(record.values, record.values)
+        self.assertIs(record.envs, record.envs)
+        with self.assertRaises(AttributeError):
+            record.values.append(True)
+        record.append(False, {'x': 9})
+        self.assertEqual(record.values, tuple(self.values) + (False,))
+        self.assertEqual(record.envs[-1], {'x': 9})
+
+    def test_merge_in_place(self):
+        record = Record(self.values[:3], self.envs[:3])
+        other = Record(self.values[3:] + [False], self.envs[3:] + [{'z': []}])
+        merged = record + other
+        self.assertEqual(merged.values, tuple(self.values + [False]))
+        self.assertEqual(merged.envs, tuple(self.envs + [{'z': []}]))
+        self.assertEqual(len(record), 3)
+
+        before = record
+        record += other
+        self.assertIs(record, before)
+        self.assertEqual(record.values, merged.values)
+        self.assertEqual(record.envs, merged.envs)
+
+    def test_dump_load(self):
+        record = Record(self.values + [False], self.envs + [{'z': None}])
+        fp = io.BytesIO()
+        record.dump(fp)
+        fp.seek(0)
+        loaded = Record.load(fp)
+        self.assertEqual(loaded.values, record.values)
+        self.assertEqual(loaded.envs, record.envs)
+        loaded.append(True, {'x': 0})
+        self.assertEqual(loaded.envs[-1], {'x': 0})
+
+def loop_case():
+    assert foo(1) == 1
+
+class TestLimits(unittest.TestCase):
+    looping_code = """\
+        def foo(x):
+            while __abstract__:
+                pass
+            return x
+    """
+
+    def setUp(self):
+        self.tree = ast.parse(dedent(self.looping_code))
+
+    def test_max_values(self):
+        success, record = exec_abstract(self.tree, loop_case.__code__, all_true(),
+                                        limits=Limits(max_values=100))
+        self.assertFalse(success)
+        self.assertEqual(len(record), 100)
+
+    def test_max_lines(self):
+        success, _ = exec_abstract(self.tree, loop_case.__code__, all_true(),
+                                   limits=Limits(max_lines=1000))
+        self.assertFalse(success)
+
+    def test_timeout(self):
+        success, _ = exec_abstract(self.tree, loop_case.__code__, all_true(),
+                                   limits=Limits(timeout=0.1))
+        self.assertFalse(success)
+
+    def test_within_limits(self):
+        limits = Limits(timeout=10, max_values=10, max_lines=1000)
+        success, record = exec_abstract(self.tree, loop_case.__code__, iter([True, False]),
+                                        limits=limits)
+        self.assertTrue(success)
+        self.assertEqual(record.values, (True, False))
+
+    def test_timeout_few_slow_lines(self):
+        tree = ast.parse(dedent("""\
+            import time
+            def foo(x):
+                for _ in range(100):
+                    time.sleep(0.01)
+                return x
+        """))
+        start = time.monotonic()
+        self.assertFalse(run_tests(tree, [loop_case.__code__], limits=Limits(timeout=0.1)))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_module_level(self):
+        tree = ast.parse(dedent("""\
+            while True:
+                pass
+            def foo(x):
+                return x
+        """))
+        limits = Limits(timeout=0.1)
+        failures = []
+        self.assertFalse(run_tests(tree, [loop_case.__code__], failures, limits=limits))
+        self.assertEqual(failures, ['loop_case'])
+        self.assertFalse(ValidationScheduler([loop_case.__code__], limits=limits).run(tree))
+        self.assertFalse(run_tests_parallel(tree, [loop_case.__code__], workers=1,
+                                            limits=limits))
+
+    def test_not_caught_by_program(self):
+        tree = ast.parse(dedent("""\
+            def foo(x):
+                while True:
+                    try:
+                        while True:
+                            pass
+                    except Exception:
+                        return x
+        """))
+        self.assertFalse(run_tests(tree, [loop_case.__code__], limits=Limits(max_lines=1000)))
+
+    def test_timeout_bare_except(self):
+        tree = ast.parse(dedent("""\
+            def foo(x):
+                try:
+                    while True:
+                        pass
+                except:
+                    pass
+                while True:
+                    pass
+        """))
+        start = time.monotonic()
+        self.assertFalse(run_tests(tree, [loop_case.__code__], limits=Limits(timeout=0.1)))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_timeout_sleep(self):
+        tree = ast.parse(dedent("""\
+            import time
+            def foo(x):
+                time.sleep(10)
+                return x
+        """))
+        start = time.monotonic()
+        self.assertFalse(run_tests(tree, [loop_case.__code__], limits=Limits(timeout=0.1)))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_timeout_disarmed(self):
+        limits = Limits(timeout=0.05)
+        with limits.enforce():
+            pass
+        time.sleep(0.1)  # no alarm left behind
+
+    def test_timeout_nested(self):
+        outer, inner = Limits(timeout=0.2), Limits(timeout=10)
+        start = time.monotonic()
+        with self.assertRaises(LimitExceeded):
+            with outer.enforce():
+                with inner.enforce():
+                    pass
+                while True:
+                    pass
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_parallel(self):
+        tree = ast.parse(dedent("""\
+            def foo(x):
+                while True:
+                    pass
+        """))
+        failures = []
+        self.assertFalse(run_tests_parallel(tree, [loop_case.__code__], failures=failures,
+                                            workers=1, limits=Limits(timeout=0.1)))
+        self.assertEqual(failures, ['loop_case'])
+
+def neg_case():
+    assert foo(-2) == 2
+
+class TestValidationScheduler(unittest.TestCase):
+    code = """\
+        def foo(x):
+            if x < 0:
+                x = x
+            return x
+    """
+
+    fixed_code = """\
+        def foo(x):
+            if x < 0:
+                x = -x
+            return x
+    """
+
+    tests = [pos_case.__code__, abs_case.__code__, neg_case.__code__]
+
+    def setUp(self):
+        self.tree = ast.parse(dedent(self.code))
+        self.coverage = Coverage(self.tree, self.tests)
+
+    def test_coverage(self):
+        self.assertTrue(self.coverage.passed[pos_case.__code__])
+        self.assertFalse(self.coverage.passed[abs_case.__code__])
+        self.assertFalse(self.coverage.covers(pos_case.__code__, 3))
+        self.assertTrue(self.coverage.covers(pos_case.__code__, 2))
+        self.assertTrue(self.coverage.covers(abs_case.__code__, 3))
+        self.assertTrue(self.coverage.covers(loop_case.__code__, 3))  # unknown test
+
+    def test_coverage_span(self):
+        self.assertTrue(self.coverage.covers(pos_case.__code__, 1))  # module level
+
+    def test_failure_order(self):
+        scheduler = ValidationScheduler(self.tests)
+        self.assertFalse(scheduler.run(self.tree))
+        self.assertEqual(scheduler.executions, 2)  # stopped at abs_case
+        self.assertEqual(scheduler.order()[0], 1)
+        self.assertFalse(scheduler.run(self.tree))
+        self.assertEqual(scheduler.executions, 3)
+
+    def test_reuse_passes(self):
+        scheduler = ValidationScheduler(self.tests, self.coverage)
+        self.assertTrue(scheduler.run(ast.parse(dedent(self.fixed_code)), 3))
+        self.assertEqual(scheduler.reused, 1)
+        self.assertEqual(scheduler.executions, 2)
+
+    def test_reuse_failures(self):
+        scheduler = ValidationScheduler(self.tests, self.coverage)
+        tree = ast.parse(dedent(self.fixed_code))
+        self.assertFalse(scheduler.run(tree, 99))  # not executed by the failing tests
+        self.assertEqual(scheduler.executions, 0)
+
+class TestCoverageSelection(unittest.TestCase):
+    code = """\
+        def foo(x):
+            if x < 0:
+                return x
+            return x
+    """
+
+    tests = [pos_case.__code__, abs_case.__code__, pos_case.__code__.replace(co_name='pos_2')]
+
+    def test_select(self):
+        coverage = Coverage(ast.parse(dedent(self.code)), self.tests)
+        self.assertEqual(coverage.select(self.tests, 3), [abs_case.__code__])
+        self.assertEqual(coverage.select(self.tests, 2), self.tests)
+
+    def test_module_fails(self):
+        for code, limits in [('import no_such_module\n', None),
+                             ('while True:\n    pass\n', Limits(timeout=0.1)),
+                             ('while True:\n    pass\n', Limits(max_lines=1000))]:
+            with self.subTest(code=code, limits=limits):
+                tree = ast.parse(code + dedent(self.code))
+                coverage = Coverage(tree, self.tests, limits=limits)
+                self.assertEqual(coverage.passed, dict.fromkeys(self.tests, False))
+                self.assertFalse(any(coverage.covers(t, 4) for t in self.tests))
+                self.assertEqual(coverage.select(self.tests, 4), self.tests)
+
+    def test_select_sample(self):
+        coverage = Coverage(ast.parse(dedent(self.code)), self.tests, sample=1)
+        selected = coverage.select(self.tests, 3)
+        self.assertEqual(len(selected), 2)
+        self.assertIn(abs_case.__code__, selected)
+        self.assertEqual(selected, coverage.select(self.tests, 3))
+        self.assertEqual(Coverage(ast.parse(dedent(self.code)), self.tests, sample=5)
+                         .select(self.tests, 3), self.tests)
@@ -0,0 +1,132 @@
+import ast
+import inspect
+import os
+import tempfile
+import unittest
+from textwrap import dedent
+from repair.benchmarks import char_index, char_index_tests
+from repair.benchmarks.utils import *
+from repair.repairer import Repairer
+from repair.synthesizer import FlipSearch
+
+class TestSuiteLoader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.write('a_tests.py', """\
+            def test_2():
+                \"\"\"+\"\"\"
+                assert foo(2) == 2
+
+            def helper():
+                pass
+
+            def test_1():
+                \"\"\"-\"\"\"
+                assert foo(-1) == 1
+        """)
+        self.write('b_tests.py', """\
+            def test_3():
+                \"\"\"+\"\"\"
+                assert foo(3) == 3
+        """)
+        self.write('notes.txt', 'def test_4(): pass')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, source: str, mtime: int = None) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as fp:
+            fp.write(dedent(source))
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+        return path
+
+    def test_module_same_as_functions(self):
+        pos_tests, neg_tests = SuiteLoader().load(char_index_tests)
+        functions = all_test_functions(char_index_tests)
+        self.assertEqual(pos_tests, [t.__code__ for t in functions if t.__doc__ == '+'])
+        self.assertEqual(neg_tests, [t.__code__ for t in functions if t.__doc__ == '-'])
+        self.assertEqual(get_positive_tests(char_index_tests), pos_tests)
+
+    def test_module_cached(self):
+        loader = SuiteLoader()
+        loader.load(char_index_tests)
+        loader.load(char_index_tests)
+        self.assertEqual((loader.hits, loader.misses), (1, 1))
+
+    def test_directory(self):
+        tests = list(SuiteLoader().stream(self.directory.name))
+        self.assertEqual([(sign, t.co_name) for sign, t in tests],
+                         [('+', 'test_2'), ('-', 'test_1'), ('+', 'test_3')])
+        env = {'foo': abs}
+        for _, test_code in tests:
+            exec(test_code, env)
+
+    def test_stream_lazy(self):
+        loader = SuiteLoader()
+        stream = loader.stream(self.directory.name)
+        next(stream)
+        self.assertEqual(loader.misses, 1)  # only the first file is compiled
+
+    def test_mtime(self):
+        loader = SuiteLoader()
+        path = os.path.join(self.directory.name, 'b_tests.py')
+        loader.load(path)
+        loader.load(path)
+        self.assertEqual((loader.hits, loader.misses), (1, 1))
+
+        self.write('b_tests.py', """\
+            def test_5():
+                \"\"\"-\"\"\"
+                assert foo(5) == 5
+        """, mtime=os.stat(path).st_mtime_ns + 10 ** 9)
+        self.assertEqual([t.co_name for t in loader.load(path)[1]], ['test_5'])
+        self.assertEqual(loader.misses, 2)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = SuiteLoader(cache_dir).load(self.directory.name)
+            loader = SuiteLoader(cache_dir)
+            self.assertEqual(loader.load(self.directory.name), first)
+            self.assertEqual((loader.hits, loader.misses), (2, 0))
+
+class TestStreamedTests(unittest.TestCase):
+    def setUp(self):
+        self.tests = list(SuiteLoader().stream(char_index_tests))
+        self.pulled = 0
+
+    def stream(self):
+        for test in self.tests:
+            self.pulled += 1
+            yield test
+
+    def test_split(self):
+        passing, failing = StreamedTests.split(self.stream())
+        first = next(iter(failing))
+        self.assertEqual(first, next(t for sign, t in self.tests if sign == '-'))
+        self.assertLess(self.pulled, len(self.tests))
+        self.assertEqual(list(passing), [t for sign, t in self.tests if sign == '+'])
+        self.assertEqual(len(failing), len(self.tests) - len(passing))
+        self.assertEqual(self.pulled, len(self.tests))
+        self.assertEqual(passing + failing, passing[:] + failing[:])
+        self.assertEqual([] + failing, list(failing))
+
+    def test_repair_before_discovery_ends(self):
+        pulled = []
+
+        class Recording(FlipSearch):
+            def search(search, synthesizer, program, test_code):
+                pulled.append(self.pulled)
+                return super().search(synthesizer, program, test_code)
+
+        tree = ast.parse(inspect.getsource(char_index))
+        passing, failing = StreamedTests.split(self.stream())
+        r = Repairer(tree, 9, passing, failing, strategy=Recording())
+        self.assertTrue(r.repair())
+        self.assertLess(pulled[0], len(self.tests))
+
+        expected = Repairer(tree, 9, *SuiteLoader().load(char_index_tests))
+        self.assertTrue(expected.repair())
+        self.assertEqual(ast.unparse(r.new_tree), ast.unparse(expected.new_tree))
+        self.assertTrue(r.validate())
@@ -0,0 +1,69 @@
+import ast
+import random
+import unittest
+from repair import vectorize
+from repair.synthesizer import ConstraintTable, Synthesizer, Template, TemplateLibrary
+from repair.tester import Record
+
+@unittest.skipUnless(vectorize.available(), 'NumPy is not installed')
+class TestVectorize(unittest.TestCase):
+    def array_function(self, template: str):
+        t = Template.from_lambda(template)
+        return vectorize.compile_array_function(t.args, t.body)
+
+    def test_supported(self):
+        for template in ['a: int, b: int => a < b',
+                         'a: int, b: int => a + 1 >= b and not a == 0',
+                         'a: float => -a * 2 != 3.5 or a > 0']:
+            with self.subTest(template):
+                self.assertIsNotNone(self.array_function(template))
+
+    def test_unsupported(self):
+        for template in ['(lst: list, k: int) => len(lst) == k',
+                         'a: int, b: int => 0 < a < b',
+                         'a: int, b: int => a // b > 0',
+                         'a: int, b: int => a * a * b > 0',
+                         'a: int, b: int => a and b']:
+            with self.subTest(template):
+                self.assertIsNone(self.array_function(template))
+
+    def test_same_as_scalar(self):
+        rng = random.Random(0)
+        templates = [Template.from_lambda(t) for t in
+                     ['a: int, b: int => a < b', 'a: int, b: int => a + 3 == b',
+                      'a: int, b: int => a * 2 >= b and b != 0', 'a: int => not a > 4',
+                      'a: int, b: int => a - b < 0 or a == 7']]
+        for _ in range(200):
+            envs = [{'x': rng.randint(-5, 10), 'y': rng.randint(-5, 10), 'b': rng.random() < 0.5}
+                    for _ in range(rng.randint(1, 6))]
+            t = rng.choice(templates)
+            f = t.compile()
+            values = [bool(f(*[env[x] for x in ['x', 'y'][:len(t.args)]])) for env in envs]
+            if rng.random() < 0.3:
+                values[rng.randrange(len(values))] ^= True
+            constraints = Record(values, envs)
+            scalar = TemplateLibrary(templates).solve(constraints, ConstraintTable(constraints),
+                                                      Synthesizer(None, [], []).sat)
+            library = TemplateLibrary(templates, vectorize=True)
+            vector = library.solve(constraints, ConstraintTable(constraints),
+                                   Synthesizer(None, [], []).sat)
+            self.assertEqual(scalar and ast.unparse(scalar), vector and ast.unparse(vector))
+
+    def test_non_numeric_falls_back(self):
+        constraints = Record([True, False, True], [{'s': 'a', 'n': 1}, {'s': None, 'n': 1},
+                                                   {'s': 'b', 'n': 2}])
+        library = TemplateLibrary([Template.from_lambda('a: int, b: int => a > b - 2')],
+                                  vectorize=True)
+        expression = library.solve(constraints, ConstraintTable(constraints),
+                                   Synthesizer(None, [], []).sat)
+        self.assertIsNone(expression)
+        self.assertEqual(library.array_checked, 0)
+
+    def test_many_constraints(self):
+        envs = [{'i': i, 'n': 1000} for i in range(20000)]
+        constraints = Record([env['i'] * 2 >= env['n'] for env in envs], envs)
+        templates = [Template.from_lambda(f'a: int, b: int => a + {c} < b') for c in range(200)]
+        templates.append(Template.from_lambda('a: int, b: int => a * 2 >= b'))
+        synthesizer = Synthesizer(None, [], [], extra_templates=templates, vectorize=True)
+        self.assertTrue(synthesizer.solve(constraints))
+        self.assertEqual(ast.unparse(synthesizer.condition), 'i * 2 >= n')
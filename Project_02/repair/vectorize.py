@@ -0,0 +1,129 @@
+import ast
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional backend
+    np = None
+
+# operators evaluated elementwise with the same results on arrays as on Python scalars
+# (division and modulo differ on zero divisors, so they are left to the scalar path)
+ARRAY_OPS = (ast.Add, ast.Sub, ast.Mult, ast.USub, ast.UAdd,
+             ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+INT_BOUND = 2 ** 31  # ints beyond cannot be multiplied once in int64 without overflow
+
+def available() -> bool:
+    return np is not None
+
+class ArrayBody(ast.NodeTransformer):
+    """Rewrite boolean connectives of comparisons into elementwise array operators:
+    `a and b` => `a & b`, `a or b` => `a | b`, `not a` => `~a`.
+    `supported` is `False` if the body contains anything else that arrays cannot evaluate."""
+    def __init__(self, args: List[str]) -> None:
+        super().__init__()
+        self.args = args
+        self.supported = True
+        self.mults = 0
+
+    @staticmethod
+    def is_boolean(node: ast.expr) -> bool:
+        """Is `node` a comparison or a (rewritten) connective of comparisons?
+        `&`, `|` and `~` are unsupported in bodies, so they can only come from rewriting."""
+        return (isinstance(node, ast.Compare)
+                or isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr))
+                or isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert))
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.expr:
+        self.generic_visit(node)
+        if not all(self.is_boolean(v) for v in node.values):
+            self.supported = False
+            return node
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(result, op, value)
+        return result
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            if not self.is_boolean(node.operand):
+                self.supported = False
+            return ast.UnaryOp(ast.Invert(), node.operand)
+        if not isinstance(node.op, ARRAY_OPS):
+            self.supported = False
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        self.generic_visit(node)
+        if not isinstance(node.op, ARRAY_OPS):
+            self.supported = False
+        if isinstance(node.op, ast.Mult):
+            self.mults += 1
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        self.generic_visit(node)
+        if len(node.ops) != 1 or not isinstance(node.ops[0], ARRAY_OPS):
+            self.supported = False
+        return node
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        if node.id not in self.args:
+            self.supported = False
+        return node
+
+    def visit_Constant(self, node: ast.Constant) -> ast.expr:
+        value = node.value
+        if type(value) not in (bool, int, float) or type(value) is int and abs(value) >= INT_BOUND:
+            self.supported = False
+        return node
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        if not isinstance(node, (ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Compare, ast.Name,
+                                 ast.Constant, ast.Load, ast.boolop, ast.unaryop, ast.operator,
+                                 ast.cmpop)):
+            self.supported = False
+            return node
+        return super().generic_visit(node)
+
+def compile_array_function(args: List[str], body: ast.expr) -> Optional[Callable[..., Any]]:
+    """Compile a template body to a function over arrays, `None` if it cannot be vectorized."""
+    transformer = ArrayBody(args)
+    body = transformer.visit(ast.parse(ast.unparse(body), mode='eval').body)
+    if not transformer.supported or transformer.mults > 1:
+        return None
+    source = f'lambda {", ".join(args)}: {ast.unparse(body)}'
+    return eval(compile(source, '<vectorized template>', 'eval'), {'__builtins__': {}})
+
+class NumericColumns:
+    """Record columns as NumPy arrays, for the variables whose values are all ints (or bools)
+    within `INT_BOUND`, or all floats."""
+    def __init__(self, columns: Dict[str, List[Any]], values: List[bool]) -> None:
+        self.columns = columns
+        self.expected = np.array(values, dtype=bool)
+        self.arrays: Dict[str, Optional['np.ndarray']] = {}
+
+    def array(self, x: str) -> Optional['np.ndarray']:
+        if x not in self.arrays:
+            column = self.columns[x]
+            if all(type(v) in (bool, int) and abs(v) < INT_BOUND for v in column):
+                self.arrays[x] = np.array(column, dtype=np.int64)
+            elif all(type(v) is float for v in column):
+                self.arrays[x] = np.array(column, dtype=np.float64)
+            else:
+                self.arrays[x] = None
+        return self.arrays[x]
+
+    def first_violation(self, function: Callable[..., Any], binding: List[str]) -> Optional[int]:
+        """The first constraint violated by `function` over the columns of `binding`;
+        -1 if none is, `None` if the columns cannot be vectorized."""
+        arrays = [self.array(x) for x in binding]
+        if any(a is None for a in arrays):
+            return None
+
+        with np.errstate(all='ignore'):
+            actual = np.broadcast_to(function(*arrays), self.expected.shape)
+        violations = np.flatnonzero(actual != self.expected)
+        return int(violations[0]) if len(violations) else -1